@@ -0,0 +1,69 @@
+# BENCH DECODESTAMP - Compare the ways of decoding trip timestamps - Python
+#
+# Checks that the calendar-table decodestamp and the array version give
+# exactly the results of the original datetime version, then reports the
+# throughput of each in stamps per second:
+#     datetime - illume.decodestampDatetime, the original
+#     calendar - illume.decodestamp, with the per-day calendar table
+#     array - timearray.decodestampArray, the whole array at once
+#     array int - same, from an int64 array (as read from a trip store)
+#
+# Command use:
+#
+#     python bench/bench_decodestamp.py [count]
+
+import os
+import sys
+import time
+import random
+
+import numpy as np
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import timearray
+
+from bench_waypoints import timeIt
+
+def benchDecodestamp( count, seed=136 ):
+    rand = random.Random( seed )
+    # Porto data runs from July 2013 to June 2014; stamps are text in the CSV
+    stamps = [ str( rand.randrange( 1372636800, 1404172800 )) for ix in range( count ) ]
+
+    # Exact agreement
+    wanted = [ illume.decodestampDatetime( stamp ) for stamp in stamps ]
+    if [ illume.decodestamp( stamp ) for stamp in stamps ] != wanted:
+        raise Exception( "decodestamp differs from decodestampDatetime" )
+    arrays = timearray.decodestampArray( stamps )
+    got = list( zip( stamps, *( array.tolist() for array in arrays )))
+    if got != wanted:
+        raise Exception( "decodestampArray differs from decodestampDatetime" )
+
+    def datetimes():
+        for stamp in stamps:
+            illume.decodestampDatetime( stamp )
+
+    def calendars():
+        for stamp in stamps:
+            illume.decodestamp( stamp )
+
+    def array():
+        timearray.decodestampArray( stamps )
+
+    numbers = np.array( stamps, dtype=np.int64 )
+    def arrayInt():
+        timearray.decodestampArray( numbers )
+
+    print( "Stamps: {:d}, all results match".format( count ))
+    baseline = None
+    for (name, work) in [ ('datetime', datetimes), ('calendar', calendars), ('array', array),
+                          ('array int', arrayInt) ]:
+        spent = timeIt( work )
+        baseline = baseline or spent
+        print( '{:>9s}: {:7.3f} s {:12,.0f} stamps/s {:6.1f}x'.format(
+                name, spent, count/spent, baseline/spent ))
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    benchDecodestamp( int( args[0] ) if args else 200000 )
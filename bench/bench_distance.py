@@ -0,0 +1,85 @@
+# BENCH DISTANCE - Accuracy and speed of the distance modes - Python
+#
+# Parses the same POLYLINE texts with each of illume.DistanceModes and
+# reports, for each mode:
+#     points/s - parseWaypoints throughput
+#     error vs haversine - over all segments: largest error in metres,
+#         largest and mean error relative to the haversine distance
+#     error vs precise - same, relative to geodist (the default mode)
+#     drive error - largest relative error of whole-trip drive distances
+#         against haversine
+#
+# Also checks the documented bound of the city mode: for segments with
+# both ends inside CityBox, citydist is within CityMaxError of geodist.
+# Exits with status 1 if the bound is broken.
+#
+# Command use:
+#
+#     python bench/bench_distance.py [train.csv] [trips]
+#
+# With no file name, a set of random-walk trips around Porto is made up.
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+
+from bench_waypoints import loadPolylines, makePolylines, timeIt
+
+def benchDistance( texts ):
+    segments = { }
+    drives = { }
+    print( "Trips: {:d}".format( len(texts) ))
+    for mode in illume.DistanceModes:
+        parsed = [ ]
+        spent = timeIt( lambda: parsed.append(
+                [ illume.parseWaypoints( text, mode ) for text in texts ] ))
+        trips = parsed[-1]
+        segments[mode] = np.array( [ point[2] for trip in trips for point in trip ])
+        drives[mode] = np.array( [ sum( point[2] for point in trip ) for trip in trips ])
+        if mode == 'precise':
+            trips = parsed[-1]
+            lon = np.array( [ point[0] for trip in trips for point in trip ])
+            lat = np.array( [ point[1] for trip in trips for point in trip ])
+            # a segment is inside the box if both of its ends are
+            inBox = ((lon >= illume.CityBox[0]) & (lon <= illume.CityBox[2])
+                     & (lat >= illume.CityBox[1]) & (lat <= illume.CityBox[3]))
+            inBox[1:] &= inBox[:-1]
+        print( "{:>10s}: {:12,.0f} points/s".format( mode, len(segments[mode])/spent ))
+
+    truth = segments['haversine']
+    moving = truth > 0
+    print( "{:>10s}  {:>24s}  {:>24s}  {:>10s}".format(
+            '', 'vs haversine (max m, max, mean)', 'vs precise (max, mean)', 'drive max' ))
+    for mode in illume.DistanceModes:
+        error = np.abs( segments[mode] - truth )
+        relHaver = error[moving] / truth[moving]
+        relPrecise = (np.abs( segments[mode] - segments['precise'] )[moving]
+                      / segments['precise'][moving])
+        driveTruth = drives['haversine'] > 0
+        relDrive = (np.abs( drives[mode] - drives['haversine'] )[driveTruth]
+                    / drives['haversine'][driveTruth])
+        print( "{:>10s}  {:8.3f} m {:8.4%} {:8.4%}  {:12.4%} {:10.4%}  {:10.4%}".format(
+                mode, error.max( initial=0 ), relHaver.max( initial=0 ), relHaver.mean(),
+                relPrecise.max( initial=0 ), relPrecise.mean(), relDrive.max( initial=0 )))
+
+    check = moving & inBox
+    worst = (np.abs( segments['city'] - segments['precise'] )[check]
+             / segments['precise'][check]).max( initial=0 )
+    happy = worst <= illume.CityMaxError
+    print( "City mode in CityBox: worst {:.4%}, bound {:.4%} - {:s}".format(
+            worst, illume.CityMaxError, "ok" if happy else "FAIL" ))
+    return happy
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    limit = int( args[1] ) if len(args) >= 2 else 20000
+    if args:
+        texts = loadPolylines( args[0], limit )
+    else:
+        texts = makePolylines( limit )
+    sys.exit( 0 if benchDistance( texts ) else 1 )
@@ -0,0 +1,102 @@
+# BENCH FORMATS - Size and load time of prepare's output formats - Python
+#
+# Runs prepare over a data file in each output format of writers.py that
+# can be written here (parquet only if pyarrow is installed), then for each
+# output reports:
+#     size - bytes on disk, and bytes per row
+#     load - time to load every column as numbers:
+#         csv - csv module, each column converted to a numpy array
+#         npy - memory-mapped, then every column read through once
+#         npz, parquet - writers.loadColumns
+# and checks that the columnar outputs have the same rows as the CSV.
+#
+# Command use:
+#
+#     python bench/bench_formats.py [train.csv]
+#
+# With no file name, a synthetic data file of 20000 trips is made with
+# synthtrips.py.
+
+import os
+import sys
+import csv
+import tempfile
+import contextlib
+
+import numpy as np
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import writers
+import synthtrips
+
+from bench_waypoints import timeIt
+
+def loadCsv( fileName ):
+    with open( fileName, 'r' ) as source:
+        table = csv.reader( source )
+        labels = next( table )
+        fields = list( zip( *table ))
+    columns = { }
+    for (label, field) in zip( labels, fields ):
+        if label in writers.Categories:
+            columns[label] = np.array( [ writers._code( label, atom ) for atom in field ], np.int8 )
+        else:
+            columns[label] = np.array( [ float( atom ) if atom else -1 for atom in field ])
+    return columns
+
+def loadNumbers( fileName ):
+    columns = writers.loadColumns( fileName )
+    for column in columns.values():
+        column.sum()
+    return columns
+
+def sizeOf( fileName ):
+    if os.path.isdir( fileName ):
+        return sum( os.path.getsize( os.path.join( fileName, name ))
+                    for name in os.listdir( fileName ))
+    return os.path.getsize( fileName )
+
+def benchFormats( fileName, work ):
+    formats = [ 'csv', 'npy', 'npz' ]
+    try:
+        import pyarrow
+        formats.append( 'parquet' )
+    except ImportError:
+        print( "pyarrow is not installed, so parquet is left out" )
+    outputs = { }
+    for format in formats:
+        outputs[format] = os.path.join( work, 'prepared.' + format )
+        with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+            illume.prepare( fileName, outputs[format], format=format, checkpointEvery=0 )
+    reference = loadCsv( outputs['csv'] )
+    rows = len(reference['TRIP_ID'])
+    same = True
+    print( "Rows: {:d}".format( rows ))
+    print( "{:>8s} {:>12s} {:>10s} {:>10s}".format( 'format', 'bytes', 'bytes/row', 'load s' ))
+    for format in formats:
+        load = loadCsv if format == 'csv' else loadNumbers
+        spent = timeIt( lambda: load( outputs[format] ))
+        size = sizeOf( outputs[format] )
+        print( "{:>8s} {:12,d} {:10.1f} {:10.4f}".format( format, size, size/rows, spent ))
+        if format != 'csv':
+            columns = writers.loadColumns( outputs[format] )
+            for label in illume.PrepareLabels:
+                # float32 coordinates; the CSV rounds some other columns
+                near = 2e-6 if label[:4] in ( 'LON_', 'LAT_' ) else 0.51
+                if not np.allclose( columns[label], reference[label], rtol=0, atol=near ):
+                    print( "    {:s} differs from the CSV".format( label ))
+                    same = False
+    print( "Same rows: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    work = tempfile.mkdtemp()
+    if args:
+        fileName = args[0]
+    else:
+        fileName = os.path.join( work, 'trips.csv' )
+        synthtrips.writeTrips( fileName, 20000 )
+    sys.exit( 0 if benchFormats( fileName, work ) else 1 )
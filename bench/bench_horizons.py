@@ -0,0 +1,66 @@
+# BENCH HORIZONS - Rows/s of snapshots.Horizons as lags and features grow - Python
+#
+# Makes the snapshot rows of the good trips of a set with:
+#     prepare - illume.snapshotLines, prepare's three lags
+#     horizons - snapshots.Horizons.snapshotLines, with 3, 6, 12 and 24
+#         lags, without and with all the features
+# and reports the rows/s and the time per lag point of each, and checks
+# that Horizons() gives the same rows as prepare.
+#
+# Command use:
+#
+#     python bench/bench_horizons.py [train.csv] [trips]
+#
+# With no file name, a set of random-walk trips around Porto is made up.
+
+import os
+import sys
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import snapshots
+
+from bench_waypoints import loadPolylines, makePolylines, timeIt
+
+def benchHorizons( texts, wpFreq=10, wpStep=10 ):
+    trips = [ ]
+    errors = illume.ParseErrors()
+    for (ix, text) in enumerate( texts ):
+        line = [ str(ix), 'B', '', '', str(20000000+ix), str(1372636858+97*ix),
+                 'A', 'False', text ]
+        waypoints = illume.tokenizeWaypoints( text, errors=errors, recordId=ix )
+        judged = illume.judgeWaypoints( line, waypoints )
+        if judged[0] == 0:
+            trips.append( (line, waypoints, ix+1) + judged[1:] )
+
+    def rowsOf( snapshotLines ):
+        rows = [ ]
+        for trip in trips:
+            rows.extend( snapshotLines( *trip, wpFreq, wpStep ))
+        return rows
+
+    reference = rowsOf( illume.snapshotLines )
+    same = rowsOf( snapshots.Horizons().snapshotLines ) == reference
+    count = len(reference)
+    print( "Good trips: {:d}, rows: {:d}".format( len(trips), count ))
+    print( "{:>10s} {:>5s} {:>9s} {:>12s} {:>14s}".format(
+            'engine', 'lags', 'features', 'rows/s', 'us/lag point' ))
+    spent = timeIt( lambda: rowsOf( illume.snapshotLines ))
+    print( "{:>10s} {:5d} {:>9s} {:12,.0f} {:14.3f}".format(
+            'prepare', 3, 'no', count/spent, 1e6*spent/count/4 ))
+    for lags in ( 3, 6, 12, 24 ):
+        for features in ( (), snapshots.Features ):
+            horizons = snapshots.Horizons( lags, features=features )
+            spent = timeIt( lambda: rowsOf( horizons.snapshotLines ))
+            print( "{:>10s} {:5d} {:>9s} {:12,.0f} {:14.3f}".format(
+                    'horizons', lags, 'all' if features else 'no', count/spent,
+                    1e6*spent/count/(lags+1) ))
+    print( "Same rows as prepare: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    limit = int( args[1] ) if len(args) >= 2 else 20000
+    texts = loadPolylines( args[0], limit ) if args else makePolylines( limit )
+    sys.exit( 0 if benchHorizons( texts ) else 1 )
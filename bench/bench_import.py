@@ -0,0 +1,59 @@
+# BENCH IMPORT - Check the import time of illume against a budget - Python
+#
+# Imports illume in fresh interpreters with no display (DISPLAY unset) and
+# reports the best time of the import itself, not counting interpreter
+# start-up. Fails (exit status 1) if the import fails, takes longer than
+# the budget, or loads tkinter, which should only be loaded by chooseFile.
+#
+# Command use:
+#
+#     python bench/bench_import.py [budget-ms] [repeat]
+
+import os
+import sys
+import json
+import subprocess
+
+SRC = os.path.join( os.path.dirname( os.path.abspath( __file__ )), '..', 'src' )
+
+Probe = """
+import sys, time, json
+sys.path.insert( 0, {src!r} )
+began = time.perf_counter()
+import illume
+spent = time.perf_counter() - began
+print( json.dumps( {{ 'seconds': spent, 'tkinter': 'tkinter' in sys.modules }} ))
+"""
+
+# IMPORT TIME - Best time to import illume over 'repeat' fresh interpreters
+#
+# Result:
+#    Tuple of the best time in seconds, and True if tkinter was loaded
+
+def importTime( repeat=5 ):
+    env = dict( os.environ )
+    env.pop( 'DISPLAY', None )
+    best = None
+    tkinter = False
+    for ix in range( repeat ):
+        child = subprocess.run( [ sys.executable, '-c', Probe.format( src=SRC ) ],
+                capture_output=True, text=True, env=env, check=True )
+        probe = json.loads( child.stdout )
+        best = probe['seconds'] if best is None else min( best, probe['seconds'] )
+        tkinter = tkinter or probe['tkinter']
+    return best, tkinter
+
+if __name__ == "__main__":
+    budget = float( sys.argv[1] ) if len(sys.argv) > 1 else 100
+    repeat = int( sys.argv[2] ) if len(sys.argv) > 2 else 5
+    try:
+        (spent, tkinter) = importTime( repeat )
+    except subprocess.CalledProcessError as error:
+        print( "Import failed:", error.stderr.strip().splitlines()[-1:] )
+        sys.exit( 1 )
+    print( "import illume: {:.1f} ms (budget {:.0f} ms)".format( spent*1000, budget ))
+    if tkinter:
+        print( "FAIL: tkinter loaded at import time" )
+    if spent*1000 > budget:
+        print( "FAIL: over budget" )
+    sys.exit( 1 if tkinter or spent*1000 > budget else 0 )
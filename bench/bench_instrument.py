@@ -0,0 +1,72 @@
+# BENCH INSTRUMENT - Cost of the instrument.py timers - Python
+#
+# Runs summarize and prepare over the same data file three ways:
+#     off - no Instruments (the default)
+#     timers - Instruments with no progress records
+#     progress - Instruments writing a progress record every chunk
+# and reports the time of each, relative to off, with the stage times of
+# the timed run. The output files of all runs are checked to be the same.
+#
+# Command use:
+#
+#     python bench/bench_instrument.py [train.csv]
+#
+# With no file name, a synthetic data file of 5000 trips is made with
+# synthtrips.py.
+
+import os
+import sys
+import filecmp
+import tempfile
+import contextlib
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import instrument
+import synthtrips
+
+from bench_waypoints import timeIt
+
+def benchInstrument( fileName, work ):
+    same = True
+    for function in ( illume.summarize, illume.prepare ):
+        outputs = { }
+        times = { }
+        tools = None
+        for way in ( 'off', 'timers', 'progress' ):
+            outName = os.path.join( work, way + '.csv' )
+            outputs[way] = outName
+
+            def once():
+                nonlocal tools
+                tools = None
+                if way == 'timers':
+                    tools = instrument.Instruments()
+                elif way == 'progress':
+                    tools = instrument.Instruments( open( os.devnull, 'w' ), interval=0 )
+                function( fileName, outName, checkpointEvery=0, instruments=tools )
+
+            with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+                times[way] = timeIt( once )
+            if way == 'timers':
+                stages = tools.report()['stages']
+        for way in ( 'timers', 'progress' ):
+            same = filecmp.cmp( outputs['off'], outputs[way], shallow=False ) and same
+        print( "{:s}: off {:.3f} s, timers {:+.1%}, progress {:+.1%}".format(
+                function.__name__, times['off'],
+                times['timers']/times['off'] - 1, times['progress']/times['off'] - 1 ))
+        print( "    " + ", ".join( "{:s} {:.3f} s".format( stage, stages[stage] )
+                                   for stage in instrument.Stages ))
+    print( "Same output: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    work = tempfile.mkdtemp()
+    if args:
+        fileName = args[0]
+    else:
+        fileName = os.path.join( work, 'trips.csv' )
+        synthtrips.writeTrips( fileName, 5000 )
+    sys.exit( 0 if benchInstrument( fileName, work ) else 1 )
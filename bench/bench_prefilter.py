@@ -0,0 +1,108 @@
+# BENCH PREFILTER - Cost, gain and resume of prepare's prefilter - Python
+#
+# Copies a data file with every 'every'-th entry sent twice (an exact
+# duplicate 'Delay' entries after it, so that the two are in different
+# chunks of the pipeline, with checkpoints between some of them), then:
+#     - times prepare on the copy with and without the prefilter, and
+#       reports the rows each wrote
+#     - runs prepare with the prefilter and checkpoints, stopped part way
+#       (after a checkpoint, with duplicates still to come), and resumed;
+#       checks that the output is that of a run that was never stopped,
+#       so that the table of recent trips came back with the checkpoint
+#
+# Command use:
+#
+#     python bench/bench_prefilter.py [train.csv] [entries] [every]
+#
+# With no file name, a synthetic data file of that many entries (3000 by
+# default) is made with synthtrips.py.
+
+import os
+import sys
+import csv
+import filecmp
+import tempfile
+import contextlib
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import pipeline
+import synthtrips
+
+from bench_waypoints import timeIt
+
+# Entries between a trip and its duplicate: more than pipeline.run's
+# chunk of trips
+Delay = 1000
+
+class Stopped( Exception ):
+    pass
+
+# Copy the first 'limit' entries of a data file, every 'every'-th twice
+
+def withDuplicates( fileName, dupName, limit, every ):
+    pending = { }
+    with open( fileName, 'r' ) as source, open( dupName, 'w', newline='' ) as out:
+        table = csv.reader( source )
+        copy = csv.writer( out, quoting=csv.QUOTE_ALL, lineterminator='\n' )
+        copy.writerow( next( table ))
+        for (count, line) in zip( range( 1, limit+1 ), table ):
+            copy.writerow( line )
+            if count % every == 0:
+                pending[count + Delay] = line
+            if count in pending:
+                copy.writerow( pending.pop( count ))
+        for line in pending.values():
+            copy.writerow( line )
+
+# Run prepare with the prefilter, stopping it once past entry 'stopAt'
+# (the checkpoint file is left, as by a crash), then resume it
+
+def stopAndResume( fileName, prepName, stopAt, every ):
+    branch = pipeline.prepareBranch( prepName, prefilter=True )
+    stages = branch.stages
+
+    def stopping( trips ):
+        trips = list( trips )
+        if trips and trips[-1].count > stopAt:
+            raise Stopped()
+        return stages( trips )
+
+    branch.stages = stopping
+    try:
+        pipeline.run( fileName, [ branch ], checkpoint=prepName + '.checkpoint', every=every )
+    except Stopped:
+        branch.destiny.close()
+    illume.prepare( fileName, prepName, prefilter=True, resume=True, checkpointEvery=every )
+
+def benchPrefilter( fileName, work, limit, every ):
+    dupName = os.path.join( work, 'duplicated.csv' )
+    withDuplicates( fileName, dupName, limit, every )
+    plainName = os.path.join( work, 'plain.csv' )
+    fullName = os.path.join( work, 'full.csv' )
+    resumedName = os.path.join( work, 'resumed.csv' )
+    with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+        plainTime = timeIt( lambda: illume.prepare( dupName, plainName, checkpointEvery=0 ))
+        filterTime = timeIt( lambda: illume.prepare( dupName, fullName, prefilter=True,
+                checkpointEvery=0 ))
+        stopAndResume( dupName, resumedName, limit*2 // 3, limit // 4 )
+    rows = [ sum( 1 for line in open( name )) - 1 for name in ( plainName, fullName ) ]
+    same = filecmp.cmp( fullName, resumedName, shallow=False )
+    print( "Entries: {:d}, duplicated: {:d}".format( limit + limit//every, limit//every ))
+    print( "    prepare: {:7.3f} s {:8d} rows".format( plainTime, rows[0] ))
+    print( "  prefilter: {:7.3f} s {:8d} rows".format( filterTime, rows[1] ))
+    print( "Resumed same as full run: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    work = tempfile.mkdtemp()
+    limit = int( args[1] ) if len(args) >= 2 else 3000
+    every = int( args[2] ) if len(args) >= 3 else 250
+    if args:
+        fileName = args[0]
+    else:
+        fileName = os.path.join( work, 'trips.csv' )
+        synthtrips.writeTrips( fileName, limit )
+    sys.exit( 0 if benchPrefilter( fileName, work, limit, every ) else 1 )
@@ -0,0 +1,168 @@
+# BENCH RENDER - Entries/s of illume's printout - Python
+#
+# Compares three ways of printing the first entries of a data file:
+#     printByPrint - the former printTrip and printWaypoints (kept here
+#         for reference): one print per field and per waypoint, each
+#         compass name and arrow built for its waypoint
+#     blocks - illume.tripBlock: one string per entry, with one write,
+#         each waypoint line made by one %-format with its arrow from a table
+#     cached - the blocks again from a render.BlockCache, as when going
+#         back a page in render.browse
+# each to a file, and checks that the first two print the same text,
+# apart from the complaints about points that cannot be parsed: those are
+# printed as the entry is parsed, which for blocks is before any of it is
+# written. Parsing the waypoints is a large part of the cost of an entry,
+# and is the same both ways, so the lines of the waypoints alone (parsed
+# beforehand) are also timed: printWaypoints the former way against
+# illume.waypointsBlock. Times are the best of 7 runs, as this is noisy.
+#
+# Command use:
+#
+#     python bench/bench_render.py [train.csv] [entries]
+#
+# With no file name, a synthetic data file of that many entries (2000 by
+# default) is made with synthtrips.py.
+
+import os
+import sys
+import csv
+import tempfile
+import contextlib
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import render
+import synthtrips
+
+from bench_waypoints import timeIt
+
+# The former printTrip and printWaypoints, one print at a time
+
+def printByPrint( count, labels, line, labelwidth ):
+    print( "__", count, "_"*labelwidth, sep="" )
+    for (label,atom) in zip( labels, line ):
+        if label == 'POLYLINE':
+            waypoints = illume.parseWaypoints( atom )
+            printWaypointsByPrint( label, waypoints, indent=labelwidth )
+            drivedist = sum( p[2] for p in waypoints )
+            tripdist = 0 if len(waypoints)==0 else illume.geodist(
+                    waypoints[0][0], waypoints[0][1],
+                    waypoints[-1][0], waypoints[-1][1])
+            triptime = max( 0, len(waypoints)-1 ) * 0.25
+            print( '{:s}: {:6.3f} {:s}'.format(
+                    "ROUTE_LEN".rjust(labelwidth), drivedist/1000, 'km' ))
+            print( '{:s}: {:6.3f} {:s}'.format(
+                    "TRIP_LEN".rjust(labelwidth), tripdist/1000, 'km' ))
+            print( '{:s}: {:5.2f} {:s}'.format(
+                    "TRIP_TIME".rjust(labelwidth), triptime, 'min' ))
+            print( '{:s}: {:4.1f} {:s}'.format(
+                    "AVG_SPEED".rjust(labelwidth),
+                    drivedist/triptime*(60/1000) if triptime!=0 else 0,
+                    'km/h' ))
+            print( '{:s}: {:4.1f} {:s}'.format(
+                    "TRIP_SPEED".rjust(labelwidth),
+                    tripdist/triptime*(60/1000) if triptime!=0 else 0,
+                    'km/h' ))
+        else:
+            suffix = illume.annotate( label, atom )
+            if suffix != '':
+                suffix = '  (' + suffix + ')'
+            print( '{:s}: {:s}{:s}'.format(
+                    label.rjust(labelwidth), atom, suffix ))
+    print()
+
+def printWaypointsByPrint( label, points, indent=2 ):
+    if label:
+        print( label.rjust(indent), ':', sep='' )
+    prefix = ' ' * indent
+    ticks = 0
+    for point in points:
+        if point[2] != 0:
+            print( '{:s}{:5.2f}: {:.6f}, {:.6f}, {:4.0f}m, {:4.0f}°  {:s}{:s}'.format(
+                prefix, ticks,
+                point[0], point[1],
+                point[2], point[3],
+                illume.geodirname(point[3]),
+                "<" * (-90 < point[3] <= 90) +
+                "=" * min(30,round(point[2]/50)) +
+                ">" * (not -90 < point[3] <= 90) ))
+        else:
+            print( '{:s}{:5.2f}: {:.6f}, {:.6f}, {:4.0f}m,    -'.format(
+                prefix, ticks,
+                point[0], point[1], point[2] ))
+        ticks += 0.25
+
+def benchRender( fileName, limit, work ):
+    with open( fileName, 'r' ) as source:
+        table = csv.reader( source )
+        labels = next( table )
+        entries = [ line for (count, line) in zip( range( limit ), table ) ]
+    labelwidth = max( len(label) for label in labels )
+    points = sum( line[8].count( '],[' ) + 1 for line in entries )
+    with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+        parsed = [ illume.parseWaypoints( line[8] ) for line in entries ]
+    oldName = os.path.join( work, 'printbyprint.txt' )
+    newName = os.path.join( work, 'blocks.txt' )
+    cache = render.BlockCache( len(entries) )
+
+    def byPrint():
+        with open( oldName, 'w' ) as out, contextlib.redirect_stdout( out ):
+            for (count, line) in enumerate( entries, 1 ):
+                printByPrint( count, labels, line, labelwidth )
+
+    def blocks():
+        with open( newName, 'w' ) as out:
+            for (count, line) in enumerate( entries, 1 ):
+                block = illume.tripBlock( count, labels, line, labelwidth )
+                cache.put( (count, line[0]), block )
+                out.write( block )
+
+    def waypointsByPrint():
+        with open( oldName, 'w' ) as out, contextlib.redirect_stdout( out ):
+            for waypoints in parsed:
+                printWaypointsByPrint( 'POLYLINE', waypoints, labelwidth )
+
+    def waypointsBlocks():
+        with open( newName, 'w' ) as out:
+            for waypoints in parsed:
+                out.write( illume.waypointsBlock( 'POLYLINE', waypoints, labelwidth ))
+
+    def cached():
+        with open( newName, 'w' ) as out:
+            out.write( "".join( cache.get( (count, line[0]) )
+                                for (count, line) in enumerate( entries, 1 )))
+
+    with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+        oldTime = timeIt( byPrint, 7 )
+        newTime = timeIt( blocks, 7 )
+        cacheTime = timeIt( cached, 7 )
+        oldLines = timeIt( waypointsByPrint, 7 )
+        newLines = timeIt( waypointsBlocks, 7 )
+        byPrint()
+        blocks()
+    with open( oldName, 'r' ) as old, open( newName, 'r' ) as new:
+        same = [ text for text in old if not text.startswith( "Cannot parse" )] == list( new )
+    print( "Entries: {:d}, waypoints: {:d}".format( len(entries), points ))
+    print( "  printByPrint: {:10,.0f} entries/s".format( len(entries)/oldTime ))
+    print( "        blocks: {:10,.0f} entries/s {:6.2f}x".format(
+            len(entries)/newTime, oldTime/newTime ))
+    print( "        cached: {:10,.0f} entries/s {:6.2f}x".format(
+            len(entries)/cacheTime, oldTime/cacheTime ))
+    print( "Waypoint lines alone:" )
+    print( "  printByPrint: {:10,.0f} waypoints/s".format( points/oldLines ))
+    print( "        blocks: {:10,.0f} waypoints/s {:6.2f}x".format(
+            points/newLines, oldLines/newLines ))
+    print( "Same text: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    work = tempfile.mkdtemp()
+    limit = int( args[1] ) if len(args) >= 2 else 2000
+    if args:
+        fileName = args[0]
+    else:
+        fileName = os.path.join( work, 'trips.csv' )
+        synthtrips.writeTrips( fileName, limit )
+    sys.exit( 0 if benchRender( fileName, limit, work ) else 1 )
@@ -0,0 +1,87 @@
+# BENCH SAMPLERS - Speed and spread of the samplers of samplers.py - Python
+#
+# Offers every entry of a data file to each sampler and reports:
+#     entries/s - entries offered per second (CSV fields already read)
+#     picked - number of entries picked
+#     mean pos - mean position of the picks in the file, 0..1; 0.5 for a
+#         sample spread evenly over the file
+#     in last half - share of the picks in the second half of the file
+# with the isInteresting picks of illume and rawsample (limit=0) for
+# comparison, and checks that:
+#     - each sampler picks the same entries when run again with its seed
+#     - the train and test samplers of hashSplit are disjoint and cover
+#       the file
+#
+# Command use:
+#
+#     python bench/bench_samplers.py [train.csv]
+#
+# With no file name, a synthetic data file of 20000 trips is made with
+# synthtrips.py.
+
+import os
+import sys
+import csv
+import tempfile
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import samplers
+import synthtrips
+
+from bench_waypoints import timeIt
+
+class Interesting:
+
+    streaming = True
+
+    def offer( self, count, line, item=None ):
+        return illume.isInteresting( count )
+
+def picksOf( sampler, lines ):
+    picked = [ count for (count, line) in enumerate( lines, 1 )
+               if sampler.offer( count, line, line ) ]
+    if not sampler.streaming:
+        picked = [ count for (count, line) in sampler.chosen() ]
+    return picked
+
+def benchSamplers( fileName ):
+    with open( fileName, 'r' ) as source:
+        lines = list( csv.reader( source ))[1:]
+    (train, test) = samplers.hashSplit( 0.8, seed=1 )
+    makers = [
+        ( 'interesting', lambda: Interesting() ),
+        ( 'reservoir', lambda: samplers.ReservoirSampler( 1000, seed=1 )),
+        ( 'stratified', lambda: samplers.StratifiedSampler( 50, ( 'CALL_TYPE', 'DAY_BUSY' ), 1 )),
+        ( 'hash 1/20', lambda: samplers.HashSampler( 20, ( 0, ), seed=1 )),
+        ( 'hash train', lambda: train ),
+        ( 'hash test', lambda: test ) ]
+    same = True
+    print( "Entries: {:d}".format( len(lines) ))
+    print( "{:>12s} {:>12s} {:>7s} {:>9s} {:>13s}".format(
+            'sampler', 'entries/s', 'picked', 'mean pos', 'in last half' ))
+    picks = { }
+    for (name, maker) in makers:
+        spent = timeIt( lambda: picksOf( maker(), lines ))
+        picked = picksOf( maker(), lines )
+        same = picked == picksOf( maker(), lines ) and same
+        picks[name] = picked
+        where = [ count / len(lines) for count in picked ]
+        print( "{:>12s} {:12,.0f} {:7d} {:9.3f} {:13.3f}".format(
+                name, len(lines)/spent, len(picked), sum( where ) / max( 1, len(where) ),
+                sum( 1 for at in where if at > 0.5 ) / max( 1, len(where) )))
+    split = set( picks['hash train'] ), set( picks['hash test'] )
+    disjoint = not (split[0] & split[1]) and len(split[0] | split[1]) == len(lines)
+    print( "Same picks again: " + str(same) )
+    print( "Split disjoint and whole: " + str(disjoint) )
+    return same and disjoint
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args:
+        fileName = args[0]
+    else:
+        fileName = os.path.join( tempfile.mkdtemp(), 'trips.csv' )
+        synthtrips.writeTrips( fileName, 20000 )
+    sys.exit( 0 if benchSamplers( fileName ) else 1 )
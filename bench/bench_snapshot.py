@@ -0,0 +1,101 @@
+# BENCH SNAPSHOT - Rows/s of the prepare row formatting and writing - Python
+#
+# Compares two ways of making and writing prepare's snapshot rows for the
+# good trips of a set:
+#     rowByRow - the former snapshotLines (kept here for reference): six
+#         point formats and a join per row, two writes per row, to a file
+#         with the default buffer
+#     batched - illume.snapshotLines: per-trip fields and each waypoint
+#         formatted once, all rows of a chunk written at once, to a file
+#         with pipeline.WriteBuffer of buffer
+# and checks that both write the same bytes.
+#
+# Command use:
+#
+#     python bench/bench_snapshot.py [train.csv] [trips] [freq step]
+#
+# With no file name, a set of random-walk trips around Porto is made up.
+
+import os
+import sys
+import filecmp
+import tempfile
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import pipeline
+
+from bench_waypoints import loadPolylines, makePolylines, timeIt
+
+# The former snapshotLines, one row at a time
+
+def rowByRowLines( line, waypoints, tripId,
+                   drivedist, tripdist, triptime, wpFreq, wpStep ):
+    line1 = [str(tripId), line[1], line[2], line[4], line[5]]
+    timeinfo = illume.decodestamp( line[5] )
+    line1.append( str(timeinfo[2]) )
+    line1.append( str(timeinfo[3]) )
+    line1.append( "{:.3f}".format(timeinfo[4]) )
+    line1.append( "{:.0f}".format( drivedist ))
+    line1.append( "{:.0f}".format( tripdist ))
+    line1.append( "{:.2f}".format( triptime ))
+    for ix in range( 0, len(waypoints), wpFreq ):
+        baseSize = len(line1)
+        line1.append( str(ix/4) )
+        for jx in ( 0, max( 0, ix-3*wpStep ), max( 0, ix-2*wpStep ),
+                    max( 0, ix-wpStep ), ix, -1 ):
+            here = waypoints[jx]
+            line1.append( "{:.6f},{:.6f}" .format( here[0], here[1] ))
+        yield ",".join(line1) + "\n"
+        line1[baseSize:] = []
+
+def benchSnapshot( texts, wpFreq, wpStep, work ):
+    trips = [ ]
+    errors = illume.ParseErrors()
+    for (ix, text) in enumerate( texts ):
+        line = [ str(ix), 'B', '', '', str(20000000+ix), str(1372636858+97*ix),
+                 'A', 'False', text ]
+        waypoints = illume.tokenizeWaypoints( text, errors=errors, recordId=ix )
+        judged = illume.judgeWaypoints( line, waypoints )
+        if judged[0] == 0:
+            trips.append( (line, waypoints, ix+1) + judged[1:] )
+    oldName = os.path.join( work, 'rowbyrow.csv' )
+    newName = os.path.join( work, 'batched.csv' )
+    rows = [ 0 ]
+
+    def rowByRow():
+        rows[0] = 0
+        with open( oldName, 'w' ) as destiny:
+            for trip in trips:
+                for row in rowByRowLines( *trip, wpFreq, wpStep ):
+                    destiny.write( row )
+                    rows[0] += 1
+
+    def batched():
+        with open( newName, 'w', buffering=pipeline.WriteBuffer ) as destiny:
+            for first in range( 0, len(trips), 1000 ):
+                chunk = [ ]
+                for trip in trips[first:first+1000]:
+                    chunk.extend( illume.snapshotLines( *trip, wpFreq, wpStep ))
+                destiny.write( "".join( chunk ))
+
+    oldTime = timeIt( rowByRow )
+    newTime = timeIt( batched )
+    same = filecmp.cmp( oldName, newName, shallow=False )
+    print( "Good trips: {:d}, rows: {:d}, delta: ({:d},{:d}) quarter-minutes".format(
+            len(trips), rows[0], wpFreq, wpStep ))
+    print( "  rowByRow: {:12,.0f} rows/s".format( rows[0]/oldTime ))
+    print( "   batched: {:12,.0f} rows/s {:6.2f}x".format( rows[0]/newTime, oldTime/newTime ))
+    print( "Same output: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    limit = int( args[1] ) if len(args) >= 2 else 20000
+    (wpFreq, wpStep) = (int( args[2] ), int( args[3] )) if len(args) >= 4 else (10, 10)
+    texts = loadPolylines( args[0], limit ) if args else makePolylines( limit )
+    work = tempfile.mkdtemp()
+    same = benchSnapshot( texts, wpFreq, wpStep, work )
+    same = benchSnapshot( texts, 4, 2, work ) and same
+    sys.exit( 0 if same else 1 )
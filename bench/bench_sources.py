@@ -0,0 +1,101 @@
+# BENCH SOURCES - Reading plain and compressed data files - Python
+#
+# Compresses a data file as gzip, bz2, xz and zip, then for each kind
+# reads every line of it (as bytes) in two ways:
+#     inline - the decompressor read line by line on the main thread, as
+#         a plain 'for line in source' loop would
+#     prefetch - sources.PrefetchReader, decompressing on its own thread
+#         and handing out blocks of lines
+# and reports the seconds of each, and the seconds the main thread spent
+# waiting for the lines of the prefetch reader while it did some work on
+# each line (csv parsing, standing in for the parse loop). On a machine
+# with a spare core the wait is much less than the inline read. Checks
+# that every way gives the lines of the plain file.
+#
+# Command use:
+#
+#     python bench/bench_sources.py [train.csv]
+#
+# With no file name, a synthetic data file of 20000 trips is made with
+# synthtrips.py.
+
+import os
+import sys
+import csv
+import bz2
+import gzip
+import lzma
+import time
+import shutil
+import zipfile
+import tempfile
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import sources
+import synthtrips
+
+from bench_waypoints import timeIt
+
+def compressAll( fileName, work ):
+    names = { 'plain': fileName }
+    for (kind, opener) in ( ( 'gzip', gzip.open ), ( 'bz2', bz2.open ), ( 'xz', lzma.open )):
+        names[kind] = os.path.join( work, 'trips.' + kind )
+        with open( fileName, 'rb' ) as source, opener( names[kind], 'wb' ) as out:
+            shutil.copyfileobj( source, out )
+    names['zip'] = os.path.join( work, 'trips.zip' )
+    with zipfile.ZipFile( names['zip'], 'w', zipfile.ZIP_DEFLATED ) as archive:
+        archive.write( fileName, 'trips.csv' )
+    return names
+
+def readInline( fileName ):
+    with sources.openBinary( fileName ) as source:
+        return [ line for line in source ]
+
+def readPrefetch( fileName ):
+    with sources.PrefetchReader( fileName ) as reader:
+        return [ line for line in reader ]
+
+# Seconds spent waiting on the reader, while parsing each line with csv
+
+def waitPrefetch( fileName ):
+    waited = 0.0
+    with sources.PrefetchReader( fileName ) as reader:
+        blocks = reader.blocks()
+        while True:
+            began = time.perf_counter()
+            lines = next( blocks, None )
+            waited += time.perf_counter() - began
+            if lines is None:
+                break
+            for row in csv.reader( line.decode() for line in lines ):
+                pass
+    return waited
+
+def benchSources( fileName, work ):
+    names = compressAll( fileName, work )
+    with open( fileName, 'rb' ) as source:
+        plain = source.readlines()
+    same = True
+    print( "Lines: {:d}, bytes: {:,d}".format( len(plain), sum( len(line) for line in plain )))
+    print( "{:>6s} {:>12s} {:>9s} {:>10s} {:>9s}".format(
+            'kind', 'bytes', 'inline s', 'prefetch s', 'waited s' ))
+    for (kind, name) in names.items():
+        same = readInline( name ) == plain and readPrefetch( name ) == plain and same
+        inline = timeIt( lambda: readInline( name ))
+        prefetch = timeIt( lambda: readPrefetch( name ))
+        waited = waitPrefetch( name )
+        print( "{:>6s} {:12,d} {:9.3f} {:10.3f} {:9.3f}".format(
+                kind, os.path.getsize( name ), inline, prefetch, waited ))
+    print( "Same lines: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    work = tempfile.mkdtemp()
+    if args:
+        fileName = args[0]
+    else:
+        fileName = os.path.join( work, 'trips.csv' )
+        synthtrips.writeTrips( fileName, 20000 )
+    sys.exit( 0 if benchSources( fileName, work ) else 1 )
@@ -0,0 +1,150 @@
+# BENCH SUITE - Time the main illume functions at several scales - Python
+#
+# For each scale (number of trips), makes a synthetic data file with
+# synthtrips.py (kept in the work directory and reused by later runs),
+# then times each function on it in a fresh process, so that each peak
+# memory figure is that function's own. Reports for each run:
+#     seconds - wall time of the call
+#     tripsPerSec, pointsPerSec - throughput over the entries read
+#     peakRssKb - peak resident memory of the process, in KiB
+#     outputBytes - size of the file written (0 for parseWaypoints/illume)
+#
+# Functions timed:
+#     parseWaypoints - every POLYLINE of the file (read time not counted)
+#     summarize, prepare - the whole file, default parameters
+#     rawsample - copy every entry
+#     illume - print 1000 entries from the middle of the file (to null)
+#
+# Results are written as JSON, for comparing runs:
+#
+#     { "python": ..., "platform": ..., "started": ...,
+#       "results": [ { "function": ..., "trips": ..., "seconds": ...,
+#                      "tripsPerSec": ..., ... }, ... ] }
+#
+# Command use:
+#
+#     python bench/bench_suite.py [--scales 10000,100000] [--work DIR]
+#         [--functions prepare,summarize] [--out results.json]
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import resource
+import contextlib
+import subprocess
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import synthtrips
+
+Functions = [ 'parseWaypoints', 'summarize', 'prepare', 'rawsample', 'illume' ]
+
+# SYNTH FILE - Name of the data file of a scale, made if it is not there
+#
+# Result:
+#    Tuple of the file name and its number of waypoints
+
+def synthFile( workDir, trips, seed=136 ):
+    fileName = os.path.join( workDir, "synth-{:d}-{:d}.csv".format( trips, seed ))
+    metaName = fileName + ".json"
+    if not (os.path.exists( fileName ) and os.path.exists( metaName )):
+        print( "Making", fileName )
+        points = synthtrips.writeTrips( fileName, trips, seed )
+        with open( metaName, 'w' ) as meta:
+            json.dump( { 'trips': trips, 'points': points }, meta )
+    with open( metaName, 'r' ) as meta:
+        return fileName, json.load( meta )['points']
+
+# RUN ONE - Time one function on one file, in this process
+#
+# Result:
+#    Dictionary of seconds, entries read, output file size and peak RSS
+
+def runOne( function, fileName, outName, trips ):
+    import illume
+    entries = trips
+    with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+        if function == 'parseWaypoints':
+            with open( fileName, 'r' ) as source:
+                table = csv.reader( source )
+                column = next( table ).index( 'POLYLINE' )
+                texts = [ line[column] for line in table ]
+            began = time.perf_counter()
+            for text in texts:
+                illume.parseWaypoints( text )
+        else:
+            began = time.perf_counter()
+            if function == 'summarize':
+                illume.summarize( fileName, outName )
+            elif function == 'prepare':
+                illume.prepare( fileName, outName )
+            elif function == 'rawsample':
+                illume.rawsample( fileName, outName, limit=trips )
+            elif function == 'illume':
+                start = max( 1, trips//2 )
+                illume.illume( fileName, limit=1000, start=start )
+                entries = min( trips, start+1000 )
+            else:
+                raise ValueError( "no such function: " + function )
+        seconds = time.perf_counter() - began
+    output = os.path.getsize( outName ) if os.path.exists( outName ) else 0
+    return { 'seconds': seconds, 'entries': entries, 'outputBytes': output,
+             'peakRssKb': resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss }
+
+# BENCH SUITE - Run every function at every scale
+#
+# Result:
+#    The results document, as written to JSON
+
+def benchSuite( scales, functions=Functions, workDir='.', seed=136 ):
+    document = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': time.strftime( '%Y-%m-%dT%H:%M:%S' ),
+        'results': [ ] }
+    for trips in scales:
+        (fileName, points) = synthFile( workDir, trips, seed )
+        for function in functions:
+            outName = os.path.join( workDir, "out-{:s}.csv".format( function ))
+            if os.path.exists( outName ):
+                os.remove( outName )
+            child = subprocess.run( [ sys.executable, __file__, '--child',
+                    function, fileName, outName, str(trips) ],
+                    capture_output=True, text=True, check=True )
+            run = json.loads( child.stdout )
+            entries = run.pop( 'entries' )
+            pointShare = points * entries / trips if trips else 0
+            result = { 'function': function, 'trips': trips, 'points': points }
+            result.update( run )
+            result['tripsPerSec'] = entries / run['seconds']
+            result['pointsPerSec'] = pointShare / run['seconds']
+            document['results'].append( result )
+            print( "{:>15s} {:>9,d} trips: {:8.2f} s {:12,.0f} trips/s {:14,.0f} points/s {:9,d} KiB".format(
+                    function, trips, run['seconds'], result['tripsPerSec'],
+                    result['pointsPerSec'], run['peakRssKb'] ))
+            if os.path.exists( outName ):
+                os.remove( outName )
+    return document
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        (function, fileName, outName, trips) = sys.argv[2:6]
+        print( json.dumps( runOne( function, fileName, outName, int(trips) )))
+        sys.exit( 0 )
+    parser = argparse.ArgumentParser( description="Time illume functions on synthetic data" )
+    parser.add_argument( '--scales', default='10000,100000',
+            help="comma-separated numbers of trips" )
+    parser.add_argument( '--functions', default=",".join( Functions ) )
+    parser.add_argument( '--work', default='.', help="directory for data files" )
+    parser.add_argument( '--seed', type=int, default=136 )
+    parser.add_argument( '--out', default='bench-results.json' )
+    args = parser.parse_args()
+    document = benchSuite( [ int( scale ) for scale in args.scales.split( ',' ) ],
+            args.functions.split( ',' ), args.work, args.seed )
+    with open( args.out, 'w' ) as out:
+        json.dump( document, out, indent=1 )
+    print( "Results in", args.out )
@@ -0,0 +1,110 @@
+# BENCH TOKENIZE - Compare parseWaypoints with tokenizeWaypoints - Python
+#
+# Times the two POLYLINE parsers of illume on long trips (1000 points and
+# up), clean and dirty, in each distance mode:
+#     parseWaypoints - print bad trips
+#     tokenizeWaypoints - count bad points
+# Both work out the distance and heading of each step with stepWaypoints.
+# Each is checked to give identical waypoint tuples (same types and
+# values, by repr) to a reference that calls the distance and heading
+# functions of the mode for each step, as parseWaypoints once did.
+#
+# The dirty set has one bad point in every 'dirt' trips; parseWaypoints
+# prints the whole text of each of them (to a null file here).
+#
+# Command use:
+#
+#     python bench/bench_tokenize.py [trips] [points] [dirt]
+
+import os
+import sys
+import random
+import contextlib
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+
+from bench_waypoints import timeIt
+
+# MAKE LONG TRIPS - Make up random-walk POLYLINE texts of 'points' points
+# and up; every 'dirt' trips (0 => none) one point is spoiled.
+
+def makeLongTrips( trips, points, dirt=0, seed=136 ):
+    rand = random.Random( seed )
+    texts = [ ]
+    for ix in range( trips ):
+        lon, lat = -8.61 + rand.gauss( 0, 0.02 ), 41.15 + rand.gauss( 0, 0.015 )
+        waypoints = [ ]
+        for jx in range( points + rand.randrange( points )):
+            waypoints.append( "[{:.6f},{:.6f}]".format( lon, lat ))
+            lon += rand.uniform( -0.0015, 0.0015 )
+            lat += rand.uniform( -0.0011, 0.0011 )
+        if dirt and ix % dirt == 0:
+            waypoints[ len(waypoints)//2 ] = "[-8.6x,41.1]"
+        texts.append( "[" + ",".join( waypoints ) + "]" )
+    return texts
+
+# REFERENCE WAYPOINTS - Waypoints of a POLYLINE text, with the distance
+# and heading functions of the mode called for each step
+
+def referenceWaypoints( text, mode='precise' ):
+    (distFunc, dirFunc) = illume.DistanceModes[mode]
+    stamps = text .lstrip('[') .rstrip(']') .split('],[')
+    if len(stamps)==1 and stamps[0]=="":
+        stamps = [ ]
+    lastLongi, lastLati = 0, 0
+    waypoints = [ ]
+    for stamp in stamps:
+        (longi, junk, lati) = stamp.partition(',')
+        try:
+            longi, lati = float(longi), float(lati)
+        except ValueError:
+            longi, lati = 0, 0
+        if lastLongi != 0 and lastLati != 0:
+            waypoints.append( (longi, lati,
+                    distFunc( longi, lati, lastLongi, lastLati ),
+                    dirFunc( longi, lati, lastLongi, lastLati )) )
+        else:
+            waypoints.append( (longi, lati, 0, 0) )
+        lastLongi, lastLati = longi, lati
+    return waypoints
+
+def benchTokenize( texts, label, mode='precise' ):
+    points = sum( text.count( '],[' ) + 1 for text in texts )
+    errors = illume.ParseErrors()
+    with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+        same = True
+        for (ix, text) in enumerate( texts ):
+            reference = repr( referenceWaypoints( text, mode ))
+            parsed = repr( illume.parseWaypoints( text, mode ))
+            tokenized = repr( illume.tokenizeWaypoints( text, mode, errors, ix ))
+            same = parsed == reference and tokenized == reference and same
+
+        def parse():
+            for text in texts:
+                illume.parseWaypoints( text, mode )
+
+        def tokenize():
+            counts = illume.ParseErrors()
+            for (ix, text) in enumerate( texts ):
+                illume.tokenizeWaypoints( text, mode, counts, ix )
+
+        parseTime = timeIt( parse, 7 )
+        tokenTime = timeIt( tokenize, 7 )
+    print( "{:s}, {:s}: {:d} trips, {:d} points, {:d} bad, same result: {:s}".format(
+            label, mode, len(texts), points, errors.badPoints, str(same) ))
+    print( "    parseWaypoints: {:12,.0f} points/s".format( points/parseTime ))
+    print( " tokenizeWaypoints: {:12,.0f} points/s {:6.2f}x".format(
+            points/tokenTime, parseTime/tokenTime ))
+    return same
+
+if __name__ == "__main__":
+    trips = int( sys.argv[1] ) if len(sys.argv) > 1 else 300
+    points = int( sys.argv[2] ) if len(sys.argv) > 2 else 1000
+    dirt = int( sys.argv[3] ) if len(sys.argv) > 3 else 2
+    same = True
+    for mode in illume.DistanceModes:
+        same = benchTokenize( makeLongTrips( trips, points ), "Clean", mode ) and same
+        same = benchTokenize( makeLongTrips( trips, points, dirt ), "Dirty", mode ) and same
+    sys.exit( 0 if same else 1 )
@@ -0,0 +1,117 @@
+# BENCH WAYPOINTS - Compare the scalar and array waypoint engines - Python
+#
+# Times three ways of turning POLYLINE texts into waypoint distances and
+# headings, and reports the throughput of each in points per second:
+#     scalar - illume.parseWaypoints, one tuple and math call per point
+#     per-trip - geoarray.waypointArrays, one array call set per trip
+#     chunked - geoarray.polylineChunk + segmentArrays, one call set per chunk
+#     lists - geoarray.waypointLists, the chunked arrays made back into
+#         waypoint tuples, as the pipeline of prepare uses them
+#
+# and checks that the waypoints of geoarray.parseWaypoints and
+# geoarray.waypointLists equal those of illume.parseWaypoints, bit for bit.
+#
+# Command use:
+#
+#     python bench/bench_waypoints.py [train.csv] [trips]
+#
+# With no file name, a set of random-walk trips around Porto is made up.
+
+import os
+import sys
+import csv
+import time
+import random
+import contextlib
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+import geoarray
+
+# LOAD POLYLINES - Read up to 'limit' POLYLINE texts from a taxi data file
+
+def loadPolylines( fileName, limit ):
+    texts = [ ]
+    with open( fileName, 'r' ) as source:
+        table = csv.reader( source )
+        labels = next( table )
+        column = labels.index( 'POLYLINE' )
+        for line in table:
+            texts.append( line[column] )
+            if len(texts) >= limit: break
+    return texts
+
+# MAKE POLYLINES - Make up 'limit' random-walk POLYLINE texts
+
+def makePolylines( limit, seed=136 ):
+    rand = random.Random( seed )
+    texts = [ ]
+    for ix in range( limit ):
+        lon, lat = -8.61 + rand.gauss( 0, 0.02 ), 41.15 + rand.gauss( 0, 0.015 )
+        points = [ ]
+        for jx in range( int( rand.lognormvariate( 3.7, 0.6 ))):
+            points.append( "[{:.6f},{:.6f}]".format( lon, lat ))
+            lon += rand.uniform( -0.0015, 0.0015 )
+            lat += rand.uniform( -0.0011, 0.0011 )
+        texts.append( "[" + ",".join(points) + "]" )
+    return texts
+
+# TIME IT - Run 'work' a few times, return the best time in seconds
+
+def timeIt( work, repeat=3 ):
+    best = None
+    for ix in range( repeat ):
+        began = time.perf_counter()
+        work()
+        spent = time.perf_counter() - began
+        best = spent if best is None else min( best, spent )
+    return best
+
+def benchWaypoints( texts, chunkSize=1000 ):
+    points = sum( len( geoarray.polylineArrays( text )[0] ) for text in texts )
+
+    def scalar():
+        for text in texts:
+            illume.parseWaypoints( text )
+
+    def perTrip():
+        for text in texts:
+            geoarray.waypointArrays( text )
+
+    def chunked():
+        for ix in range( 0, len(texts), chunkSize ):
+            lon, lat, offsets = geoarray.polylineChunk( texts[ix:ix+chunkSize] )
+            geoarray.segmentArrays( lon, lat, offsets )
+
+    def lists():
+        for ix in range( 0, len(texts), chunkSize ):
+            geoarray.waypointLists( texts[ix:ix+chunkSize] )
+
+    with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+        scalars = [ illume.parseWaypoints( text ) for text in texts ]
+        same = (all( geoarray.parseWaypoints( text ) == waypoints
+                     for (text, waypoints) in zip( texts, scalars ))
+                and [ waypoints for ix in range( 0, len(texts), chunkSize )
+                      for waypoints in geoarray.waypointLists( texts[ix:ix+chunkSize] )]
+                    == scalars)
+    print( "Trips: {:d}, points: {:d}".format( len(texts), points ))
+    baseline = None
+    for (name, work) in [ ('scalar', scalar), ('per-trip', perTrip), ('chunked', chunked),
+                          ('lists', lists) ]:
+        with open( os.devnull, 'w' ) as null, contextlib.redirect_stdout( null ):
+            spent = timeIt( work )
+        baseline = baseline or spent
+        print( '{:>9s}: {:7.3f} s {:12,.0f} points/s {:6.1f}x'.format(
+                name, spent, points/spent, baseline/spent ))
+    print( "Same waypoints: " + str(same) )
+    return same
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    limit = int( args[1] ) if len(args) >= 2 else 20000
+    if args:
+        texts = loadPolylines( args[0], limit )
+    else:
+        texts = makePolylines( limit )
+    sys.exit( 0 if benchWaypoints( texts ) else 1 )
@@ -0,0 +1,94 @@
+# LOADGEN - Replay taxi trips against the prediction server - Python
+#
+# Reads trips from a taxi data file and sends them to a running serve.py
+# as trips in progress: for each trip, one request per snapshot (every
+# 'every' minutes), each with the waypoints driven up to that snapshot.
+# Several client threads send at once. Reports requests per second and
+# the client-side p50/p99 latency, and the server's own /stats.
+#
+# Command use:
+#
+#     python src/serve.py model.pkl &
+#     python bench/loadgen.py train.csv [trips] [threads] [every] [port]
+
+import os
+import sys
+import csv
+import json
+import time
+import threading
+import http.client
+
+import numpy as np
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..', 'src' ))
+
+import illume
+
+# LOAD REQUESTS - Build the request bodies for the first trips of a file
+
+def loadRequests( fileName, trips=1000, every=2.5 ):
+    wpFreq = max( 1, int( 4*every ))
+    bodies = [ ]
+    with open( fileName, 'r' ) as source:
+        table = csv.reader( source )
+        labels = next( table )
+        stampAt = labels.index( 'TIMESTAMP' )
+        polyAt = labels.index( 'POLYLINE' )
+        for (count, line) in enumerate( table ):
+            if count >= trips: break
+            waypoints = illume.parseWaypoints( line[polyAt] )
+            for ix in range( 0, len(waypoints), wpFreq ):
+                bodies.append( json.dumps( {
+                    'timestamp': int( line[stampAt] ),
+                    'polyline': [ p[:2] for p in waypoints[:ix+1] ] } ).encode() )
+    return bodies
+
+# REPLAY - Send the requests from several threads; return the latencies
+
+def replay( bodies, threads=8, host='127.0.0.1', port=8136 ):
+    latencies = [ [ ] for _ in range( threads ) ]
+    failures = [ 0 ] * threads
+
+    def client( me ):
+        link = http.client.HTTPConnection( host, port )
+        for body in bodies[me::threads]:
+            began = time.perf_counter()
+            link.request( 'POST', '/predict', body,
+                    { 'Content-Type': 'application/json' } )
+            reply = link.getresponse()
+            reply.read()
+            latencies[me].append( time.perf_counter() - began )
+            if reply.status != 200:
+                failures[me] += 1
+        link.close()
+
+    workers = [ threading.Thread( target=client, args=(me,) )
+                for me in range( threads ) ]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+    return np.concatenate( [ np.array( part ) for part in latencies ] ), sum( failures )
+
+def serverStats( host='127.0.0.1', port=8136 ):
+    link = http.client.HTTPConnection( host, port )
+    link.request( 'GET', '/stats' )
+    stats = json.loads( link.getresponse().read() )
+    link.close()
+    return stats
+
+if __name__ == "__main__":
+    fileName = sys.argv[1]
+    trips = int( sys.argv[2] ) if len(sys.argv) > 2 else 1000
+    threads = int( sys.argv[3] ) if len(sys.argv) > 3 else 8
+    every = float( sys.argv[4] ) if len(sys.argv) > 4 else 2.5
+    port = int( sys.argv[5] ) if len(sys.argv) > 5 else 8136
+    bodies = loadRequests( fileName, trips, every )
+    began = time.perf_counter()
+    (latencies, failures) = replay( bodies, threads, port=port )
+    elapsed = time.perf_counter() - began
+    print( "{:d} requests, {:d} failed, in {:.2f} s: {:,.0f} requests/s".format(
+            len(bodies), failures, elapsed, len(bodies)/elapsed ))
+    if len(latencies) > 0:
+        print( "client p50 {:.2f} ms, p99 {:.2f} ms".format(
+                np.percentile( latencies, 50 )*1000, np.percentile( latencies, 99 )*1000 ))
+    print( "server", serverStats( port=port ))
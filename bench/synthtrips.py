@@ -0,0 +1,91 @@
+# SYNTHTRIPS - Make up a taxi data file shaped like the Porto train.csv - Python
+#
+# Writes a file with the same columns and quoting as the Kaggle Porto taxi
+# data, at any number of trips, for benchmarks and checks. The same seed
+# always gives the same file.
+#
+# Made to look like the real data where it matters for timing:
+#     - trips start in a cluster around central Porto, at increasing
+#       timestamps from 1 July 2013, by 448 taxis
+#     - CALL_TYPE A/B/C about 22/48/30 percent, with ORIGIN_CALL or
+#       ORIGIN_STAND filled to match
+#     - POLYLINE lengths are log-normal, median about 40 points (10
+#       minutes), with a long tail of trips over an hour
+#     - outliers: empty and 1-2 point trips, taxis that do not move,
+#       GPS jumps of over 150 km/h, MISSING_DATA flags, and now and then
+#       a point that cannot be parsed
+#
+# Command use:
+#
+#     python bench/synthtrips.py out.csv [trips] [seed]
+
+import sys
+import math
+import random
+
+Labels = [ "TRIP_ID", "CALL_TYPE", "ORIGIN_CALL", "ORIGIN_STAND", "TAXI_ID",
+           "TIMESTAMP", "DAY_TYPE", "MISSING_DATA", "POLYLINE" ]
+
+# WRITE TRIPS - Write a made-up taxi data file
+#
+# Parameters:
+#    fileName - name of output file
+#    trips - number of trips
+#    seed - random seed
+#
+# Result:
+#    Number of waypoints written
+
+def writeTrips( fileName, trips, seed=136 ):
+    rand = random.Random( seed )
+    stamp = 1372636800
+    points = 0
+    with open( fileName, 'w' ) as out:
+        out.write( ",".join( '"' + label + '"' for label in Labels ) + "\n" )
+        for ix in range( trips ):
+            # the real data has about 1.7M trips over one year
+            stamp += int( rand.expovariate( 1/18.5 ))
+            taxi = 20000000 + rand.randint( 1, 448 )
+            pick = rand.random()
+            callType = 'A' if pick < 0.22 else 'B' if pick < 0.70 else 'C'
+            originCall = str( rand.randint( 2001, 63882 )) if callType == 'A' else ''
+            originStand = str( rand.randint( 1, 63 )) if callType == 'B' else ''
+            missing = 'True' if rand.random() < 0.0005 else 'False'
+            polyline = makePolyline( rand )
+            points += polyline.count( '],[' ) + 1 if polyline != '[]' else 0
+            out.write( '"{:d}{:d}","{:s}","{:s}","{:s}","{:d}","{:d}","A","{:s}","{:s}"\n'.format(
+                    stamp, taxi, callType, originCall, originStand, taxi,
+                    stamp, missing, polyline ))
+    return points
+
+# MAKE POLYLINE - Make up the POLYLINE text of one trip
+
+def makePolyline( rand ):
+    pick = rand.random()
+    if pick < 0.03:
+        count = rand.randint( 0, 2 )
+    else:
+        count = int( rand.lognormvariate( 3.7, 0.65 )) + 1
+    lon = -8.61 + rand.gauss( 0, 0.025 )
+    lat = 41.155 + rand.gauss( 0, 0.018 )
+    heading = rand.uniform( 0, 2*math.pi )
+    # speed in degrees of latitude per 15 seconds; 0.001 is about 110 m
+    cruise = 0 if pick > 0.99 else rand.uniform( 0.0003, 0.0015 )
+    waypoints = [ ]
+    for jx in range( count ):
+        waypoints.append( "[{:.6f},{:.6f}]".format( lon, lat ))
+        heading += rand.gauss( 0, 0.35 )
+        step = cruise * rand.uniform( 0.2, 1.4 )
+        if rand.random() < 0.001:
+            step = 0.02   # GPS jump
+        lon += step * math.cos( heading ) / 0.753
+        lat += step * math.sin( heading )
+    if waypoints and rand.random() < 0.0002:
+        waypoints[ len(waypoints)//2 ] = "[-8.6x,41.1]"
+    return "[" + ",".join( waypoints ) + "]"
+
+if __name__ == "__main__":
+    trips = int( sys.argv[2] ) if len(sys.argv) > 2 else 100000
+    seed = int( sys.argv[3] ) if len(sys.argv) > 3 else 136
+    points = writeTrips( sys.argv[1], trips, seed )
+    print( "Wrote {:d} trips, {:d} points".format( trips, points ))
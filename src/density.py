@@ -0,0 +1,184 @@
+# DENSITY - Destination-density tables by start cell, hour and day type - Python
+#
+# A cheap prior for the destination of a trip: for each start cell (of a
+# grid as in gridindex.py), hour-of-day bucket (DAY_HOUR) and type of day
+# (DAY_BUSY: WD, WE or HOL, as from decodestamp), a histogram of the cells
+# where the accepted trips of the data finished. Looking up a trip's
+# histogram is two binary searches, instead of a kNN search of every row.
+#
+# Main functions:
+#     buildDensity - read a data file in one pass and write (or add to)
+#         a density table file
+#     DensityBranch - pipeline branch that builds a table, for building it
+#         in the same pass as prepare (see pipeline.run)
+#     loadDensity - load a density table file
+#     DensityTable.lookup - finish cells and counts for a trip start
+#     DensityTable.merge - add the counts of another table
+#
+# The table is kept as sparse sorted arrays: one entry per (group, finish
+# cell) with a count, where the group number packs the start cell, hour
+# bucket and day type. Tables made from different data with the same cell
+# size and hour step can be merged, so new months of data are added to a
+# table without reading the old ones again.
+#
+# Sample use:
+#
+# >>> table = buildDensity( 'D:/CKME 136/Taxi/train.csv', 'density.npz' )
+# >>> table = buildDensity( 'new-month.csv', 'density.npz', update=True )
+# >>> (lons, lats, counts) = table.lookup( -8.6106, 41.1459, 1372636858 )
+
+import os
+
+import numpy as np
+
+import illume
+import pipeline
+import gridindex
+
+# Day types, numbered as kept in the table
+BusyTypes = ( 'WD', 'WE', 'HOL' )
+
+# DENSITY TABLE - A destination-density table loaded in memory
+#
+# Parameters:
+#    arrays - dictionary of table arrays:
+#        cellSize - grid cell size in metres
+#        hourStep - width of an hour bucket in hours
+#        groups - int64, group number of each entry, in order
+#        finishes - int64, finish cell key of each entry (in order
+#            within a group)
+#        counts - int64, number of trips of each entry
+#
+# Methods:
+#    groupOf(lon, lat, stamp) - group number of a trip start
+#    lookup(lon, lat, stamp) - finish cell centres and counts of its group
+#    merge(other) - a table with the counts of both tables
+#    save(fileName) - write the table to an .npz file
+
+class DensityTable:
+
+    def __init__( self, arrays ):
+        self.cellSize = float( arrays['cellSize'] )
+        self.hourStep = float( arrays['hourStep'] )
+        self.buckets = int( np.ceil( 24 / self.hourStep ))
+        self.grid = gridindex.GridIndex( { 'cellSize': self.cellSize } )
+        self.groups = arrays['groups']
+        self.finishes = arrays['finishes']
+        self.counts = arrays['counts']
+
+    def __len__( self ):
+        return len(self.groups)
+
+    def trips( self ):
+        return int( self.counts.sum() )
+
+    def groupOf( self, lon, lat, stamp ):
+        timeinfo = illume.decodestamp( stamp )
+        bucket = min( self.buckets-1, int( (timeinfo[4]-4) // self.hourStep ))
+        busy = BusyTypes.index( timeinfo[3] )
+        return (int( self.grid.keyOf( lon, lat )) * self.buckets + bucket) * 3 + busy
+
+    def lookup( self, lon, lat, stamp ):
+        group = self.groupOf( lon, lat, stamp )
+        first = self.groups.searchsorted( group, side='left' )
+        last = self.groups.searchsorted( group, side='right' )
+        (lons, lats) = self.grid.centreOf( self.finishes[first:last] )
+        return lons, lats, self.counts[first:last]
+
+    def merge( self, other ):
+        if (other.cellSize, other.hourStep) != (self.cellSize, self.hourStep):
+            raise ValueError( "cannot merge density tables of different grids" )
+        return DensityTable( _reduce( self.cellSize, self.hourStep,
+                np.concatenate(( self.groups, other.groups )),
+                np.concatenate(( self.finishes, other.finishes )),
+                np.concatenate(( self.counts, other.counts )) ))
+
+    def save( self, fileName ):
+        with open( fileName, 'wb' ) as out:
+            np.savez( out, cellSize=np.float64( self.cellSize ),
+                    hourStep=np.float64( self.hourStep ),
+                    groups=self.groups, finishes=self.finishes, counts=self.counts )
+
+# DENSITY BRANCH - Pipeline branch that builds a density table
+#
+# Parameters:
+#    densName - name of the table file to write
+#    cellSize - grid cell size in metres
+#    hourStep - width of an hour bucket in hours
+#    update - True => add to the table already in 'densName', if any
+#
+# Only trips that prepare accepts are counted. After the run, 'table'
+# holds the table written.
+
+class DensityBranch( pipeline.Branch ):
+
+    resumable = False
+
+    def __init__( self, densName, cellSize=500, hourStep=1, update=False ):
+        pipeline.Branch.__init__( self, densName, None, None )
+        self.cellSize = cellSize
+        self.hourStep = hourStep
+        self.update = update
+        self.table = None
+
+    def begin( self, labels ):
+        self.table = DensityTable( _reduce( self.cellSize, self.hourStep,
+                np.zeros( 0, np.int64 ), np.zeros( 0, np.int64 ), np.zeros( 0, np.int64 )))
+        self.starts = [ ]
+        self.finishes = [ ]
+
+    def feed( self, trips ):
+        trips = pipeline.acceptTrips( pipeline.judgeTrips( pipeline.parseTrips( trips )))
+        for trip in trips:
+            (start, finish) = trip.waypoints[0], trip.waypoints[-1]
+            self.starts.append( self.table.groupOf( start[0], start[1], trip.line[5] ))
+            self.finishes.append( (finish[0], finish[1]) )
+            self.rows += 1
+
+    def end( self, count ):
+        finishes = np.array( self.finishes, dtype=np.float64 ).reshape( -1, 2 )
+        table = DensityTable( _reduce( self.cellSize, self.hourStep,
+                np.array( self.starts, dtype=np.int64 ),
+                self.table.grid.keyOf( finishes[:,0], finishes[:,1] ),
+                np.ones( len(finishes), dtype=np.int64 )))
+        self.starts = self.finishes = None
+        if self.update and os.path.exists( self.fileName ):
+            table = loadDensity( self.fileName ).merge( table )
+        table.save( self.fileName )
+        self.table = table
+
+# BUILD DENSITY - Read a data file in one pass and write its density table
+#
+# Parameters:
+#    fileName - name of input file of taxi data
+#    densName - name of the table file to write
+#    cellSize, hourStep, update - as for DensityBranch
+#    hasHead - True => the input file has a header row
+#
+# Result:
+#    The DensityTable written
+
+def buildDensity( fileName, densName, cellSize=500, hourStep=1,
+                  update=False, hasHead=True ):
+    branch = DensityBranch( densName, cellSize, hourStep, update )
+    pipeline.run( fileName, [ branch ], hasHead=hasHead )
+    return branch.table
+
+# LOAD DENSITY - Load a density table file
+
+def loadDensity( densName ):
+    with np.load( densName ) as saved:
+        return DensityTable( { name: saved[name] for name in saved.files } )
+
+# Sort (group, finish) pairs and add up the counts of equal pairs
+
+def _reduce( cellSize, hourStep, groups, finishes, counts ):
+    order = np.lexsort(( finishes, groups ))
+    (groups, finishes, counts) = groups[order], finishes[order], counts[order]
+    if len(groups) > 0:
+        heads = np.flatnonzero( np.concatenate(( [ True ],
+                (groups[1:] != groups[:-1]) | (finishes[1:] != finishes[:-1]) )))
+        (groups, finishes) = groups[heads], finishes[heads]
+        counts = np.add.reduceat( counts, heads )
+    return { 'cellSize': cellSize, 'hourStep': hourStep,
+             'groups': groups, 'finishes': finishes, 'counts': counts }
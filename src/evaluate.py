@@ -0,0 +1,200 @@
+# EVALUATE - Grid evaluation of kNN settings on prepared data - Python
+#
+# Python version of the trials of example.knn.run.R: runs a kNN model
+# (knn.py) over a grid of settings on a prepared training set and test
+# set, and reports the prediction error of each. Where the R code runs
+# taxi.knn one test row and one setting at a time, here:
+#     - settings with the same weights and scale share one model, and one
+#       neighbour search for the largest k; each smaller k uses the first
+#       k columns of that search
+#     - errors are computed for all test rows at once with
+#       geoarray.haverdistArray (the haverdist of illume, in km, as the
+#       DIST_ERROR column of knn.KnnModel.predict)
+#     - the (weights, scale) groups run in parallel, one per process; each
+#       process searches with one thread, so that the processes do not
+#       each start a thread per core (with one process, the search uses
+#       them all)
+#
+# The report has, for each setting and for each SNAP_TIME of the test set
+# (and for all of them together, SNAP_TIME 'ALL'), the number of test rows
+# and the mean and median error, with the time the setting took:
+#     SECONDS - its own work: combining its neighbours and the errors
+#     SHARED_SECONDS - building the model and searching for the largest k,
+#         shared by the settings of its group
+#
+# Command use:
+#
+#     python src/evaluate.py train test [--k 5 10 30] [--weights FILE]
+#         [--scale yes|no|both] [--workers N] [--out report.csv]
+#
+# The weights file is JSON, { name: { column label: weight, ... }, ... };
+# with none, the sets of WeightSets are tried. train and test may be CSV
+# files of prepare, or columnar outputs (see writers.py).
+#
+# Sample use:
+#
+# >>> results = evaluate( loadSet( 'prepared.100k.csv' ), loadSet( 'prepared.10x.csv' ),
+# ...         ks=(10, 30), weightSets=WeightSets, scales=(True,) )
+# >>> writeReport( 'report.csv', results )
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import geoarray
+import knn
+
+# Weight sets tried when none are given: the default of taxi.knn.trial,
+# and the weights of example.knn.run.R
+WeightSets = {
+    'default': knn.DefaultWeights,
+    'example': {
+        'LON_START': 5.0, 'LAT_START': 5.0,
+        'LON_3P': 2.0, 'LAT_3P': 2.0,
+        'LON_2P': 3.0, 'LAT_2P': 3.0,
+        'LON_1P': 4.5, 'LAT_1P': 4.5,
+        'LON_00': 6.75, 'LAT_00': 6.75 } }
+
+ReportLabels = [ 'WEIGHTS', 'SCALE', 'K', 'SNAP_TIME', 'COUNT',
+                 'MEAN_ERROR', 'MEDIAN_ERROR', 'SECONDS', 'SHARED_SECONDS' ]
+
+# LOAD SET - Load a prepared data set, CSV or columnar
+
+def loadSet( fileName ):
+    if os.path.isdir( fileName ) or not fileName.lower().endswith( '.csv' ):
+        import writers
+        return writers.loadColumns( fileName )
+    return knn.loadPrepared( fileName )
+
+# EVALUATE - Run a grid of kNN settings
+#
+# Parameters:
+#    train, test - dictionaries of column arrays, as from loadSet
+#    ks - numbers of neighbours to try
+#    weightSets - dictionary of name => weights, as for knn.KnnModel
+#    scales - values of 'scale' to try
+#    workers - number of processes, 0 or None => one per CPU core
+#
+# Result:
+#    List of one dictionary per setting, in grid order (weights, scale,
+#    k), with the ReportLabels of its rows in 'rows'
+
+def evaluate( train, test, ks=(10,), weightSets=None, scales=(True,), workers=0 ):
+    weightSets = WeightSets if weightSets is None else weightSets
+    ks = sorted( set( ks ))
+    groups = [ (name, weights, scale, ks)
+               for (name, weights) in weightSets.items() for scale in scales ]
+    workers = min( workers or os.cpu_count() or 1, len(groups) )
+    if workers <= 1:
+        _useSets( train, test )
+        done = [ _evaluateGroup( group + (-1,) ) for group in groups ]
+    else:
+        with multiprocessing.Pool( workers, _useSets, (train, test) ) as pool:
+            done = pool.map( _evaluateGroup, [ group + (1,) for group in groups ])
+    return [ result for results in done for result in results ]
+
+# ERRORS BY SNAP - Mean and median error for each snapshot time
+#
+# Result:
+#    Tuple of arrays, one entry per distinct snapshot time, in order:
+#    snapshot times, counts, mean errors, median errors
+
+def errorsBySnap( snaps, errors ):
+    (times, groups, counts) = np.unique( snaps, return_inverse=True, return_counts=True )
+    means = np.bincount( groups, weights=errors, minlength=len(times) ) / counts
+    order = np.lexsort(( errors, groups ))
+    sortedErrors = errors[order]
+    starts = np.concatenate(( [ 0 ], np.cumsum( counts )[:-1] ))
+    # middle one, or mean of the middle two, of each group
+    medians = (sortedErrors[starts + (counts-1)//2] + sortedErrors[starts + counts//2]) / 2
+    return times, counts, means, medians
+
+# WRITE REPORT - Write the result of evaluate as a CSV file
+
+def writeReport( fileName, results ):
+    with open( fileName, 'w', newline='' ) as out:
+        table = csv.writer( out, lineterminator='\n' )
+        table.writerow( ReportLabels )
+        for result in results:
+            for row in result['rows']:
+                table.writerow( [ row[label] for label in ReportLabels ])
+
+# PRINT SUMMARY - Print one line per setting: overall errors and times
+
+def printSummary( results ):
+    print( "{:>10s} {:>5s} {:>4s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}".format(
+            'weights', 'scale', 'k', 'rows', 'mean km', 'med km', 'secs', 'shared' ))
+    for result in results:
+        row = result['rows'][0]
+        print( "{:>10s} {:>5s} {:4d} {:8d} {:8.3f} {:8.3f} {:8.3f} {:8.3f}".format(
+                row['WEIGHTS'], str(row['SCALE']), row['K'], row['COUNT'],
+                row['MEAN_ERROR'], row['MEDIAN_ERROR'],
+                row['SECONDS'], row['SHARED_SECONDS'] ))
+
+# The data sets of a process, set once per process rather than per job
+
+_sets = { }
+
+def _useSets( train, test ):
+    _sets['train'] = train
+    _sets['test'] = test
+
+# Evaluate all the k values of one (weights, scale) group, searching with
+# 'threads' threads (-1 => one per CPU core)
+
+def _evaluateGroup( group ):
+    (name, weights, scale, ks, threads) = group
+    (train, test) = _sets['train'], _sets['test']
+    began = time.perf_counter()
+    model = knn.KnnModel( train, weights, scale )
+    (gaps, nearests) = model.neighbours( test, max( ks ), threads )
+    shared = time.perf_counter() - began
+    actLon = np.asarray( test[model.target[0]], dtype=np.float64 )
+    actLat = np.asarray( test[model.target[1]], dtype=np.float64 )
+    snaps = np.asarray( test['SNAP_TIME'], dtype=np.float64 )
+    results = [ ]
+    for k in ks:
+        began = time.perf_counter()
+        k = min( k, gaps.shape[1] )
+        prediction = model.combine( gaps[:,:k], nearests[:,:k] )
+        errors = geoarray.haverdistArray( actLon, actLat, prediction[:,0], prediction[:,1] ) / 1000
+        (times, counts, means, medians) = errorsBySnap( snaps, errors )
+        seconds = time.perf_counter() - began
+        setting = { 'WEIGHTS': name, 'SCALE': scale, 'K': k,
+                    'SECONDS': seconds, 'SHARED_SECONDS': shared }
+        rows = [ dict( setting, SNAP_TIME='ALL', COUNT=len(errors),
+                       MEAN_ERROR=float( errors.mean() ) if len(errors) else np.nan,
+                       MEDIAN_ERROR=float( np.median( errors )) if len(errors) else np.nan ) ]
+        for (snap, count, mean, median) in zip( times, counts, means, medians ):
+            rows.append( dict( setting, SNAP_TIME=float( snap ), COUNT=int( count ),
+                               MEAN_ERROR=float( mean ), MEDIAN_ERROR=float( median )))
+        results.append( { 'weights': name, 'scale': scale, 'k': k, 'rows': rows } )
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( prog='evaluate',
+            description="Evaluate a grid of kNN settings on prepared data" )
+    parser.add_argument( 'train' )
+    parser.add_argument( 'test' )
+    parser.add_argument( '--k', type=int, nargs='+', default=[ 10 ] )
+    parser.add_argument( '--weights', help="JSON file of named weight sets" )
+    parser.add_argument( '--scale', choices=( 'yes', 'no', 'both' ), default='yes' )
+    parser.add_argument( '--workers', type=int, default=0 )
+    parser.add_argument( '--out', help="CSV file to write the report to" )
+    args = parser.parse_args()
+    weightSets = None
+    if args.weights:
+        with open( args.weights, 'r' ) as source:
+            weightSets = json.load( source )
+    scales = { 'yes': (True,), 'no': (False,), 'both': (True, False) }[args.scale]
+    results = evaluate( loadSet( args.train ), loadSet( args.test ),
+            args.k, weightSets, scales, args.workers )
+    printSummary( results )
+    if args.out:
+        writeReport( args.out, results )
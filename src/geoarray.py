@@ -0,0 +1,251 @@
+# GEOARRAY - Batched waypoint engine for Porto taxi-trip data - Python
+#
+# Array versions of the waypoint functions in illume.py. Instead of one
+# tuple and one 'math' call per waypoint, a POLYLINE (or a whole chunk
+# of POLYLINE texts) is turned into contiguous float64 longitude and
+# latitude arrays, and the segment distance and heading of every step
+# are computed as NumPy array operations.
+#
+# Main functions:
+#     polylineArrays - longitude/latitude arrays for one POLYLINE
+#     polylineChunk - longitude/latitude/offsets arrays for many POLYLINEs
+#     segmentArrays - distance/heading arrays, same rules as parseWaypoints
+#     waypointArrays - all four waypoint arrays for one POLYLINE
+#     parseWaypoints - drop-in replacement for illume.parseWaypoints
+#     waypointLists - illume.parseWaypoints of many POLYLINEs at once, as
+#         used by the pipeline of prepare and summarize
+#
+# The distance and heading arrays follow geodist and geodir operation by
+# operation, so they are the same numbers, bit for bit. NumPy's own
+# cosine and arctan2 may round one unit in the last place differently
+# from the math library, so those two are taken from 'math' (mapped over
+# the arrays); the rest (+, -, *, /, sqrt) is rounded the same either way.
+#
+# Sample use:
+#
+# >>> lon, lat, dist, head = waypointArrays( '[[-8.61,41.14],[-8.62,41.15]]' )
+
+import math
+import warnings
+from math import pi
+
+import numpy as np
+
+import illume
+
+# POLYLINE ARRAYS - Longitude and latitude arrays of one POLYLINE text
+#
+# Parameters:
+#    text - list of waypoints in format [[lon0,lat0],[lon1,lat1],...]
+#    strict - True => raise ValueError if the text is not well formed
+#
+# Result:
+#    Tuple of two float64 arrays: longitudes, latitudes
+#
+# Well-formed text is parsed in one call. Text that does not have the
+# exact [[lon,lat],...] shape is handed to illume.parseWaypoints, so that
+# bad points come out as 0,0 just as they do in the scalar parser (and
+# the text is printed), unless 'strict'.
+
+def polylineArrays( text, strict=False ):
+    body, count = _polylineBody( text )
+    values = _parseValues( body, count )
+    if values is None and strict:
+        raise ValueError( "polyline must be a list of [lon, lat] pairs" )
+    if values is None:
+        return _scalarArrays( text )
+    return values[0::2].copy(), values[1::2].copy()
+
+# POLYLINE CHUNK - Longitude, latitude and offsets arrays of many POLYLINEs
+#
+# Parameter:
+#    texts - sequence of POLYLINE texts, e.g. one column of a chunk of rows
+#
+# Result:
+#    Tuple of three arrays:
+#        longitudes - float64, the waypoints of all trips back to back
+#        latitudes - float64, same layout as longitudes
+#        offsets - int64, len(texts)+1 entries; trip i has the waypoints
+#            offsets[i] up to (but not including) offsets[i+1]
+#
+# The whole chunk is parsed with a single conversion call. If any text
+# in the chunk is malformed, each half of the chunk is parsed in the same
+# way, and so on down to the malformed texts, which are parsed by
+# polylineArrays; so a chunk with a few bad texts still takes only a few
+# calls.
+
+def polylineChunk( texts ):
+    lons, lats, counts = [ ], [ ], [ ]
+    _chunkArrays( list( texts ), lons, lats, counts )
+    offsets = np.zeros( len(counts)+1, dtype=np.int64 )
+    np.cumsum( counts, out=offsets[1:] )
+    return (np.concatenate( lons ) if lons else np.zeros( 0 ),
+            np.concatenate( lats ) if lats else np.zeros( 0 ),
+            offsets)
+
+# SEGMENT ARRAYS - Distance and heading of each step along the waypoints
+#
+# Parameters:
+#    lon, lat - float64 arrays of waypoint positions
+#    offsets - optional trip boundaries as returned by polylineChunk;
+#        None => all the waypoints belong to one trip
+#
+# Result:
+#    Tuple of two float64 arrays, one entry per waypoint:
+#        distance - metres from the prior waypoint, as by geodist
+#        heading - degrees from the prior waypoint, as by geodir
+#
+# As in parseWaypoints, the first waypoint of each trip, and any waypoint
+# that follows a 0,0 waypoint, has a distance and heading of 0.
+
+def segmentArrays( lon, lat, offsets=None ):
+    size = len(lon)
+    lastLon = np.empty( size )
+    lastLat = np.empty( size )
+    if size == 0:
+        return lastLon, lastLat
+    lastLon[0], lastLat[0] = 0, 0
+    lastLon[1:], lastLat[1:] = lon[:-1], lat[:-1]
+    if offsets is not None:
+        starts = offsets[:-1]
+        starts = starts[ starts < size ]
+        lastLon[starts], lastLat[starts] = 0, 0
+    valid = (lastLon != 0) & (lastLat != 0)
+    latFactor = _mapped( math.cos, ((lat+lastLat)/2) * (pi/180) )
+    lonDelta = (lon - lastLon) * latFactor
+    latDelta = lat - lastLat
+    distance = np.sqrt( lonDelta*lonDelta + latDelta*latDelta ) * 6371000*(pi/180)
+    heading = _mapped( math.atan2, latDelta, lonDelta ) * 180/pi
+    distance[~valid] = 0
+    heading[~valid] = 0
+    return distance, heading
+
+# WAYPOINT ARRAYS - All four waypoint arrays of one POLYLINE text
+#
+# Result:
+#    Tuple of four float64 arrays: longitude, latitude, distance, heading.
+#    Entry i of each array is field 0..3 of tuple i from parseWaypoints.
+
+def waypointArrays( text ):
+    lon, lat = polylineArrays( text )
+    distance, heading = segmentArrays( lon, lat )
+    return lon, lat, distance, heading
+
+# PARSE WAYPOINTS - Compatibility wrapper with the result of illume's version
+#
+# Returns the same list of (longitude, latitude, distance, heading) tuples
+# as illume.parseWaypoints, computed with the array engine.
+
+def parseWaypoints( text ):
+    return list( zip( *( array.tolist() for array in waypointArrays( text ))))
+
+# WAYPOINT LISTS - parseWaypoints of many POLYLINE texts
+#
+# Result:
+#    List of one list of waypoint tuples per text, each the same as the
+#    result of illume.parseWaypoints (in the 'precise' mode); a text that
+#    is not well formed is printed, as by illume.parseWaypoints
+
+def waypointLists( texts ):
+    (lon, lat, offsets) = polylineChunk( texts )
+    (distance, heading) = segmentArrays( lon, lat, offsets )
+    points = list( zip( lon.tolist(), lat.tolist(), distance.tolist(), heading.tolist() ))
+    offsets = offsets.tolist()
+    return [ points[first:last] for (first, last) in zip( offsets[:-1], offsets[1:] )]
+
+# GEO DIST ARRAY - geodist for arrays of points (or mixed arrays and scalars)
+
+def geodistArray( lon1, lat1, lon2, lat2 ):
+    latFactor = np.cos( ((lat1+lat2)/2) * (pi/180) )
+    radius = 6371000
+    lonDelta = (lon1 - lon2) * latFactor
+    latDelta = lat1 - lat2
+    return np.sqrt( lonDelta*lonDelta + latDelta*latDelta ) * radius*(pi/180)
+
+# GEO DIR ARRAY - geodir for arrays of points (or mixed arrays and scalars)
+
+def geodirArray( lon1, lat1, lon2, lat2 ):
+    latFactor = np.cos( ((lat1+lat2)/2) * (pi/180) )
+    lonDelta = (lon1 - lon2) * latFactor
+    latDelta = lat1 - lat2
+    return np.arctan2( latDelta, lonDelta ) * 180/pi
+
+# HAVER DIST ARRAY - haverdist for arrays of points (or mixed arrays and scalars)
+
+def haverdistArray( lon1, lat1, lon2, lat2 ):
+    radius = 6371000
+    lon1, lat1 = lon1*pi/180, lat1*pi/180
+    lon2, lat2 = lon2*pi/180, lat2*pi/180
+    sinLat = np.sin( (lat1-lat2)/2 )
+    sinLon = np.sin( (lon1-lon2)/2 )
+    haver = sinLat*sinLat + np.cos(lat1)*np.cos(lat2)*sinLon*sinLon
+    return 2*radius*np.arcsin( np.sqrt( haver ))
+
+# Helpers for the parsers above.
+#
+# _polylineBody strips the outer brackets exactly as parseWaypoints does
+# and counts the waypoints. _parseValues converts a body of 'count'
+# waypoints into a flat lon,lat,lon,lat,... array, or returns None if the
+# body is not a clean alternation of 'lon,lat' and '],[' separators.
+
+_COMMA, _SEMI = ord(','), ord(';')
+
+# Add the arrays and waypoint counts of some texts to lons, lats, counts
+
+def _chunkArrays( texts, lons, lats, counts ):
+    bodies = [ ]
+    sizes = [ ]
+    for text in texts:
+        body, count = _polylineBody( text )
+        if count > 0:
+            bodies.append( body )
+        sizes.append( count )
+    values = _parseValues( '],['.join(bodies), sum( sizes ))
+    if values is not None:
+        lons.append( values[0::2] )
+        lats.append( values[1::2] )
+        counts.extend( sizes )
+    elif len(texts) == 1:
+        lon, lat = polylineArrays( texts[0] )
+        lons.append( lon )
+        lats.append( lat )
+        counts.append( len(lon) )
+    else:
+        half = len(texts) // 2
+        _chunkArrays( texts[:half], lons, lats, counts )
+        _chunkArrays( texts[half:], lons, lats, counts )
+
+def _polylineBody( text ):
+    body = text .lstrip('[') .rstrip(']')
+    return body, (body.count('],[') + 1 if body else 0)
+
+def _parseValues( body, count ):
+    if count == 0:
+        return np.zeros( 0 )
+    body = body.replace( '],[', ';' )
+    raw = np.frombuffer( body.encode(), dtype=np.uint8 )
+    delims = raw[ (raw == _COMMA) | (raw == _SEMI) ]
+    if (len(delims) != 2*count-1
+    or (delims[0::2] != _COMMA).any()
+    or (delims[1::2] != _SEMI).any()):
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter( 'ignore', DeprecationWarning )
+            values = np.fromstring( body.replace(';', ','), sep=',' )
+    except ValueError:
+        return None
+    if len(values) != 2*count:
+        return None
+    return values
+
+# A math function of one or two arguments, for each entry of arrays
+
+def _mapped( function, *arrays ):
+    return np.fromiter( map( function, *( array.tolist() for array in arrays )),
+            dtype=np.float64, count=len(arrays[0]) )
+
+def _scalarArrays( text ):
+    waypoints = illume.parseWaypoints( text )
+    return (np.array( [ p[0] for p in waypoints ], dtype=np.float64 ),
+            np.array( [ p[1] for p in waypoints ], dtype=np.float64 ))
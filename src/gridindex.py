@@ -0,0 +1,225 @@
+# GRIDINDEX - Spatial grid index of trip start, snapshot and finish points - Python
+#
+# Answers "which trips started (or passed, or ended) near this point"
+# without scanning the taxi data file. The Porto area is cut into square
+# cells of a given size in metres, using the same equirectangular
+# approximation as geodist, with the longitude factor fixed at the
+# latitude of Porto. For each kind of point - 'start', 'snap' (each
+# prepare snapshot point) and 'finish' - the index lists the trips with a
+# point in each cell, along with the point itself, so that cell lookups
+# can be narrowed to an exact radius or box.
+#
+# Trips are identified by entry number in the data file (from 1), as in
+# the TRIP_ID column of prepare output and in tripindex.py.
+#
+# Main functions:
+#     buildGrid - read a data file in one pass and write its grid index
+#     GridBranch - pipeline branch that builds the index, for building it
+#         in the same pass as other outputs (see pipeline.run)
+#     loadGrid - load a grid index file
+#     GridIndex.radius, GridIndex.box - trips with points near a place
+#
+# On disk the index is an .npz file holding, for each kind of point, the
+# occupied cell keys in order, where each cell's points start, and the
+# points' entry numbers (uint32) and coordinates (float32, to about 10 cm).
+#
+# Sample use:
+#
+# >>> grid = buildGrid( 'D:/CKME 136/Taxi/train.csv', 'train.grid.npz', cellSize=200 )
+# >>> grid.radius( 'start', -8.6106, 41.1459, 300 )
+# >>> grid.box( 'finish', -8.62, 41.14, -8.60, 41.15 )
+
+from math import cos, pi
+
+import numpy as np
+
+import illume
+import geoarray
+import pipeline
+
+Kinds = ( 'start', 'snap', 'finish' )
+
+# Reference point of the grid: cell (0,0) has its corner here
+LonOrigin, LatOrigin = -8.61, 41.155
+LonFactor = cos( LatOrigin*pi/180 )
+MetresPerDegree = 6371000 * pi/180
+
+# Cell numbers run from -CellOffset to CellOffset-1 each way
+CellOffset = 1 << 20
+
+# GRID INDEX - A grid index loaded in memory
+#
+# Parameters:
+#    arrays - dictionary of index arrays, as saved by GridBranch
+#
+# Methods:
+#    cellOf(lon, lat) - cell numbers (x, y) of a point
+#    keyOf(lon, lat) - cell key of a point, as kept in the index
+#    centreOf(keys) - longitude and latitude of the centres of cells
+#    cell(kind, lon, lat) - entries with a point in the cell of a point
+#    box(kind, lonMin, latMin, lonMax, latMax) - entries with a point in a box
+#    radius(kind, lon, lat, metres) - entries with a point within a
+#        geodist distance of a point
+#
+# Query results are sorted arrays of distinct entry numbers.
+
+class GridIndex:
+
+    def __init__( self, arrays ):
+        self.cellSize = float( arrays['cellSize'] )
+        self.arrays = arrays
+        self.lonStep = self.cellSize / (MetresPerDegree * LonFactor)
+        self.latStep = self.cellSize / MetresPerDegree
+
+    def __len__( self ):
+        return len(self.arrays['startEntries'])
+
+    def cellOf( self, lon, lat ):
+        x = np.floor( (np.asarray( lon ) - LonOrigin) / self.lonStep )
+        y = np.floor( (np.asarray( lat ) - LatOrigin) / self.latStep )
+        x = np.clip( x, -CellOffset, CellOffset-1 ).astype( np.int64 )
+        y = np.clip( y, -CellOffset, CellOffset-1 ).astype( np.int64 )
+        return x, y
+
+    def keyOf( self, lon, lat ):
+        (x, y) = self.cellOf( lon, lat )
+        return _cellKey( x, y )
+
+    def centreOf( self, keys ):
+        (y, x) = np.divmod( np.asarray( keys, dtype=np.int64 ), 2*CellOffset )
+        lon = LonOrigin + (x - CellOffset + 0.5) * self.lonStep
+        lat = LatOrigin + (y - CellOffset + 0.5) * self.latStep
+        return lon, lat
+
+    def cell( self, kind, lon, lat ):
+        (x, y) = self.cellOf( lon, lat )
+        picks = self._cells( kind, int(x), int(x), int(y), int(y) )
+        return np.unique( self.arrays[kind+'Entries'][picks] )
+
+    def box( self, kind, lonMin, latMin, lonMax, latMax ):
+        (x0, y0) = self.cellOf( lonMin, latMin )
+        (x1, y1) = self.cellOf( lonMax, latMax )
+        picks = self._cells( kind, int(x0), int(x1), int(y0), int(y1) )
+        lon = self.arrays[kind+'Lon'][picks].astype( np.float64 )
+        lat = self.arrays[kind+'Lat'][picks].astype( np.float64 )
+        inside = (lon >= lonMin) & (lon <= lonMax) & (lat >= latMin) & (lat <= latMax)
+        return np.unique( self.arrays[kind+'Entries'][picks[inside]] )
+
+    def radius( self, kind, lon, lat, metres ):
+        latSpan = metres / MetresPerDegree
+        # widest longitude span over the rows covered
+        lonSpan = latSpan / cos( min( 89.0, abs(lat) + latSpan ) * pi/180 )
+        (x0, y0) = self.cellOf( lon-lonSpan, lat-latSpan )
+        (x1, y1) = self.cellOf( lon+lonSpan, lat+latSpan )
+        picks = self._cells( kind, int(x0), int(x1), int(y0), int(y1) )
+        dist = geoarray.geodistArray(
+                self.arrays[kind+'Lon'][picks].astype( np.float64 ),
+                self.arrays[kind+'Lat'][picks].astype( np.float64 ), lon, lat )
+        return np.unique( self.arrays[kind+'Entries'][picks[dist <= metres]] )
+
+    # Positions of the points in the cells x0..x1 by y0..y1; each row of
+    # cells has consecutive keys, so takes two binary searches per row.
+
+    def _cells( self, kind, x0, x1, y0, y1 ):
+        keys = self.arrays[kind+'Keys']
+        starts = self.arrays[kind+'Starts']
+        rows = np.arange( y0, y1+1, dtype=np.int64 )
+        first = np.searchsorted( keys, _cellKey( x0, rows ), side='left' )
+        last = np.searchsorted( keys, _cellKey( x1, rows ), side='right' )
+        picks = [ np.arange( starts[a], starts[b] )
+                  for (a, b) in zip( first.tolist(), last.tolist() ) if b > a ]
+        return np.concatenate( picks ) if picks else np.zeros( 0, dtype=np.int64 )
+
+# GRID BRANCH - Pipeline branch that builds a grid index
+#
+# Parameters:
+#    gridName - name of the index file to write
+#    cellSize - width of a cell in metres
+#    delta - snapshot frequency and lag step in minutes, as for prepare;
+#        only the frequency is used here
+#    accept - True => index only the trips prepare accepts;
+#        False => index every trip with waypoints
+#
+# After the run, 'grid' holds the built index as a GridIndex.
+
+class GridBranch( pipeline.Branch ):
+
+    resumable = False
+
+    def __init__( self, gridName, cellSize=200, delta=(2.5,2.5), accept=True ):
+        pipeline.Branch.__init__( self, gridName, None, None )
+        (_, _, self.wpFreq, _) = illume.prepareParams( (0,1), delta )
+        self.cellSize = cellSize
+        self.accept = accept
+        self.grid = None
+
+    def begin( self, labels ):
+        self.grid = GridIndex( { 'cellSize': self.cellSize } )
+        self.points = { kind: ([ ], [ ], [ ]) for kind in Kinds }
+
+    def feed( self, trips ):
+        trips = pipeline.parseTrips( trips )
+        if self.accept:
+            trips = pipeline.acceptTrips( pipeline.judgeTrips( trips ))
+        for trip in trips:
+            waypoints = trip.waypoints
+            if len(waypoints) == 0:
+                continue
+            for (kind, picks) in [ ('start', waypoints[0:1]),
+                                   ('snap', waypoints[0::self.wpFreq]),
+                                   ('finish', waypoints[-1:]) ]:
+                (entries, lons, lats) = self.points[kind]
+                for here in picks:
+                    entries.append( trip.count )
+                    lons.append( here[0] )
+                    lats.append( here[1] )
+            self.rows += 1
+
+    def end( self, count ):
+        arrays = { 'cellSize': np.float64( self.cellSize ) }
+        for kind in Kinds:
+            (entries, lons, lats) = self.points[kind]
+            lon = np.array( lons, dtype=np.float64 )
+            lat = np.array( lats, dtype=np.float64 )
+            keys = self.grid.keyOf( lon, lat )
+            order = np.argsort( keys, kind='stable' )
+            keys = keys[order]
+            (cellKeys, starts) = np.unique( keys, return_index=True )
+            arrays[kind+'Keys'] = cellKeys
+            arrays[kind+'Starts'] = np.append( starts, len(keys) ).astype( np.int64 )
+            arrays[kind+'Entries'] = np.array( entries, dtype=np.uint32 )[order]
+            arrays[kind+'Lon'] = lon[order].astype( np.float32 )
+            arrays[kind+'Lat'] = lat[order].astype( np.float32 )
+        self.points = None
+        with open( self.fileName, 'wb' ) as out:
+            np.savez( out, **arrays )
+        self.grid = GridIndex( arrays )
+
+# BUILD GRID - Read a data file in one pass and write its grid index
+#
+# Parameters:
+#    fileName - name of input file of taxi data
+#    gridName - name of the index file to write
+#    cellSize, delta, accept - as for GridBranch
+#    hasHead - True => the input file has a header row
+#
+# Result:
+#    The built GridIndex
+
+def buildGrid( fileName, gridName, cellSize=200, delta=(2.5,2.5),
+               accept=True, hasHead=True ):
+    branch = GridBranch( gridName, cellSize, delta, accept )
+    pipeline.run( fileName, [ branch ], hasHead=hasHead )
+    return branch.grid
+
+# LOAD GRID - Load a grid index file
+
+def loadGrid( gridName ):
+    with np.load( gridName ) as saved:
+        return GridIndex( { name: saved[name] for name in saved.files } )
+
+# Key of a cell: row-major, so each row of cells has consecutive keys
+
+def _cellKey( x, y ):
+    return (np.asarray( y, dtype=np.int64 ) + CellOffset) * (2*CellOffset) \
+            + (np.asarray( x, dtype=np.int64 ) + CellOffset)
@@ -11,17 +11,18 @@
 # Sample use:
 #
 # >>> illume( 'D:/CKME 136/Taxi/train.csv', 20 )
+#
+# Command use:
+#
+#     python illume.py illume train.csv --limit 20
+#     python illume.py prepare train.csv prepared.csv --delta 1 1
 
 import sys
 import csv
+import argparse
 from math import *
-import tkinter as tk
 import datetime as dt
 
-# GLOBAL CONSTANT
-
-COMMANDED = False   # Is this script run as a stand-alone command?
-
 # ILLUME - Display taxi data in human-comprehensible form
 #
 # Parameters:
@@ -31,6 +32,14 @@ COMMANDED = False   # Is this script run as a stand-alone command?
 #     start - if limit is not 0 => start printing at entry 'start'
 #     sample - if limit is not 0 => print only 1/sample entries
 #     hasHead - True => taxi data file has a header row
+#     tripId - print only the entry with this TRIP_ID
+#     taxiId - print only the entries of this TAXI_ID, up to 'limit' of
+#         them (0 => all of them)
+#     indexed - True => seek to the entries with the trip index (see
+#         tripindex.py) instead of reading the file from the top; implied
+#         by 'tripId' and 'taxiId'
+#     sampler - a sampler of samplers.py => print the entries it picks,
+#         instead of those of 'limit', 'start' and 'sample'
 #
 # Notes:
 #     Use 'limit=0' if you don't know how big the file is and just
@@ -40,8 +49,16 @@ COMMANDED = False   # Is this script run as a stand-alone command?
 #     for the data fields in the printed output. If there is no header row,
 #     then the data fields are labeled by position: 1, 2, 3, etc.
 
-def illume( filename, limit=10, start=0, sample=1, hasHead=True ):
-    source = open( filename, 'r' )
+def illume( filename, limit=10, start=0, sample=1, hasHead=True,
+            tripId=None, taxiId=None, indexed=False, sampler=None ):
+    if sampler and (indexed or tripId is not None or taxiId is not None):
+        raise Exception( "Cannot use a sampler with the trip index" )
+    if indexed or tripId is not None or taxiId is not None:
+        import tripindex
+        return tripindex.illumeIndexed( filename, limit, start, sample, hasHead,
+                tripId=tripId, taxiId=taxiId )
+    import sources
+    source = sources.openLines( filename )
     table = csv.reader( source )
     labels = [ ]
     labelwidth = 3
@@ -53,6 +70,10 @@ def illume( filename, limit=10, start=0, sample=1, hasHead=True ):
             labels = line
             labelwidth = max(( len(label) for label in labels ))
             labelwidth = max( 3, labelwidth )
+        elif sampler:
+            count += 1
+            if sampler.offer( count, line, line ):
+                printTrip( count, labels, line, labelwidth )
         else:
             count += 1
             if (limit != 0
@@ -61,45 +82,67 @@ def illume( filename, limit=10, start=0, sample=1, hasHead=True ):
             and (count-start)%sample == 0
             or limit == 0
             and isInteresting(count)):
-                print( "__", count, "_"*labelwidth, sep="" )
-                while len(labels) < len(line):
-                    labels .append( str(len(labels)+1) )
-                for (label,atom) in zip( labels, line ):
-                    if label == 'POLYLINE':
-                        waypoints = parseWaypoints( atom )
-                        printWaypoints( label, waypoints, indent=labelwidth )
-                        drivedist = sum( p[2] for p in waypoints )
-                        tripdist = geodist(
-                                waypoints[0][0], waypoints[0][1],
-                                waypoints[-1][0], waypoints[-1][1])
-                        triptime = max( 0, len(waypoints)-1 ) * 0.25
-                        print( '{:s}: {:6.3f} {:s}'.format(
-                                "ROUTE_LEN".rjust(labelwidth), drivedist/1000, 'km' ))
-                        print( '{:s}: {:6.3f} {:s}'.format(
-                                "TRIP_LEN".rjust(labelwidth), tripdist/1000, 'km' ))
-                        print( '{:s}: {:5.2f} {:s}'.format(
-                                "TRIP_TIME".rjust(labelwidth), triptime, 'min' ))
-                        print( '{:s}: {:4.1f} {:s}'.format(
-                                "AVG_SPEED".rjust(labelwidth),
-                                drivedist/triptime*(60/1000) if triptime!=0 else 0,
-                                'km/h' ))
-                        print( '{:s}: {:4.1f} {:s}'.format(
-                                "TRIP_SPEED".rjust(labelwidth),
-                                tripdist/triptime*(60/1000) if triptime!=0 else 0,
-                                'km/h' ))
-                    else:
-                        suffix = annotate( label, atom )
-                        if suffix != '':
-                            suffix = '  (' + suffix + ')'
-                        print( '{:s}: {:s}{:s}'.format(
-                                label.rjust(labelwidth), atom, suffix ))
-                print()
-        if limit != 0 and count >= finis: break
+                printTrip( count, labels, line, labelwidth )
+        if limit != 0 and count >= finis and not sampler: break
+    if sampler and not sampler.streaming:
+        for (count1, line) in sampler.chosen():
+            printTrip( count1, labels, line, labelwidth )
     if count > 0:
         print( "_" * (labelwidth+2) )
     source.close()
     return count
 
+# PRINT TRIP - Print one entry of taxi data in readable format
+#
+# Parameters:
+#     count - number of the entry in the file
+#     labels - field labels; extended with position numbers if too short
+#     line - list of data fields of the entry
+#     labelwidth - width of the label column
+#
+# The block of the entry is built by tripBlock and written with one call.
+
+def printTrip( count, labels, line, labelwidth ):
+    sys.stdout.write( tripBlock( count, labels, line, labelwidth ))
+
+# TRIP BLOCK - The printout of printTrip, as one string
+
+def tripBlock( count, labels, line, labelwidth ):
+    out = [ "__", str(count), "_"*labelwidth, "\n" ]
+    while len(labels) < len(line):
+        labels .append( str(len(labels)+1) )
+    for (label,atom) in zip( labels, line ):
+        if label == 'POLYLINE':
+            waypoints = parseWaypoints( atom )
+            out.append( waypointsBlock( label, waypoints, indent=labelwidth ))
+            drivedist = sum( p[2] for p in waypoints )
+            tripdist = 0 if len(waypoints)==0 else geodist(
+                    waypoints[0][0], waypoints[0][1],
+                    waypoints[-1][0], waypoints[-1][1])
+            triptime = max( 0, len(waypoints)-1 ) * 0.25
+            out.append( '{:s}: {:6.3f} {:s}\n'.format(
+                    "ROUTE_LEN".rjust(labelwidth), drivedist/1000, 'km' ))
+            out.append( '{:s}: {:6.3f} {:s}\n'.format(
+                    "TRIP_LEN".rjust(labelwidth), tripdist/1000, 'km' ))
+            out.append( '{:s}: {:5.2f} {:s}\n'.format(
+                    "TRIP_TIME".rjust(labelwidth), triptime, 'min' ))
+            out.append( '{:s}: {:4.1f} {:s}\n'.format(
+                    "AVG_SPEED".rjust(labelwidth),
+                    drivedist/triptime*(60/1000) if triptime!=0 else 0,
+                    'km/h' ))
+            out.append( '{:s}: {:4.1f} {:s}\n'.format(
+                    "TRIP_SPEED".rjust(labelwidth),
+                    tripdist/triptime*(60/1000) if triptime!=0 else 0,
+                    'km/h' ))
+        else:
+            suffix = annotate( label, atom )
+            if suffix != '':
+                suffix = '  (' + suffix + ')'
+            out.append( '{:s}: {:s}{:s}\n'.format(
+                    label.rjust(labelwidth), atom, suffix ))
+    out.append( "\n" )
+    return "".join( out )
+
 # RAW SAMPLE - Create a file with sample records of raw data
 #
 # Create a sample data file using a subset of entries from a source file.
@@ -111,9 +154,20 @@ def illume( filename, limit=10, start=0, sample=1, hasHead=True ):
 #         is 0 => write a selection of records from througout the file
 #     start - start extracting at this record
 #     hasHead - True => first row of file is a header, always copied to output
+#     indexed - True => seek to record 'start' with the trip index (see
+#         tripindex.py) instead of reading the file from the top
+#     sampler - a sampler of samplers.py => write the records it picks,
+#         instead of those of 'limit' and 'start'
 
-def rawsample( filename, samplename, limit=10, start=0, hasHead=True ):
-    source = open( filename, 'r' )
+def rawsample( filename, samplename, limit=10, start=0, hasHead=True,
+               indexed=False, sampler=None ):
+    if indexed and sampler:
+        raise Exception( "Cannot use a sampler with the trip index" )
+    if indexed:
+        import tripindex
+        return tripindex.rawsampleIndexed( filename, samplename, limit, start, hasHead )
+    import sources
+    source = sources.openLines( filename )
     sample = open( samplename, 'w' )
     finis = start + limit
     count = 0
@@ -122,12 +176,18 @@ def rawsample( filename, samplename, limit=10, start=0, hasHead=True ):
         if hasHead and not didHead:
             sample.write( line )
             didHead = True
+        elif sampler:
+            count += 1
+            if sampler.offer( count, next( csv.reader( [ line ] ), [ '' ] ), line ):
+                sample.write( line )
         else:
             if (limit != 0 and count >= start and count < finis
             or limit == 0 and isInteresting(count)):
                 sample.write( line )
             count += 1
-        if limit != 0 and count >= finis: break
+        if limit != 0 and count >= finis and not sampler: break
+    if sampler and not sampler.streaming:
+        sample.writelines( line for (count1, line) in sampler.chosen() )
     sample.close()
     source.close()
     return count
@@ -144,54 +204,66 @@ def rawsample( filename, samplename, limit=10, start=0, hasHead=True ):
 # Parameters:
 #    fileName - name of input file of taxi data
 #    summName - name of output file to receive summary data
-#    limit - maximum number of entries to write to the summary file
+#    limit - maximum number of entries to read from the source file,
+#        0 => no limit
 #    sample - write only every 1/sample entries to the summary file,
 #        e.g., sample=100 makes a 1% sample of the source data
 #    hashead - True => both input and output files have header rows;
 #        False => neither the source nor the summary have header rows.
+#    distance - how to measure distances, one of the DistanceModes
+#    parseErrors - ParseErrors to count points that cannot be parsed in;
+#        None => print each trip that has such points
+#    resume - True => carry on from where a stopped run left off, if it
+#        left a checkpoint file (the output name plus '.checkpoint')
+#    checkpointEvery - entries between checkpoints, 0 => no checkpoints;
+#        the checkpoint file is removed when the run is over
+#    instruments - instrument.Instruments to time the run and write
+#        progress records with; None => none
+#    sampler - a sampler of samplers.py => summarize only the entries it
+#        picks, of those that 'limit' and 'sample' pick
+#
+# Summarize and prepare are presets of the trip pipeline (pipeline.py),
+# which can also write both files in a single pass over the source.
 
-def summarize( fileName, summName, limit=0, sample=1, hasHead=True ):
-    source = open( fileName, 'r' )
-    summary = open( summName, 'w' )
-    table = csv.reader( source )
-    labels = [ ]
-    count = 0
-    for line in table:
-        if len(labels) == 0 and hasHead:
-            labels = line
-            labels1 = line[0:8]
-            labels1.append("DRIVE_DIST")
-            labels1.append("TRIP_DIST")
-            labels1.append("TRIP_TIME")
-            summary.write( ",".join(labels1)  )
-            summary.write( "\n" )
-        else:
-            count += 1
-            if count % sample == 0:
-                for (label,atom) in zip( labels, line ):
-                    if label == 'POLYLINE':
-                        waypoints = parseWaypoints( atom )
-                        drivedist = sum( p[2] for p in waypoints )
-                        tripdist = 0 if len(waypoints)==0 else geodist(
-                                waypoints[0][0], waypoints[0][1],
-                                waypoints[-1][0], waypoints[-1][1])
-                line1 = line[0:7]
-                line1.append(
-                        "True" if len(waypoints)==0 else
-                        "True" if len(line)<7 or line[7][0:1]=='T' else
-                        "False" )
-                line1.append( "{:.3f}".format( drivedist/1000 ))
-                line1.append( "{:.3f}".format( tripdist/1000 ))
-                line1.append( "{:.2f}".format( 0.25 * max( 0, len(waypoints)-1 )))
-                summary.write( ",".join(line1)  )
-                summary.write( "\n" )
-        if count == limit: break
-        if isInteresting( count ):
-            print( "At", count )
-    source.close()
-    summary.close()
-    print( "End at", count )
-    return count
+def summarize( fileName, summName, limit=0, sample=1, hasHead=True,
+               distance='precise', parseErrors=None,
+               resume=False, checkpointEvery=100000, instruments=None, sampler=None ):
+    import pipeline
+    if sampler:
+        sampler.scan( fileName, hasHead, limit or None, max( 1, sample ))
+    return pipeline.run( fileName,
+            [ pipeline.summaryBranch( summName, limit, sample, sampler ) ],
+            hasHead=hasHead, distance=distance, errors=parseErrors,
+            checkpoint=summName + '.checkpoint' if checkpointEvery else None,
+            every=checkpointEvery, resume=resume, instruments=instruments )
+
+# SUMMARIZE WAYPOINTS - Write the summary row of one trip
+#
+# Parameters:
+#    line - list of fields of the trip; the first seven fields are copied
+#        and the eighth (MISSING_DATA) is checked
+#    waypoints - list of waypoints as returned by parseWaypoints
+#    summary - file to receive the row
+
+def summarizeWaypoints( line, waypoints, summary ):
+    summary.write( summaryLine( line, waypoints ))
+
+# SUMMARY LINE - Return the summary row of one trip, as a line of CSV text
+
+def summaryLine( line, waypoints, mode='precise' ):
+    drivedist = sum( p[2] for p in waypoints )
+    tripdist = 0 if len(waypoints)==0 else DistanceModes[mode][0](
+            waypoints[0][0], waypoints[0][1],
+            waypoints[-1][0], waypoints[-1][1])
+    line1 = line[0:7]
+    line1.append(
+            "True" if len(waypoints)==0 else
+            "True" if len(line)<7 or line[7][0:1]=='T' else
+            "False" )
+    line1.append( "{:.3f}".format( drivedist/1000 ))
+    line1.append( "{:.3f}".format( tripdist/1000 ))
+    line1.append( "{:.2f}".format( 0.25 * max( 0, len(waypoints)-1 )))
+    return ",".join(line1) + "\n"
 
 # PREPARE - Prepare data for statistical analysis
 #
@@ -203,6 +275,25 @@ def summarize( fileName, summName, limit=0, sample=1, hasHead=True ):
 #        e.g., sample=100 makes a 1% sample of the source data
 #    hashead - True => both input and output files have header rows;
 #        False => neither the source nor the summary have header rows.
+#    workers - 1 => process the file in this process;
+#        N > 1 => split the file into shards, process them in N processes;
+#        0 => one process per CPU core (see shard.py)
+#    distance - how to measure distances, one of the DistanceModes
+#    parseErrors, resume, checkpointEvery, instruments - as for summarize;
+#        a run with workers other than 1 keeps no checkpoints, cannot be
+#        resumed and cannot be instrumented
+#    format - 'csv' => the CSV file below; 'npy', 'npz' or 'parquet' =>
+#        the same rows as columns of numbers (see writers.py); a columnar
+#        run keeps no checkpoints, and must have workers=1
+#    prefilter - True => drop duplicate trips before parsing them, and
+#        mend GPS jumps instead of ignoring the trip (see prefilter.py);
+#        must have workers=1
+#    horizons - snapshots.Horizons => the number of lag points, their step
+#        and extra feature columns of each row (see snapshots.py); None =>
+#        the columns below; must have workers=1
+#    sampler - a sampler of samplers.py => prepare only the entries it
+#        picks, of those that 'limit' and 'sample' pick; with workers
+#        other than 1, only a streaming one (samplers.HashSampler)
 #
 # Input file:
 #     CSV data of taxi trips in standard Porto format
@@ -238,9 +329,71 @@ def summarize( fileName, summName, limit=0, sample=1, hasHead=True ):
 
 def prepare( fileName, prepName,
              limit=0, sample=(0,1), delta=(2.5,2.5),
-             hasHead=True ):
+             hasHead=True, workers=1, distance='precise', parseErrors=None,
+             resume=False, checkpointEvery=100000, instruments=None, format='csv',
+             prefilter=False, horizons=None, sampler=None ):
 
     # Validate parameters
+    prepareParams( sample, delta )
+    if distance not in DistanceModes:
+        raise Exception( "Unknown distance mode: " + str(distance) )
+    if format != 'csv' and (workers != 1 or resume):
+        raise Exception( "Cannot shard or resume a run with format " + str(format) )
+    if format != 'csv':
+        checkpointEvery = 0
+    if workers != 1 and prefilter:
+        raise Exception( "Cannot prefilter a run with workers other than 1" )
+    if workers != 1 and horizons:
+        raise Exception( "Cannot take horizons in a run with workers other than 1" )
+    if workers != 1 and sampler and not sampler.streaming:
+        raise Exception( "Cannot shard a run with a reservoir sampler" )
+    if workers != 1:
+        import sources
+        if sources.compression( fileName ):
+            raise Exception( "Cannot shard a compressed file; run it with workers=1" )
+
+    # Hand the job to a pool of processes if asked to
+    if workers != 1 and resume:
+        raise Exception( "Cannot resume a run with workers other than 1" )
+    if workers != 1 and instruments:
+        raise Exception( "Cannot instrument a run with workers other than 1" )
+    if workers != 1:
+        import shard
+        return shard.prepareSharded( fileName, prepName,
+                limit=limit, sample=sample, delta=delta,
+                hasHead=hasHead, workers=workers, distance=distance,
+                parseErrors=parseErrors, sampler=sampler )
+
+    # Run the prepare branch of the trip pipeline
+    import pipeline
+    if sampler:
+        (sampleSkew, sampleRate) = prepareParams( sample, delta )[:2]
+        sampler.scan( fileName, hasHead, prepareStop( limit, sampleRate ), sampleRate, sampleSkew )
+    return pipeline.run( fileName,
+            [ pipeline.prepareBranch( prepName, limit, sample, delta, format, prefilter,
+                                      horizons, sampler ) ],
+            hasHead=hasHead, distance=distance, errors=parseErrors,
+            checkpoint=prepName + '.checkpoint' if checkpointEvery else None,
+            every=checkpointEvery, resume=resume, instruments=instruments )
+
+PrepareLabels = [
+    "TRIP_ID", "CALL_TYPE", "ORIGIN_CALL", "TAXI_ID",
+    "TIMESTAMP", "WEEK_DAY", "DAY_BUSY", "DAY_HOUR",
+    "DRIVE_DIST", "TRIP_DIST", "TRIP_TIME", "SNAP_TIME",
+    "LON_START", "LAT_START",
+    "LON_3P", "LAT_3P",
+    "LON_2P", "LAT_2P",
+    "LON_1P", "LAT_1P",
+    "LON_00", "LAT_00",
+    "LON_FINISH", "LAT_FINISH" ]
+
+# PREPARE PARAMS - Validate and unpack the 'sample' and 'delta' parameters
+#
+# Result:
+#    Tuple (sampleSkew, sampleRate, wpFreq, wpStep), where wpFreq and wpStep
+#    are counted in waypoints (15-second steps) rather than minutes.
+
+def prepareParams( sample, delta ):
     try:
         (sampleSkew, sampleRate) = sample
     except:
@@ -259,133 +412,170 @@ def prepare( fileName, prepName,
                 "Timetamp sample rate must be positive - " +
                 "e.g., delta=1.5 for sample every 1.5 minutes" )
     wpFreq, wpStep = floor(4*wpFreq), floor(4*wpStep)
+    return (sampleSkew, sampleRate, wpFreq, wpStep)
 
-    # Open the files
-    source = open( fileName, 'r' )
-    destiny = open( prepName, 'w' )
-    table = csv.reader( source )
+# PREPARE STOP - Return the input count at which prepare stops
+#
+# prepare stops after the entry where inCount/sampleRate == limit;
+# None => no such entry, i.e. read the whole file.
 
-    # Initialize counters
-    labels = [ ]
-    excuses = [0] * 6
-    inCount = 0
+def prepareStop( limit, sampleRate ):
+    stopAt = round( limit*sampleRate )
+    if stopAt < 1 or stopAt/sampleRate != limit:
+        return None
+    return stopAt
+
+# FLATTEN TRIP - Check one trip and write its snapshot rows
+#
+# Parameters:
+#    line - list of fields of one row of taxi data
+#    labels - header labels of the taxi data file
+#    tripId - number to write in the TRIP_ID column, i.e. inCount
+#    wpFreq, wpStep - snapshot spacing and lag step, in waypoints
+#    excuses - list of six counters, one is incremented for this trip
+#    destiny - file to receive the output rows
+#    mode - how to measure distances, one of the DistanceModes
+#    errors - ParseErrors to count bad points in; None => print bad trips
+#
+# Result:
+#    Number of rows written (0 if the trip is an outlier)
+
+def flattenTrip( line, labels, tripId, wpFreq, wpStep, excuses, destiny,
+                 mode='precise', errors=None ):
+    waypoints = []
+
+    # Preprocess the atoms of input.
+    # - here only the trip waypoints (polyline) needs work
+    for (label,atom) in zip( labels, line ):
+        if label == 'POLYLINE' and errors is None:
+            waypoints = parseWaypoints( atom, mode )
+        elif label == 'POLYLINE':
+            waypoints = tokenizeWaypoints( atom, mode, errors, tripId )
+    return flattenWaypoints( line, waypoints, tripId,
+            wpFreq, wpStep, excuses, destiny, mode )
+
+# FLATTEN WAYPOINTS - Same as flattenTrip, for a trip already parsed
+#
+# Parameters:
+#    line - list of fields of the trip; only the fields before POLYLINE
+#        are used (CALL_TYPE, ORIGIN_CALL, TAXI_ID, TIMESTAMP, MISSING_DATA)
+#    waypoints - list of waypoints as returned by parseWaypoints
+#    others - as for flattenTrip
+
+def flattenWaypoints( line, waypoints, tripId, wpFreq, wpStep, excuses, destiny,
+                      mode='precise' ):
     outCount = 0
-    
-    for line in table:
-        if len(labels) == 0 and hasHead:
- 
-            # The input file has a header row,
-            # so write a header row to the output file
-            labels = line
-            labels1 = [
-                "TRIP_ID", "CALL_TYPE", "ORIGIN_CALL", "TAXI_ID",
-                "TIMESTAMP", "WEEK_DAY", "DAY_BUSY", "DAY_HOUR",
-                "DRIVE_DIST", "TRIP_DIST", "TRIP_TIME", "SNAP_TIME",
-                "LON_START", "LAT_START",
-                "LON_3P", "LAT_3P",
-                "LON_2P", "LAT_2P",
-                "LON_1P", "LAT_1P",
-                "LON_00", "LAT_00",
-                "LON_FINISH", "LAT_FINISH" ]
-            destiny.write( ",".join(labels1)  )
-            destiny.write( "\n" )
+    (excuse, drivedist, tripdist, triptime) = judgeWaypoints( line, waypoints, mode )
+    excuses[excuse] += 1
+    if excuse == 0:
+        rows = snapshotLines( line, waypoints, tripId,
+                drivedist, tripdist, triptime, wpFreq, wpStep )
+        destiny.write( "".join( rows ))
+        outCount = len(rows)
+    return outCount
 
-        else:
-            inCount += 1
-            if inCount % sampleRate == sampleSkew:
-                waypoints = []
-                drivedist = tripdist = triptime = 0
-
-                # Preprocess the atoms of input.
-                # - here only the trip waypoints (polyline) needs work
-                for (label,atom) in zip( labels, line ):
-                    if label == 'POLYLINE':
-                        waypoints = parseWaypoints( atom )
-                        drivedist = sum( p[2] for p in waypoints )
-                        tripdist = 0 if len(waypoints)==0 else geodist(
-                                waypoints[0][0], waypoints[0][1],
-                                waypoints[-1][0], waypoints[-1][1])
-                        triptime = 0.25 * max( 0, len(waypoints)-1 )
-
-                # Check if this row is an outlier
-                # - if it is, we'll ignore it for now
-                # - but common outliers we should figure out how to handle
-                happy = False
-                if triptime < 0.5:
-                    # trip too short, less than 30 seconds
-                    excuses[1] += 1
-                elif tripdist < 30:
-                    # trip too short, less than 30 metres
-                    excuses[2] += 1
-                elif drivedist / triptime < 5:
-                    # average speed too slow, less than 5 km/h
-                    excuses[3] += 1
-                elif max( (here[2] for here in waypoints) ) > 625:
-                    # speed too high, over 150 km/h (625m/15s) at some point
-                    excuses[4] += 1
-                elif line[7][0:1] == 'T':
-                    # source flagged as having missing data
-                    excuses[5] += 1
-                else:
-
-                    # The data looks good, so we are happy
-                    happy = True
-                    excuses[0] += 1
-
-                    # Write one or more output rows for this trip.
-                    # Each row shares the same per-trip data, but
-                    # each row has a different set of location points
-                    # based on snapshots taken along the trip route.
-
-                    line1 = [str(inCount), line[1], line[2], line[4], line[5]]
-                    timeinfo = decodestamp( line[5] )
-                    line1.append( str(timeinfo[2]) ) # day of week
-                    line1.append( str(timeinfo[3]) ) # type of day
-                    line1.append( "{:.3f}".format(timeinfo[4]) ) # hour of day
-                    line1.append( "{:.0f}".format( drivedist ))
-                    line1.append( "{:.0f}".format( tripdist ))
-                    line1.append( "{:.2f}".format( triptime ))
-
-                    # For each waypoint-frequency interval along the way
-                    for ix in range( 0, len(waypoints), wpFreq ):
-                        baseSize = len(line1)
-                        # Number of minutes into the trip
-                        line1.append( str(ix/4) )
-                        # Location at start of trip
-                        here = waypoints[0]
-                        line1.append( "{:.6f},{:.6f}" .format( here[0], here[1] ))
-                        # Location three steps prior to snap
-                        here = waypoints[ max( 0, ix-3*wpStep ) ]
-                        line1.append( "{:.6f},{:.6f}" .format( here[0], here[1] ))
-                        # Location two steps prior to snap
-                        here = waypoints[ max( 0, ix-2*wpStep ) ]
-                        line1.append( "{:.6f},{:.6f}" .format( here[0], here[1] ))
-                        # Location one step prior to snap
-                        here = waypoints[ max( 0, ix-wpStep ) ]
-                        line1.append( "{:.6f},{:.6f}" .format( here[0], here[1] ))
-                        # Location at time of snapshot
-                        here = waypoints[ ix ]
-                        line1.append( "{:.6f},{:.6f}" .format( here[0], here[1] ))
-                        # Location at end of trip
-                        here = waypoints[ -1 ]
-                        line1.append( "{:.6f},{:.6f}" .format( here[0], here[1] ))
-                        # Write the row
-                        destiny.write( ",".join(line1)  )
-                        destiny.write( "\n" )
-                        outCount += 1
-                        line1[baseSize:] = []
-
-                    pass # for each output line
-                pass # if input data is good
-            pass # if input is selected for the sample
-            if inCount/sampleRate == limit: break
-            if isInteresting( inCount ):
-                print( "At", inCount )
-        pass # if input was data row (not header)
-    pass # for each input row
- 
-    source.close()
-    destiny.close()
+# JUDGE WAYPOINTS - Check if a trip is an outlier
+#
+# Result:
+#    Tuple of four elements:
+#        excuse - 0 if the trip is good, else the reason it is ignored:
+#            1=under 30 seconds, 2=under 30 metres, 3=under 5 km/h,
+#            4=over 150 km/h at some point, 5=source 'missing data' flag
+#        drive dist - distance that taxi drove, in metres
+#        trip dist - linear distance from start point to end point,
+#            measured as chosen by 'mode' (see DistanceModes)
+#        trip time - duration of trip, in minutes
+
+def judgeWaypoints( line, waypoints, mode='precise' ):
+    drivedist = tripdist = triptime = 0
+    if len(waypoints) > 0:
+        drivedist = sum( p[2] for p in waypoints )
+        tripdist = DistanceModes[mode][0](
+                waypoints[0][0], waypoints[0][1],
+                waypoints[-1][0], waypoints[-1][1])
+        triptime = 0.25 * max( 0, len(waypoints)-1 )
+
+    # Check if this row is an outlier
+    # - if it is, we'll ignore it for now
+    # - but common outliers we should figure out how to handle
+    if triptime < 0.5:
+        # trip too short, less than 30 seconds
+        excuse = 1
+    elif tripdist < 30:
+        # trip too short, less than 30 metres
+        excuse = 2
+    elif drivedist / triptime < 5:
+        # average speed too slow, less than 5 km/h
+        excuse = 3
+    elif max( (here[2] for here in waypoints) ) > 625:
+        # speed too high, over 150 km/h (625m/15s) at some point
+        excuse = 4
+    elif line[7][0:1] == 'T':
+        # source flagged as having missing data
+        excuse = 5
+    else:
+        # The data looks good, so we are happy
+        excuse = 0
+    return (excuse, drivedist, tripdist, triptime)
+
+# SNAPSHOT LINES - Return the output rows of one good trip
+#
+# Each row shares the same per-trip data, but
+# each row has a different set of location points
+# based on snapshots taken along the trip route.
+# Each row is a text line of CSV, ending in a newline.
+#
+# The rows are formatted as a batch: the per-trip fields (with the start
+# and finish points) are formatted once, and each waypoint that is in any
+# row is formatted once, however many rows it is in. The TIMESTAMP is
+# decoded by 'decode', None => decodestamp.
+
+def snapshotLines( line, waypoints, tripId,
+                   drivedist, tripdist, triptime, wpFreq, wpStep, decode=None ):
+    prefix = snapshotPrefix( line, tripId, drivedist, tripdist, triptime, decode )
+    if not waypoints:
+        return [ ]
+
+    # Text of each waypoint used: the snapshots and the steps before them
+    snaps = range( 0, len(waypoints), wpFreq )
+    if wpStep % wpFreq == 0:
+        # each step back from a snapshot is another snapshot (or the start)
+        used = snaps
+    else:
+        used = set( snaps )
+        for back in ( wpStep, 2*wpStep, 3*wpStep ):
+            used.update( max( 0, ix-back ) for ix in snaps )
+    point = "{:.6f},{:.6f}".format
+    texts = { ix: point( waypoints[ix][0], waypoints[ix][1] ) for ix in used }
+    # Location at start of trip, and at end of trip
+    start = texts[0]
+    finish = "," + point( waypoints[-1][0], waypoints[-1][1] ) + "\n"
+
+    # One row for each waypoint-frequency interval along the way: minutes
+    # into the trip, start, three, two and one steps prior to snap, snap
+    return [ "".join(( prefix, str(ix/4), ",", start,
+                       ",", texts[ max( 0, ix-3*wpStep ) ],
+                       ",", texts[ max( 0, ix-2*wpStep ) ],
+                       ",", texts[ max( 0, ix-wpStep ) ],
+                       ",", texts[ ix ], finish ))
+             for ix in snaps ]
+
+# SNAPSHOT PREFIX - The per-trip fields of a snapshot row, as CSV text
+# ending in a comma; 'decode' as for snapshotLines
+
+def snapshotPrefix( line, tripId, drivedist, tripdist, triptime, decode=None ):
+    timeinfo = (decode or decodestamp)( line[5] )
+    return ",".join(( str(tripId), line[1], line[2], line[4], line[5],
+            str(timeinfo[2]),                   # day of week
+            str(timeinfo[3]),                   # type of day
+            "{:.3f}".format(timeinfo[4]),       # hour of day
+            "{:.0f}".format( drivedist ),
+            "{:.0f}".format( tripdist ),
+            "{:.2f}".format( triptime ) )) + ","
+
+# PRINT EXCUSES - Print the closing report of prepare
+
+def printExcuses( inCount, excuses, outCount ):
     print( "End at", inCount )
     if inCount > 0:
         print( "-", excuses[0], "accepted" )
@@ -395,19 +585,25 @@ def prepare( fileName, prepName,
         print( "-", excuses[4], "ignored - taxi exceeded 150 km/h" )
         print( "-", excuses[5], "ignored - source 'missing data' flag set" )
         print( "Flattened", excuses[0], "to", outCount )
-    return inCount
 
 # CHOOSE FILE - Invite the user to select a file in a chooser window
 #
 # Use TK windowing toolkit. Need to initialize with 'withdraw'
 # to prevent the toolkit from trying to display a main window.
+# The toolkit is loaded and initialized on the first call only, so the
+# module can be imported on machines with no display.
 
-tk_root = tk.Tk()
-tk_root.withdraw()
+tk_root = None
 
 def chooseFile():
-    return tk.filedialog.askopenfilename()
-    
+    global tk_root
+    import tkinter
+    import tkinter.filedialog
+    if tk_root is None:
+        tk_root = tkinter.Tk()
+        tk_root.withdraw()
+    return tkinter.filedialog.askopenfilename()
+
 # IS INTERESTING - Return 'true' for a decreasing selection of whole numbers
 #
 # Return 'true' for the numbers: 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, ...
@@ -452,39 +648,183 @@ def annotate( label, atom ):
 #        distance - distance from prior waypoint to this one, in metres
 #        heading - direction from prior waypoint to this one, in degrees
 #            -180=180=east, 90=north, 0=west, -90=south
+#
+# The distances and headings are measured as chosen by 'mode', one of
+# the DistanceModes: 'precise' (geodist), 'city' or 'haversine' (see
+# stepWaypoints).
 
-def parseWaypoints( text ):
+def parseWaypoints( text, mode='precise' ):
+    if mode not in DistanceModes:
+        raise KeyError( mode )
     stamps = text .lstrip('[') .rstrip(']') .split('],[')
     if len(stamps)==1 and stamps[0]=="":
         stamps = [ ]
-    lastLongi, lastLati = 0, 0
-    waypoints = [ ]
+    points = [ ]
     happy = True
     for stamp in stamps:
         (longi, junk, lati) = stamp.partition(',')
-        if True:
-            try:
-                longi, lati = float(longi), float(lati)
-            except:
-                if longi != '' or lati != '':
-                    if happy:
-                        print( "Cannot parse trip:", text )
-                        happy = False
-                longi, lati = 0, 0
-            if lastLongi != 0 and lastLati != 0:
-                distance = geodist( longi, lati, lastLongi, lastLati )
-                heading = geodir( longi, lati, lastLongi, lastLati )
-                waypoint = (longi, lati, distance, heading)
-                lastLongi, lastLati = longi, lati
+        try:
+            longi, lati = float(longi), float(lati)
+        except:
+            if longi != '' or lati != '':
+                if happy:
+                    print( "Cannot parse trip:", text )
+                    happy = False
+            longi, lati = 0, 0
+        points.append( (longi, lati) )
+    return stepWaypoints( points, mode )
+
+# TOKENIZE WAYPOINTS - Parse a POLYLINE text quietly, counting bad points
+#
+# Same result as parseWaypoints, but bad points are counted in 'errors'
+# instead of printing the whole text.
+#
+# Parameters:
+#    text - list of waypoints, as for parseWaypoints
+#    mode - how to measure distances, one of the DistanceModes
+#    errors - ParseErrors to count points and bad points in; None => no count
+#    recordId - id of the record, kept by 'errors' as a sample if bad
+#
+# Result:
+#    List of waypoint tuples, as for parseWaypoints; a point that cannot
+#    be parsed is (0,0), as there.
+
+def tokenizeWaypoints( text, mode='precise', errors=None, recordId=None ):
+    if mode not in DistanceModes:
+        raise KeyError( mode )
+    stamps = text .lstrip('[') .rstrip(']') .split('],[')
+    if len(stamps)==1 and stamps[0]=="":
+        return [ ]
+    points = [ ]
+    bad = 0
+    for stamp in stamps:
+        (longi, junk, lati) = stamp.partition(',')
+        try:
+            longi, lati = float(longi), float(lati)
+        except ValueError:
+            if longi != '' or lati != '':
+                bad += 1
+            longi = lati = 0
+        points.append( (longi, lati) )
+    if errors is not None:
+        errors.count( recordId, len(points), bad )
+    return stepWaypoints( points, mode )
+
+# STEP WAYPOINTS - Waypoints of a list of (longitude, latitude) points
+#
+# Parameters:
+#    points - list of (longitude, latitude) tuples; (0,0) for a point that
+#        could not be parsed
+#    mode - how to measure distances, one of the DistanceModes
+#
+# Result:
+#    List of waypoint tuples, as for parseWaypoints. The first point, and
+#    any point after a (0,0) point, has a distance and heading of 0.
+#
+# This is the one place where the parsers work out the distance and
+# heading of each step. They are worked out in line, rather than by
+# calling the functions of the mode for each point, but with the same
+# operations in the same order, so they are the same numbers as those
+# functions give (bench/bench_tokenize.py checks this for every mode).
+
+def stepWaypoints( points, mode='precise' ):
+    if mode not in DistanceModes:
+        raise KeyError( mode )
+
+    # Each mode has a loop of its own, so that no test of the mode is made
+    # for each point
+    waypoints = [ ]
+    append = waypoints.append
+    _cos, _sin, _sqrt, _asin, _atan2 = cos, sin, sqrt, asin, atan2
+    lastLongi = lastLati = 0
+    if mode == 'precise':
+        # as geodist and geodir
+        for (longi, lati) in points:
+            if lastLongi == 0 or lastLati == 0:
+                append( (longi, lati, 0, 0) )
             else:
-                waypoint = (longi, lati, 0, 0)
-                lastLongi, lastLati = longi, lati
-        else:
-            waypoint = (0, 0, 0, 0)
-            lastLongi, lastLati = 0, 0
-        waypoints. append( waypoint )
+                lonDelta = (longi - lastLongi) * _cos( ((lati+lastLati)/2) * (pi/180) )
+                latDelta = lati - lastLati
+                append( (longi, lati,
+                         _sqrt( lonDelta*lonDelta + latDelta*latDelta ) * 6371000*(pi/180),
+                         _atan2( latDelta, lonDelta ) * 180/pi) )
+            lastLongi, lastLati = longi, lati
+    elif mode == 'city':
+        # as citydist and citydir
+        latFactor = CityLatFactor
+        for (longi, lati) in points:
+            if lastLongi == 0 or lastLati == 0:
+                append( (longi, lati, 0, 0) )
+            else:
+                lonDelta = (longi - lastLongi) * latFactor
+                latDelta = lati - lastLati
+                append( (longi, lati,
+                         _sqrt( lonDelta*lonDelta + latDelta*latDelta ) * (6371000*pi/180),
+                         _atan2( latDelta, lonDelta ) * 180/pi) )
+            lastLongi, lastLati = longi, lati
+    else:
+        # as haverdist and geodir, with the radians and cosine of the
+        # latitude of each point worked out once
+        lastLonRad = lastLatRad = lastCosLat = 0
+        for (longi, lati) in points:
+            lonRad, latRad = longi*pi/180, lati*pi/180
+            cosLat = _cos( latRad )
+            if lastLongi == 0 or lastLati == 0:
+                append( (longi, lati, 0, 0) )
+            else:
+                halfLat = _sin( (latRad-lastLatRad)/2 )
+                halfLon = _sin( (lonRad-lastLonRad)/2 )
+                haver = halfLat*halfLat + cosLat*lastCosLat*(halfLon*halfLon)
+                lonDelta = (longi - lastLongi) * _cos( ((lati+lastLati)/2) * (pi/180) )
+                latDelta = lati - lastLati
+                append( (longi, lati, 2*6371000*_asin( _sqrt( haver )),
+                         _atan2( latDelta, lonDelta ) * 180/pi) )
+            lastLongi, lastLati = longi, lati
+            lastLonRad, lastLatRad, lastCosLat = lonRad, latRad, cosLat
     return waypoints
 
+# PARSE ERRORS - Counters of the points parsed by tokenizeWaypoints
+#
+# Attributes:
+#    points - number of points parsed
+#    badPoints - number of points that could not be parsed
+#    badRecords - number of records with at least one bad point
+#    samples - ids of the first 'keep' bad records
+#
+# Methods:
+#    count(recordId, points, bad) - count one record
+#    merge(other) - add the counts of another ParseErrors
+#    report() - print the counts and samples, if there were bad points
+
+class ParseErrors:
+
+    def __init__( self, keep=10 ):
+        self.keep = keep
+        self.points = 0
+        self.badPoints = 0
+        self.badRecords = 0
+        self.samples = [ ]
+
+    def count( self, recordId, points, bad ):
+        self.points += points
+        if bad:
+            self.badPoints += bad
+            self.badRecords += 1
+            if len(self.samples) < self.keep:
+                self.samples.append( recordId )
+
+    def merge( self, other ):
+        self.points += other.points
+        self.badPoints += other.badPoints
+        self.badRecords += other.badRecords
+        self.samples.extend( other.samples[ :self.keep-len(self.samples) ] )
+
+    def report( self ):
+        if self.badPoints > 0:
+            print( "Cannot parse", self.badPoints, "of", self.points,
+                   "points, in", self.badRecords, "records, e.g.:",
+                   ", ".join( str(sample) for sample in self.samples ))
+
 # PRINT WAYPOINTS - Print a list of waypoints in a nice readable form
 #
 # Print an line with a label if the label is given, then print one line
@@ -497,25 +837,36 @@ def parseWaypoints( text ):
 #     indent - number of spaces to indent each waypoint line.
 
 def printWaypoints( label, points, indent=2 ):
+    sys.stdout.write( waypointsBlock( label, points, indent ))
+
+# WAYPOINTS BLOCK - The printout of printWaypoints, as one string
+#
+# Each line is made by one %-format, which costs less than str.format for
+# these fields; the arrows come from a table made once, rather than being
+# built for each waypoint: Arrows[True] are those pointing back (<===),
+# Arrows[False] those pointing forward (===>), by shaft length.
+
+Arrows = { True: [ "<" + "=" * length for length in range( 31 ) ],
+           False: [ "=" * length + ">" for length in range( 31 ) ] }
+
+def waypointsBlock( label, points, indent=2 ):
+    out = [ ]
     if label:
-        print( label.rjust(indent), ':', sep='' )
+        out.append( label.rjust(indent) + ':\n' )
     prefix = ' ' * indent
+    moving = prefix + '%5.2f: %.6f, %.6f, %4.0fm, %4.0f°  %s%s\n'
+    still = prefix + '%5.2f: %.6f, %.6f, %4.0fm,    -\n'
+    names = CompassNames
     ticks = 0
-    for point in points:
-        if point[2] != 0:
-            print( '{:s}{:5.2f}: {:.6f}, {:.6f}, {:4.0f}m, {:4.0f}°  {:s}{:s}'.format(
-                prefix, ticks,
-                point[0], point[1],
-                point[2], point[3],
-                geodirname(point[3]),
-                "<" * (-90 < point[3] <= 90) +
-                "=" * min(30,round(point[2]/50)) +
-                ">" * (not -90 < point[3] <= 90) ))
+    for (lon, lat, dist, bearing) in points:
+        if dist != 0:
+            out.append( moving % ( ticks, lon, lat, dist, bearing,
+                    names[round( bearing*8/360 ) % 8],
+                    Arrows[-90 < bearing <= 90][min( 30, round( dist/50 ))] ))
         else:
-            print( '{:s}{:5.2f}: {:.6f}, {:.6f}, {:4.0f}m,    -'.format(
-                prefix, ticks,
-                point[0], point[1], point[2] ))
+            out.append( still % ( ticks, lon, lat, dist ))
         ticks += 0.25
+    return "".join( out )
 
 # GEO DIST - return distance (metres) between two points (lon/lat degrees)
 # For distances within a city, this procedure delivers with acceptable
@@ -560,14 +911,51 @@ def haversin( angl ):
     sinx = sin(angl/2)
     return sinx*sinx
 
+# CITY DIST, CITY DIR - geodist and geodir with a fixed latitude factor
+#
+# Same as geodist and geodir, but the latitude factor is worked out once,
+# for the middle of CityBox (the Porto area), instead of for each pair of
+# points. This saves a cosine per call. For points within CityBox, the
+# longitude part of the distance is off by at most CityMaxError (0.24%)
+# of itself, so the distance is never off by more than 0.24% (2.4 metres
+# per km) from geodist. See bench/bench_distance.py for measured errors.
+
+CityBox = (-8.80, 41.00, -8.40, 41.31)   # lon min, lat min, lon max, lat max
+CityLatFactor = cos( ((CityBox[1]+CityBox[3])/2) * (pi/180) )
+CityMaxError = max( abs( cos( lat*(pi/180) ) - CityLatFactor ) / cos( lat*(pi/180) )
+                    for lat in (CityBox[1], CityBox[3]) )
+
+def citydist( lon1, lat1, lon2, lat2 ):
+    lonDelta = (lon1 - lon2) * CityLatFactor
+    latDelta = lat1 - lat2
+    return sqrt( lonDelta*lonDelta + latDelta*latDelta ) * (6371000*pi/180)
+
+def citydir( lon1, lat1, lon2, lat2 ):
+    lonDelta = (lon1 - lon2) * CityLatFactor
+    latDelta = lat1 - lat2
+    return atan2( latDelta, lonDelta ) * 180/pi
+
+# DISTANCE MODES - The ways of measuring distance between two points
+#
+# Each mode names a distance function and a heading function:
+#     precise - geodist and geodir; latitude factor for each pair of points
+#     city - citydist and citydir; one latitude factor for CityBox
+#     haversine - haverdist (great circle) and geodir
+
+DistanceModes = {
+    'precise': (geodist, geodir),
+    'city': (citydist, citydir),
+    'haversine': (haverdist, geodir) }
+
 # GEO DIR NAME - Return the closest compass-point for an angle (deg)
 #
 # Use eight-point compass rose. W=0°, N=90°, E=180°/-180°, S=-90°.
 
+CompassNames = [ ' W', 'NW', ' N', 'NE', ' E', 'SE', ' S', 'SW' ]
+
 def geodirname( angle ):
-    names = [ ' W', 'NW', ' N', 'NE', ' E', 'SE', ' S', 'SW' ]
     angle = round( angle*8/360 ) % 8
-    return names[angle]
+    return CompassNames[angle]
 
 # DECODE STAMP - Extract relevant details from a date/time stamp
 #
@@ -594,6 +982,61 @@ PortugalHolidays = [
     20140610, 20140815, 20141208, 20141225 ]
 
 def decodestamp( stamp ):
+    secs = int(stamp)
+    (day, daysecs) = divmod( secs, 86400 )
+    dayhour = daysecs//3600 + (daysecs//60 % 60)/60 + (daysecs % 60)/3600
+    if dayhour < 4:
+        dayhour += 24
+        day -= 1
+    try:
+        (numstamp, weekday, daytype) = _calendar[day]
+    except KeyError:
+        (numstamp, weekday, daytype) = _calendar[day] = calendarDay( day )
+    return (stamp, numstamp, weekday, daytype,  dayhour)
+
+# CALENDAR DAY - Return the calendar details of a day
+#
+# Parameter:
+#    day - number of days since 1970/1/1 (of the 4 AM-shifted day)
+#
+# Result:
+#    Tuple of three elements, as in the result of decodestamp:
+#        numeric stamp, weekday, day type
+#
+# decodestamp keeps the result for each day in the _calendar table, so
+# the date arithmetic and the holiday search run once per day rather
+# than once per trip. The table is filled as days are met; if you change
+# PortugalHolidays, clear it with _calendar.clear().
+#
+# The date is worked out with whole-number arithmetic on the proleptic
+# Gregorian calendar (as in datetime) without making datetime objects.
+# The weekday is numbered as datetime's weekday() numbers it.
+
+_calendar = { }
+
+def calendarDay( day ):
+    weekday = (day + 3) % 7     # 1970/1/1 was weekday 3
+    era = (day + 719468) // 146097
+    dayOfEra = day + 719468 - era*146097
+    yearOfEra = (dayOfEra - dayOfEra//1460 + dayOfEra//36524
+                 - dayOfEra//146096) // 365
+    dayOfYear = dayOfEra - (365*yearOfEra + yearOfEra//4 - yearOfEra//100)
+    monthIx = (5*dayOfYear + 2) // 153      # 0 = March
+    mday = dayOfYear - (153*monthIx + 2)//5 + 1
+    month = monthIx + 3 if monthIx < 10 else monthIx - 9
+    year = yearOfEra + era*400 + (month <= 2)
+    numstamp = year*10000 + month*100 + mday
+    daytype = ('WE' if weekday==0 or weekday==6 else
+               'HOL' if numstamp in PortugalHolidays else
+               'WD')
+    return (numstamp, weekday, daytype)
+
+# DECODE STAMP DATETIME - The original decodestamp, done with datetime
+#
+# Same result as decodestamp. Kept as the reference that decodestamp and
+# timearray.decodestampArray are checked against.
+
+def decodestampDatetime( stamp ):
     when1 = when = dt.datetime.utcfromtimestamp( int(stamp) )
     weekday = when.weekday()
     dayhour = when.hour + when.minute/60 + when.second/3600
@@ -607,22 +1050,220 @@ def decodestamp( stamp ):
                'WD')
     return (stamp, numstamp, weekday, daytype,  dayhour)
 
-# MAIN - Display entries from a taxi-trip data file in readable format
-#
-# Global constant COMMANDED enables this function. Enable this function
-# when this script is used as a stand-alone command; disable it when
-# this script is used as a workspace within a Python interactive shell.
+# MAIN - Run the main functions as commands
 #
 # Command parameters:
-#     FileName - name of file holding taxi-trip data
-#     Count - not 0 => display first 'Count' entries;
-#         is 0 => display selected entries from throughout the file.
-
-if __name__ == "__main__" and COMMANDED:
-    args = sys.argv
-    if len(args) < 1:
-        print( "Usage: illume FileName.csv [Count]" )
-        exit( 2 )
-    else:
-        illume( args[0], args[1] if len(args)>=2 else 10 )
+#     illume FileName [--limit N] [--start N] [--sample N] [--trip-id ID]
+#         [--taxi-id ID] [--indexed] - display entries in readable format;
+#         with no FileName, choose the file in a chooser window; with
+#         [--page N] [--call-type TYPE] [--since TIME] [--until TIME]
+#         [--min-points N] [--max-points N], show the entries that pass
+#         these filters a page of N at a time, up to --limit of them
+#         (default 0 => all; see render.py); --start, --sample, --trip-id
+#         and the samplers cannot be used with them. Without them, --limit
+#         is 10 by default.
+#     summarize FileName SummName [--limit N] [--sample N] [--distance MODE]
+#         [--quiet] [--resume] [--progress FILE] [--progress-every SECONDS]
+#         [--profile FILE]
+#     prepare FileName PrepName [--limit N] [--sample SKEW RATE]
+#         [--delta FREQ STEP] [--workers N] [--distance MODE] [--quiet]
+#         [--resume] [--progress FILE] [--progress-every SECONDS]
+#         [--profile FILE] [--format csv|npy|npz|parquet] [--prefilter]
+#         [--lags N] [--lag-step MINUTES] [--features NAME ...]
+#     With --quiet, points that cannot be parsed are counted and reported
+#     at the end, instead of printing each trip that has them. With
+#     --resume, a stopped run carries on from its last checkpoint. With
+#     --progress, JSON progress records with stage times are written to
+#     FILE ('-' => standard error); with --profile, the run is profiled
+#     by cProfile and the statistics are saved in FILE (see instrument.py).
+#     --format writes the rows as columns of numbers (see writers.py), and
+#     --prefilter drops duplicate trips and mends GPS jumps (see
+#     prefilter.py). --lags, --lag-step and --features set the lag points
+#     and feature columns of each row (see snapshots.py).
+#     rawsample FileName SampleName [--limit N] [--start N] [--indexed]
+#     Every command takes --no-head if the data file has no header row, and
+#     a sampler (see samplers.py): --reservoir N for a uniform sample of N
+#     entries, with --stratify LABEL ... for N of each CALL_TYPE, DAY_BUSY
+#     and/or DAY_HOUR, or --hash BUCKETS KEEP ... for the entries whose
+#     TRIP_ID hashes into the buckets kept; --seed N seeds either.
+#
+# Result:
+#    Exit status for the command: 0 = done
+
+def main( args=None ):
+    parser = argparse.ArgumentParser( prog='illume',
+            description="Explore Porto taxi-trip data file" )
+    commands = parser.add_subparsers( dest='command', required=True )
+
+    command = commands.add_parser( 'illume', help="display entries in readable format" )
+    command.add_argument( 'filename', nargs='?' )
+    command.add_argument( '--limit', type=int,
+            help="entries shown, default 10, or 0 => all with --page or filters" )
+    command.add_argument( '--start', type=int, default=0 )
+    command.add_argument( '--sample', type=int, default=1 )
+    command.add_argument( '--trip-id' )
+    command.add_argument( '--taxi-id' )
+    command.add_argument( '--indexed', action='store_true' )
+    command.add_argument( '--page', type=int, metavar='N',
+            help="show N entries a page at a time, see render.py" )
+    command.add_argument( '--call-type', choices=( 'A', 'B', 'C' ) )
+    command.add_argument( '--since', metavar='TIME',
+            help="first TIMESTAMP shown: Unix seconds or ISO date and time, UTC" )
+    command.add_argument( '--until', metavar='TIME',
+            help="TIMESTAMP at which to stop showing entries" )
+    command.add_argument( '--min-points', type=int, metavar='N' )
+    command.add_argument( '--max-points', type=int, metavar='N' )
+
+    command = commands.add_parser( 'summarize', help="write summary data about each trip" )
+    command.add_argument( 'filename' )
+    command.add_argument( 'outname' )
+    command.add_argument( '--limit', type=int, default=0 )
+    command.add_argument( '--sample', type=int, default=1 )
+    command.add_argument( '--distance', choices=DistanceModes, default='precise' )
+    command.add_argument( '--quiet', action='store_true',
+            help="count points that cannot be parsed instead of printing them" )
+    command.add_argument( '--resume', action='store_true',
+            help="carry on from the checkpoint of a stopped run" )
+
+    command = commands.add_parser( 'prepare', help="write snapshot rows for statistics" )
+    command.add_argument( 'filename' )
+    command.add_argument( 'outname' )
+    command.add_argument( '--limit', type=int, default=0 )
+    command.add_argument( '--sample', type=int, nargs=2, default=(0,1),
+            metavar=('SKEW', 'RATE') )
+    command.add_argument( '--delta', type=float, nargs=2, default=(2.5,2.5),
+            metavar=('FREQ', 'STEP') )
+    command.add_argument( '--workers', type=int, default=1 )
+    command.add_argument( '--format', choices=( 'csv', 'npy', 'npz', 'parquet' ),
+            default='csv', help="output format, see writers.py" )
+    command.add_argument( '--prefilter', action='store_true',
+            help="drop duplicate trips and mend GPS jumps, see prefilter.py" )
+    command.add_argument( '--lags', type=int,
+            help="number of lag points before each snapshot, see snapshots.py" )
+    command.add_argument( '--lag-step', type=float, metavar='MINUTES',
+            help="minutes between lag points, default the STEP of --delta" )
+    command.add_argument( '--features', nargs='+', default=[ ], metavar='NAME',
+            help="feature columns: CUM_DIST, HEADING, SPEED" )
+    command.add_argument( '--distance', choices=DistanceModes, default='precise' )
+    command.add_argument( '--quiet', action='store_true',
+            help="count points that cannot be parsed instead of printing them" )
+    command.add_argument( '--resume', action='store_true',
+            help="carry on from the checkpoint of a stopped run" )
+
+    for name in ( 'summarize', 'prepare' ):
+        command = commands.choices[name]
+        command.add_argument( '--progress', metavar='FILE',
+                help="write JSON progress records to FILE, '-' => standard error" )
+        command.add_argument( '--progress-every', type=float, default=10.0,
+                metavar='SECONDS' )
+        command.add_argument( '--profile', metavar='FILE',
+                help="profile the run with cProfile, save the statistics in FILE" )
+
+    command = commands.add_parser( 'rawsample', help="write sample records of raw data" )
+    command.add_argument( 'filename' )
+    command.add_argument( 'outname' )
+    command.add_argument( '--limit', type=int, default=10 )
+    command.add_argument( '--start', type=int, default=0 )
+    command.add_argument( '--indexed', action='store_true' )
+
+    for command in commands.choices.values():
+        command.add_argument( '--no-head', dest='hasHead', action='store_false',
+                help="the data file has no header row" )
+        command.add_argument( '--reservoir', type=int, metavar='N',
+                help="uniform random sample of N entries, see samplers.py" )
+        command.add_argument( '--stratify', nargs='+', metavar='LABEL',
+                help="with --reservoir, N entries of each CALL_TYPE, DAY_BUSY, DAY_HOUR" )
+        command.add_argument( '--hash', type=int, nargs='+', metavar='N',
+                help="BUCKETS KEEP ... - entries whose TRIP_ID hashes into KEEP" )
+        command.add_argument( '--seed', type=int, default=0 )
+    args = parser.parse_args( args )
+    sampler = commandSampler( args )
+
+    if args.command == 'illume':
+        filename = args.filename or chooseFile()
+        if not filename:
+            return 2
+        if (args.page or args.call_type or args.since or args.until
+        or args.min_points is not None or args.max_points is not None):
+            # browse shows the entries in file order, all that pass the filters
+            unused = [ option for (option, used) in (
+                    ( '--start', args.start != 0 ),
+                    ( '--sample', args.sample != 1 ),
+                    ( '--trip-id', args.trip_id is not None ),
+                    ( '--reservoir', args.reservoir is not None ),
+                    ( '--hash', bool( args.hash )),
+                    ( '--stratify', bool( args.stratify ))) if used ]
+            if unused:
+                parser.error( ", ".join( unused ) + " cannot be used with --page or filters" )
+            import render
+            filters = render.TripFilter( args.taxi_id, args.call_type, args.since,
+                    args.until, args.min_points, args.max_points )
+            render.browse( filename, filters, args.page or 10,
+                    0 if args.limit is None else args.limit, args.hasHead,
+                    indexed=args.indexed )
+            return 0
+        illume( filename, 10 if args.limit is None else args.limit, args.start,
+                args.sample, args.hasHead,
+                tripId=args.trip_id, taxiId=args.taxi_id, indexed=args.indexed,
+                sampler=sampler )
+    elif args.command == 'summarize':
+        parseErrors = ParseErrors() if args.quiet else None
+        instruments = commandInstruments( args )
+        summarize( args.filename, args.outname, args.limit, args.sample, args.hasHead,
+                distance=args.distance, parseErrors=parseErrors,
+                resume=args.resume, instruments=instruments, sampler=sampler )
+        if parseErrors: parseErrors.report()
+        if args.profile: instruments.profiler.dump_stats( args.profile )
+    elif args.command == 'prepare':
+        parseErrors = ParseErrors() if args.quiet else None
+        instruments = commandInstruments( args )
+        horizons = None
+        if args.lags is not None or args.lag_step is not None or args.features:
+            import snapshots
+            horizons = snapshots.Horizons( 3 if args.lags is None else args.lags,
+                    None if args.lag_step is None else floor( 4*args.lag_step ),
+                    args.features )
+        prepare( args.filename, args.outname, args.limit, tuple(args.sample),
+                tuple(args.delta), args.hasHead, workers=args.workers,
+                distance=args.distance, parseErrors=parseErrors,
+                resume=args.resume, instruments=instruments, format=args.format,
+                prefilter=args.prefilter, horizons=horizons, sampler=sampler )
+        if parseErrors: parseErrors.report()
+        if args.profile: instruments.profiler.dump_stats( args.profile )
+    elif args.command == 'rawsample':
+        rawsample( args.filename, args.outname, args.limit, args.start,
+                args.hasHead, indexed=args.indexed, sampler=sampler )
+    if args.stratify: sampler.report()
+    return 0
+
+# Instruments asked for by the --progress and --profile options, or None
+
+def commandInstruments( args ):
+    if not args.progress and not args.profile:
+        return None
+    import instrument
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    progress = sys.stderr if args.progress == '-' else args.progress
+    return instrument.Instruments( progress, args.progress_every, profiler )
+
+# Sampler asked for by the --reservoir, --stratify and --hash options, or None
+
+def commandSampler( args ):
+    if args.stratify and args.reservoir is None:
+        raise Exception( "--stratify needs --reservoir, the size of each stratum" )
+    if args.reservoir is not None and args.hash:
+        raise Exception( "Use one of --reservoir and --hash" )
+    if args.reservoir is None and not args.hash:
+        return None
+    import samplers
+    if args.stratify:
+        return samplers.StratifiedSampler( args.reservoir, args.stratify, args.seed )
+    if args.reservoir is not None:
+        return samplers.ReservoirSampler( args.reservoir, args.seed )
+    return samplers.HashSampler( args.hash[0], args.hash[1:] or (0,), args.seed )
 
+if __name__ == "__main__":
+    sys.exit( main() )
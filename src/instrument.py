@@ -0,0 +1,219 @@
+# INSTRUMENT - Opt-in timers, counters and progress for pipeline runs - Python
+#
+# Tells where the time of a prepare or summarize run goes. Hand an
+# Instruments to pipeline.run (or to prepare/summarize) and it will:
+#     - time each stage of the work, exclusive of the stages inside it:
+#         read - reading and splitting the CSV rows of the data file
+#         parse - parseWaypoints / tokenizeWaypoints, or waypointLists for
+#             a chunk of trips, with the distances
+#         judge - judgeWaypoints, the outlier checks
+#         decode - decodestamp
+#         format - building the output rows
+#         write - writing the output files
+#     - count entries read, waypoints parsed, rows written, and bytes read
+#       and written
+#     - write a progress record every 'interval' seconds, as a line of
+#       JSON, with rates and an ETA worked out from the position in the
+#       data file
+#     - start and stop a profiler around the run, e.g. a cProfile.Profile
+#
+# With no Instruments, none of this is done, and the run pays for nothing
+# more than a test of 'instruments' once per chunk of trips.
+#
+# The stages are timed by handing the run timed versions of the functions
+# it calls (see calls, and pipeline.Calls); the illume module is not
+# changed, so runs timed by other Instruments, and runs with none, may go
+# on at the same time.
+#
+# Progress records look like:
+#
+#     {"event": "progress", "elapsed": 12.0, "entries": 250000,
+#      "fraction": 0.147, "eta": 69.6, "entriesPerSec": 20833.3, ...,
+#      "stages": {"read": 1.9, "parse": 7.1, ...}}
+#
+# and the last one has "event": "end".
+#
+# Sample use:
+#
+# >>> tools = Instruments( progress='progress.jsonl', profiler=cProfile.Profile() )
+# >>> illume.prepare( 'train.csv', 'prepared.csv', instruments=tools )
+# >>> tools.profiler.dump_stats( 'prepare.prof' )
+
+import os
+import json
+import time
+
+import pipeline
+
+Stages = ( 'read', 'parse', 'judge', 'decode', 'format', 'write' )
+
+# The pipeline.Calls timed: the stage each is counted in, and for the
+# 'parse' stage, a function of the result giving the number of waypoints
+Timed = {
+    'parseWaypoints': ('parse', len),
+    'tokenizeWaypoints': ('parse', len),
+    'waypointLists': ('parse', lambda lists: sum( map( len, lists ))),
+    'judgeWaypoints': ('judge', None),
+    'decodestamp': ('decode', None) }
+
+# INSTRUMENTS - Timers, counters and progress records of one run
+#
+# Parameters:
+#    progress - where to write progress records: a file name, an open
+#        file, or None => no records
+#    interval - seconds between progress records
+#    profiler - object with enable() and disable() methods, started at
+#        the beginning of the run and stopped at the end; None => none
+#
+# Attributes:
+#    seconds - dictionary of stage name => exclusive seconds
+#    entries, points, rows, bytesRead, bytesWritten - counters; 'rows'
+#        counts the rows written by all branches
+
+class Instruments:
+
+    def __init__( self, progress=None, interval=10.0, profiler=None ):
+        self.progress = progress
+        self.interval = interval
+        self.profiler = profiler
+        self.seconds = { stage: 0.0 for stage in Stages }
+        self.entries = self.points = self.rows = 0
+        self.bytesRead = self.bytesWritten = 0
+        self.totalBytes = 0
+        self._firstByte = self._firstEntry = 0
+        self._inner = 0.0
+        self._stream = None
+        self._began = self._lastReport = None
+        self._running = False
+
+    # START - Begin timing a run over a data file of 'totalBytes' bytes,
+    # from entry 'entries' at byte 'offset' (not 0 for a resumed run)
+
+    def start( self, totalBytes, offset=0, entries=0 ):
+        self.totalBytes = totalBytes
+        self.bytesRead = self._firstByte = offset
+        self.entries = self._firstEntry = entries
+        if isinstance( self.progress, str ):
+            self._stream = open( self.progress, 'a' )
+        else:
+            self._stream = self.progress
+        self._running = True
+        self._began = self._lastReport = time.perf_counter()
+        self._record( 'start', pid=os.getpid() )
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    # STOP - End the run and write the last record; does nothing if the
+    # run was not started
+
+    def stop( self ):
+        if not self._running:
+            return
+        self._running = False
+        if self.profiler is not None:
+            self.profiler.disable()
+        self._record( 'end' )
+        if isinstance( self.progress, str ):
+            self._stream.close()
+        self._stream = None
+
+    # CALLS - The pipeline.Calls of the run, each timed as its stage
+
+    def calls( self ):
+        plain = pipeline.PlainCalls
+        return pipeline.Calls( **{ name: self.timed( stage, getattr( plain, name ), points )
+                                   for (name, (stage, points)) in Timed.items() })
+
+    # TIMED - Wrap a function so its calls are timed as a stage
+    #
+    # Time spent in other timed calls inside it is not counted, so the
+    # stage times add up to the elapsed time. With 'points', a function of
+    # the result, what it gives is added to the count of waypoints.
+
+    def timed( self, stage, function, points=None ):
+        clock = time.perf_counter
+
+        def timedCall( *args, **kwargs ):
+            began = clock()
+            outer = self._inner
+            self._inner = 0.0
+            try:
+                result = function( *args, **kwargs )
+            finally:
+                spent = clock() - began
+                self.seconds[stage] += spent - self._inner
+                self._inner = outer + spent
+            if points is not None:
+                self.points += points( result )
+            return result
+        return timedCall
+
+    # FEED - Time one branch's work on a chunk of trips (as 'format')
+
+    def feed( self, branch, trips ):
+        self.timed( 'format', branch.feed )( trips )
+
+    # WRITER - Wrap an output file so its writes are timed and counted
+
+    def writer( self, destiny ):
+        return _TimedFile( self, destiny )
+
+    # CHUNK - Count a chunk of entries done; write a progress record if due
+
+    def chunk( self, entries, bytesRead, branches ):
+        self.entries = entries
+        self.bytesRead = bytesRead
+        self.rows = sum( branch.rows for branch in branches )
+        if self._stream is not None and time.perf_counter() - self._lastReport >= self.interval:
+            self._record( 'progress' )
+
+    # REPORT - The counters, rates and stage times so far, as a dictionary
+
+    def report( self ):
+        elapsed = time.perf_counter() - self._began if self._began else 0.0
+        seconds = dict( self.seconds )
+        # whatever is not in another stage is reading the data file
+        seconds['read'] = max( 0.0, elapsed - sum( seconds[stage]
+                for stage in Stages if stage != 'read' ))
+        fraction = self.bytesRead / self.totalBytes if self.totalBytes else 0.0
+        done = self.bytesRead - self._firstByte
+        entries = self.entries - self._firstEntry
+        return {
+            'elapsed': elapsed,
+            'entries': self.entries,
+            'points': self.points,
+            'rows': self.rows,
+            'bytesRead': self.bytesRead,
+            'bytesWritten': self.bytesWritten,
+            'fraction': fraction,
+            'eta': elapsed * (self.totalBytes-self.bytesRead) / done
+                   if done > 0 and self.totalBytes else None,
+            'entriesPerSec': entries / elapsed if elapsed > 0 else 0.0,
+            'pointsPerSec': self.points / elapsed if elapsed > 0 else 0.0,
+            'stages': seconds }
+
+    def _record( self, event, **extra ):
+        self._lastReport = time.perf_counter()
+        if self._stream is None:
+            return
+        record = { 'event': event }
+        record.update( extra )
+        record.update( self.report() )
+        self._stream.write( json.dumps( record ) + "\n" )
+        self._stream.flush()
+
+# An output file whose writes are timed (as 'write') and counted
+
+class _TimedFile:
+
+    def __init__( self, instruments, destiny ):
+        self.instruments = instruments
+        self.destiny = destiny
+        self.write = instruments.timed( 'write', self._write )
+
+    def _write( self, text ):
+        self.instruments.bytesWritten += len(text.encode())
+        return self.destiny.write( text )
+
+    def __getattr__( self, name ):
+        return getattr( self.destiny, name )
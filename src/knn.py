@@ -0,0 +1,247 @@
+# KNN - k-nearest-neighbour destination prediction - Python
+#
+# Python version of taxi.knn and taxi.knn.trial (taxi.knn.R) that reads
+# the output of illume.prepare. Instead of a brute-force distance scan of
+# the whole training set for every test row, the weighted and scaled
+# feature columns of the training set are put in a KD-tree once, and all
+# the test rows are looked up in one batched query.
+#
+# Main functions:
+#     loadPrepared - read a prepare output file into column arrays
+#     KnnModel - a built neighbour index over a training set
+#     KnnModel.predict - same result columns as taxi.knn
+#     KnnModel.save, loadModel - keep a built model on disk
+#
+# The distance between two rows is the one taxi.knn.trial uses:
+#
+#     gap = sum over columns of ( delta * weight / stddev ) ^ 2
+#
+# where longitude weights are multiplied by cos(41.155 deg) so that a
+# degree of longitude counts the same as a degree of latitude in Porto,
+# and stddev is the sample standard deviation of the training column
+# (1 if scale=False or if the column does not vary). Scaling each column
+# by weight/stddev makes the gap a plain squared Euclidean distance,
+# which is what the tree indexes.
+#
+# scipy.spatial.cKDTree is used if scipy is installed; otherwise queries
+# fall back to a blocked brute-force scan with NumPy.
+#
+# Sample use:
+#
+# >>> train = loadPrepared( 'prepared.100k.csv' )
+# >>> model = KnnModel( train, weights={ 'LON_START': 5, 'LAT_START': 5,
+# ...         'LON_1P': 4.5, 'LAT_1P': 4.5, 'LON_00': 6.75, 'LAT_00': 6.75 })
+# >>> predicts = model.predict( loadPrepared( 'prepared.10x.csv' ), k=30 )
+
+import csv
+import pickle
+from math import cos, pi
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+import geoarray
+
+# Default weights of taxi.knn.trial: day hour and start point only
+DefaultWeights = { 'DAY_HOUR': 1, 'LON_START': 1, 'LAT_START': 1 }
+
+LonAdjustment = cos( 41.155*pi/180 )
+
+# Result columns of predict, named after those of taxi.knn
+PredictLabels = [
+    'TRIP_ID', 'INTVL', 'LON_PRED', 'LAT_PRED', 'PRED_RANGE',
+    'LON_DEV', 'LAT_DEV', 'DIST_ERROR', 'LON_ACT', 'LAT_ACT' ]
+
+# LOAD PREPARED - Read a prepare output file into column arrays
+#
+# Result:
+#    Dictionary of column label => array. Columns of numbers become
+#    float64 arrays (blank fields become NaN); the rest (CALL_TYPE,
+#    DAY_BUSY) stay as arrays of str.
+
+def loadPrepared( fileName ):
+    with open( fileName, 'r' ) as source:
+        table = csv.reader( source )
+        labels = next( table )
+        columns = list( zip( *table ))
+    data = { }
+    for (label, column) in zip( labels, columns ):
+        try:
+            data[label] = np.array( [ float(atom) if atom != '' else np.nan
+                    for atom in column ], dtype=np.float64 )
+        except ValueError:
+            data[label] = np.array( column, dtype=str )
+    if not columns:
+        data = { label: np.zeros( 0 ) for label in labels }
+    return data
+
+# KNN MODEL - A neighbour index built over a training set
+#
+# Parameters:
+#    train - dictionary of column arrays, as from loadPrepared
+#    weights - dictionary of column label => weight; columns not named
+#        (or weighted 0) are ignored; None => DefaultWeights
+#    scale - True => divide each column by its standard deviation
+#    target - labels of the destination longitude and latitude columns
+#
+# Attributes:
+#    columns, factors - the columns used and the factor each is scaled by
+#    targets - n x 2 array of training destinations
+#    sdLon, sdLat - standard deviation of the training destinations
+
+class KnnModel:
+
+    def __init__( self, train, weights=None, scale=True,
+                  target=('LON_FINISH', 'LAT_FINISH') ):
+        weights = DefaultWeights if weights is None else weights
+        self.columns = [ label for label in train
+                         if weights.get( label, 0 ) != 0 ]
+        self.factors = [ ]
+        for label in self.columns:
+            weight = weights[label]
+            if 'LON' in label:
+                weight *= LonAdjustment
+            stddev = 1
+            if scale:
+                stddev = np.std( train[label], ddof=1 ) if len(train[label]) > 1 else 0
+                if stddev == 0 or np.isnan( stddev ):
+                    stddev = 1
+            self.factors.append( weight/stddev )
+        self.target = target
+        self.targets = np.column_stack(( train[target[0]], train[target[1]] ))
+        self.sdLon = np.std( self.targets[:,0], ddof=1 )
+        self.sdLat = np.std( self.targets[:,1], ddof=1 )
+        self.points = self.features( train )
+        self.tree = cKDTree( self.points ) if cKDTree is not None else None
+
+    def __len__( self ):
+        return len(self.targets)
+
+    # FEATURES - Weighted, scaled feature matrix of a set of rows
+
+    def features( self, data ):
+        return np.column_stack( [ np.asarray( data[label], dtype=np.float64 ) * factor
+                for (label, factor) in zip( self.columns, self.factors ) ])
+
+    # NEIGHBOURS - Gaps and training-row numbers of the k nearest rows
+    #
+    # 'workers' is the number of threads of the tree search, -1 => one per
+    # CPU core.
+    #
+    # Result:
+    #    Tuple of two m x k arrays, nearest first: the gaps (squared
+    #    distances) and the row numbers of the training rows.
+
+    def neighbours( self, data, k=10, workers=-1 ):
+        k = min( k, len(self) )
+        queries = self.features( data )
+        if self.tree is not None:
+            (dists, nearests) = self.tree.query( queries, k=k, workers=workers )
+            dists = dists.reshape( len(queries), k )
+            nearests = nearests.reshape( len(queries), k )
+            return dists*dists, nearests
+        return _bruteNeighbours( self.points, queries, k )
+
+    # TRIAL - Predicted destinations of a set of rows, as by taxi.knn.trial
+    #
+    # Result:
+    #    m x 4 array, one row per test row:
+    #        longitude, latitude, lon.error, lat.error
+    #    The prediction is the mean of the destinations of the k nearest
+    #    training rows, each weighted by 1/(1+gap); the errors are the
+    #    standard deviations of those destinations.
+
+    def trial( self, data, k=10 ):
+        return self.combine( *self.neighbours( data, k ))
+
+    # COMBINE - The result of trial, from the result of neighbours
+    #
+    # The first k columns of a search for more than k neighbours give the
+    # same result as a search for k (see evaluate.py).
+
+    def combine( self, gaps, nearests ):
+        closeness = 1 / (1 + gaps)
+        lons = self.targets[nearests, 0]
+        lats = self.targets[nearests, 1]
+        total = closeness.sum( axis=1 )
+        result = np.empty( (len(gaps), 4) )
+        result[:,0] = (lons*closeness).sum( axis=1 ) / total
+        result[:,1] = (lats*closeness).sum( axis=1 ) / total
+        if gaps.shape[1] > 1:
+            result[:,2] = lons.std( axis=1, ddof=1 )
+            result[:,3] = lats.std( axis=1, ddof=1 )
+        else:
+            result[:,2:] = np.nan
+        return result
+
+    # PREDICT - Predictions and errors for a test set, as by taxi.knn
+    #
+    # Result:
+    #    Dictionary of the PredictLabels columns, one entry per test row:
+    #        TRIP_ID, INTVL - trip id and snapshot time of the test row
+    #        LON_PRED, LAT_PRED - predicted destination
+    #        PRED_RANGE - km from the prediction to prediction + errors
+    #        LON_DEV, LAT_DEV - standard deviation of training destinations
+    #        DIST_ERROR - km from the prediction to the actual destination
+    #        LON_ACT, LAT_ACT - location at snapshot time (LON_00, LAT_00),
+    #            as taxi.knn fills these columns
+
+    def predict( self, test, k=10 ):
+        prediction = self.trial( test, k )
+        (lon, lat) = prediction[:,0], prediction[:,1]
+        actLon = np.asarray( test[self.target[0]], dtype=np.float64 )
+        actLat = np.asarray( test[self.target[1]], dtype=np.float64 )
+        count = len(prediction)
+        return {
+            'TRIP_ID': np.asarray( test['TRIP_ID'] ).astype( np.int64 ),
+            'INTVL': np.asarray( test['SNAP_TIME'] ),
+            'LON_PRED': lon,
+            'LAT_PRED': lat,
+            'PRED_RANGE': geoarray.haverdistArray( lon, lat,
+                    lon+prediction[:,2], lat+prediction[:,3] ) / 1000,
+            'LON_DEV': np.full( count, self.sdLon ),
+            'LAT_DEV': np.full( count, self.sdLat ),
+            'DIST_ERROR': geoarray.haverdistArray( actLon, actLat, lon, lat ) / 1000,
+            'LON_ACT': np.asarray( test['LON_00'], dtype=np.float64 ),
+            'LAT_ACT': np.asarray( test['LAT_00'], dtype=np.float64 ) }
+
+    # SAVE - Write the built model (including its tree) to a file
+
+    def save( self, fileName ):
+        with open( fileName, 'wb' ) as out:
+            pickle.dump( self, out, protocol=pickle.HIGHEST_PROTOCOL )
+
+# LOAD MODEL - Read a model written by KnnModel.save
+
+def loadModel( fileName ):
+    with open( fileName, 'rb' ) as source:
+        return pickle.load( source )
+
+# WRITE PREDICTIONS - Write the result of predict as a CSV file
+
+def writePredictions( fileName, predicts ):
+    with open( fileName, 'w', newline='' ) as out:
+        table = csv.writer( out, lineterminator='\n' )
+        table.writerow( PredictLabels )
+        table.writerows( zip( *( predicts[label].tolist() for label in PredictLabels )))
+
+# Brute-force neighbour search used when scipy is not installed. The
+# queries are taken a block at a time to bound the size of the gap matrix.
+
+def _bruteNeighbours( points, queries, k ):
+    block = max( 1, (1 << 24) // max( 1, points.size ))
+    gaps = np.empty( (len(queries), k) )
+    nearests = np.empty( (len(queries), k), dtype=np.int64 )
+    for start in range( 0, len(queries), block ):
+        part = queries[start:start+block]
+        allGaps = ((part[:,None,:] - points[None,:,:])**2).sum( axis=2 )
+        near = np.argpartition( allGaps, k-1, axis=1 )[:,:k]
+        nearGaps = np.take_along_axis( allGaps, near, axis=1 )
+        order = np.argsort( nearGaps, axis=1, kind='stable' )
+        nearests[start:start+block] = np.take_along_axis( near, order, axis=1 )
+        gaps[start:start+block] = np.take_along_axis( nearGaps, order, axis=1 )
+    return gaps, nearests
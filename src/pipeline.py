@@ -0,0 +1,475 @@
+# PIPELINE - Streaming trip pipeline for the taxi-trip data file - Python
+#
+# summarize and prepare both read the taxi data file, parse each trip's
+# waypoints, and write rows of CSV. The pipeline splits that work into
+# generator stages that can be chained and reused:
+#
+#     readTrips - text rows of the data file => Trip records
+#     sampleTrips - keep every n-th trip, up to a stopping count
+#     parseTrips - parse the waypoints of each trip; those measured in
+#         the 'precise' mode are parsed a chunk at a time, by geoarray
+#     judgeTrips - mark each trip with its outlier excuse (0 = good)
+#     acceptTrips - keep only the good trips
+#     snapshotRows - good trips => prepare's snapshot rows
+#     summaryRows - trips => summarize's summary rows
+#
+# A Branch chains some stages and writes their rows to a file. The 'run'
+# function reads the data file once and feeds every trip to each of its
+# branches, a chunk of trips at a time, so any number of output files are
+# made in a single pass and memory use does not grow with the file. A
+# trip's waypoints are parsed at most once, however many branches use it.
+#
+# The stages call the illume functions that do the work (parseWaypoints,
+# judgeWaypoints, decodestamp, ...) through the Calls of the run, which
+# each trip carries; a run with instruments is handed timed versions of
+# them (see instrument.py), and illume itself is left as it is.
+#
+# A long run can keep a checkpoint file: every so many trips, the output
+# files are flushed, and the input position, entry count and output
+# positions are saved. A run started with resume=True picks up from the
+# last checkpoint, and makes the same output files as a run that was never
+# stopped. Records are taken to be single lines, as in the Porto data.
+#
+# The data file is read by a sources.PrefetchReader, in blocks of lines
+# read ahead on a thread of their own, so it may also be a gzip, bz2, xz,
+# zip or zstd file.
+#
+# Main functions:
+#     run - feed a data file to one or more branches
+#     summaryBranch - branch that writes the summarize file
+#     prepareBranch - branch that writes the prepare file
+#
+# Sample use:
+#
+# >>> run( 'D:/CKME 136/Taxi/train.csv', [
+# ...     summaryBranch( 'summary.csv' ),
+# ...     prepareBranch( 'prepared.csv', delta=(1,1) ) ])
+
+import os
+import csv
+import json
+
+import illume
+import sources
+
+# Size of the write buffer of each output file
+WriteBuffer = 1 << 20
+
+# CALLS - The functions the stages call to do their work
+#
+# Parameters:
+#    functions - name => function, in place of the usual one
+#
+# Attributes:
+#    parseWaypoints, tokenizeWaypoints, judgeWaypoints, decodestamp - the
+#        illume functions of those names
+#    waypointLists - geoarray.waypointLists, loaded when first called
+
+class Calls:
+
+    def __init__( self, **functions ):
+        self.parseWaypoints = illume.parseWaypoints
+        self.tokenizeWaypoints = illume.tokenizeWaypoints
+        self.judgeWaypoints = illume.judgeWaypoints
+        self.decodestamp = illume.decodestamp
+        self.waypointLists = _waypointLists
+        for (name, function) in functions.items():
+            if not hasattr( self, name ):
+                raise ValueError( "no such call: " + name )
+            setattr( self, name, function )
+
+# geoarray.waypointLists, with geoarray (and NumPy) loaded on first use
+
+def _waypointLists( texts ):
+    import geoarray
+    return geoarray.waypointLists( texts )
+
+# The calls of a run with no instruments
+PlainCalls = Calls()
+
+# TRIP - One trip (data row) moving through the pipeline
+#
+# Attributes:
+#    count - number of the entry in the file, from 1
+#    line - list of the data fields of the entry
+#    labels - header labels of the data file
+#    distance - how distances are measured, one of illume.DistanceModes
+#    errors - illume.ParseErrors to count bad points in, instead of
+#        printing bad trips; None => print them, as parseWaypoints does
+#    calls - Calls of the run the trip is in
+#    waypoints - list of waypoints, parsed from the POLYLINE field when
+#        first used
+#    excuse, drivedist, tripdist, triptime - set by judgeTrips
+
+class Trip:
+
+    __slots__ = ( 'count', 'line', 'labels', 'distance', 'errors', 'calls', '_waypoints',
+                  'excuse', 'drivedist', 'tripdist', 'triptime' )
+
+    def __init__( self, count, line, labels, distance='precise', errors=None,
+                  calls=PlainCalls ):
+        self.count = count
+        self.line = line
+        self.labels = labels
+        self.distance = distance
+        self.errors = errors
+        self.calls = calls
+        self._waypoints = None
+        self.excuse = None
+
+    @property
+    def waypoints( self ):
+        if self._waypoints is None:
+            self._waypoints = [ ]
+            for (label,atom) in zip( self.labels, self.line ):
+                if label == 'POLYLINE' and self.errors is None:
+                    self._waypoints = self.calls.parseWaypoints( atom, self.distance )
+                elif label == 'POLYLINE':
+                    self._waypoints = self.calls.tokenizeWaypoints( atom,
+                            self.distance, self.errors, self.count )
+        return self._waypoints
+
+# Stages - each takes an iterable of trips and generates trips or rows.
+
+def readTrips( table, labels, distance='precise', errors=None, count=0,
+               calls=PlainCalls ):
+    for line in table:
+        count += 1
+        yield Trip( count, line, labels, distance, errors, calls )
+
+def sampleTrips( trips, rate=1, skew=0, stopAt=None, sampler=None ):
+    for trip in trips:
+        if stopAt is not None and trip.count > stopAt:
+            break
+        if (trip.count % rate == skew
+        and (sampler is None or sampler.picks( trip.count, trip.line ))):
+            yield trip
+
+# The trips of a chunk whose distances are 'precise', with no errors to
+# count, are parsed together by geoarray.waypointLists, which gives the
+# same waypoints as illume.parseWaypoints; the others one at a time.
+
+def parseTrips( trips ):
+    trips = list( trips )
+    batch = [ trip for trip in trips
+              if trip._waypoints is None and trip.errors is None
+              and trip.distance == 'precise' and 'POLYLINE' in trip.labels
+              and trip.labels.index( 'POLYLINE' ) < len(trip.line) ]
+    if batch:
+        at = batch[0].labels.index( 'POLYLINE' )
+        texts = [ trip.line[at] for trip in batch ]
+        for (trip, waypoints) in zip( batch, batch[0].calls.waypointLists( texts )):
+            trip._waypoints = waypoints
+    for trip in trips:
+        trip.waypoints
+        yield trip
+
+def judgeTrips( trips, excuses=None ):
+    for trip in trips:
+        if trip.excuse is None:
+            (trip.excuse, trip.drivedist, trip.tripdist, trip.triptime) = \
+                    trip.calls.judgeWaypoints( trip.line, trip.waypoints, trip.distance )
+        if excuses is not None:
+            excuses[trip.excuse] += 1
+        yield trip
+
+def acceptTrips( trips ):
+    for trip in trips:
+        if trip.excuse == 0:
+            yield trip
+
+def snapshotRows( trips, wpFreq, wpStep, horizons=None ):
+    snapshotLines = horizons.snapshotLines if horizons else illume.snapshotLines
+    for trip in trips:
+        yield from snapshotLines( trip.line, trip.waypoints, trip.count,
+                trip.drivedist, trip.tripdist, trip.triptime, wpFreq, wpStep,
+                trip.calls.decodestamp )
+
+def summaryRows( trips ):
+    for trip in trips:
+        yield illume.summaryLine( trip.line, trip.waypoints, trip.distance )
+
+# BRANCH - A chain of stages writing rows to an output file
+#
+# Parameters:
+#    fileName - name of output file
+#    header - function of the source labels giving the output header labels
+#    stages - function of an iterable of trips giving an iterable of rows
+#    stopAt - last entry count the branch needs, None => all of them
+#    report - optional function of the final entry count and rows written,
+#        called when the run is over
+#    counters - optional list of numbers kept by the stages, saved and
+#        restored with checkpoints
+#    memory - optional object kept by the stages, with a state() method
+#        giving what it holds as JSON data, saved with checkpoints, and a
+#        restore(state) method, called with it on resume
+#
+# A branch may be fed in several chunks; 'stages' is called once per chunk,
+# so any counters it keeps must live outside it (see prepareBranch).
+
+class Branch:
+
+    # Branches that keep their results in memory until the end of the run
+    # cannot be checkpointed, and set this to False
+    resumable = True
+
+    def __init__( self, fileName, header, stages, stopAt=None, report=None,
+                  counters=None, memory=None ):
+        self.fileName = fileName
+        self.header = header
+        self.stages = stages
+        self.stopAt = stopAt
+        self.report = report
+        self.counters = counters if counters is not None else [ ]
+        self.memory = memory
+        self.rows = 0
+        self.destiny = None
+
+    def begin( self, labels ):
+        self.destiny = open( self.fileName, 'w', buffering=WriteBuffer )
+        if labels:
+            self.destiny.write( ",".join( self.header( labels )))
+            self.destiny.write( "\n" )
+
+    # The rows of a chunk are written with one call
+
+    def feed( self, trips ):
+        rows = list( self.stages( trips ))
+        self.destiny.write( "".join( rows ))
+        self.rows += len(rows)
+
+    # State of the branch for a checkpoint, with its output flushed to disk
+
+    def state( self ):
+        self.destiny.flush()
+        os.fsync( self.destiny.fileno() )
+        state = { 'fileName': self.fileName, 'rows': self.rows,
+                  'position': self.destiny.tell(), 'counters': list( self.counters ) }
+        if self.memory is not None:
+            state['memory'] = self.memory.state()
+        return state
+
+    # Go back to the state of a checkpoint, instead of 'begin'
+
+    def resume( self, state ):
+        if state['fileName'] != self.fileName:
+            raise ValueError( "checkpoint is for another output file: " + state['fileName'] )
+        self.destiny = open( self.fileName, 'r+', buffering=WriteBuffer )
+        self.destiny.seek( state['position'] )
+        self.destiny.truncate()
+        self.rows = state['rows']
+        self.counters[:] = state['counters']
+        if self.memory is not None:
+            self.memory.restore( state.get( 'memory', [ ] ))
+
+    def end( self, count ):
+        self.destiny.close()
+        if self.stopAt is not None:
+            count = min( count, self.stopAt )
+        if self.report:
+            self.report( count, self.rows )
+
+# RUN - Feed every trip of a data file to one or more branches
+#
+# Parameters:
+#    fileName - name of input file of taxi data
+#    branches - list of Branch
+#    hasHead - True => the input file (and so each output file) has a header
+#    chunkSize - number of trips handed to the branches at a time
+#    distance - how to measure distances, one of illume.DistanceModes
+#    errors - illume.ParseErrors to count bad points in; None => print
+#        each bad trip
+#    checkpoint - name of the checkpoint file; None => keep no checkpoints
+#    every - number of entries between checkpoints
+#    resume - True => carry on from the checkpoint file, if there is one
+#    instruments - instrument.Instruments to time and count the run in,
+#        whose timed Calls the trips carry; None => no instruments
+#
+# Result:
+#    Number of entries read from the input file
+
+def run( fileName, branches, hasHead=True, chunkSize=1000, distance='precise',
+         errors=None, checkpoint=None, every=100000, resume=False,
+         instruments=None ):
+    stops = [ branch.stopAt for branch in branches ]
+    stopAt = None if None in stops else max( stops, default=0 )
+    if checkpoint and not all( branch.resumable for branch in branches ):
+        raise ValueError( "cannot checkpoint a run with these branches" )
+    reader = sources.PrefetchReader( fileName )
+    where = [ 0 ]
+    table = csv.reader( _lines( reader, where ))
+    labels = next( table, [ ] ) if hasHead else [ ]
+    count = 0
+    saved = None
+    if checkpoint and resume and os.path.exists( checkpoint ):
+        saved = readCheckpoint( checkpoint, fileName )
+    if saved:
+        reader.close()
+        reader = sources.PrefetchReader( fileName, saved['offset'] )
+        table = csv.reader( _lines( reader, where ))
+        where[0] = saved['offset']
+        count = saved['count']
+        for (branch, state) in zip( branches, saved['branches'] ):
+            branch.resume( state )
+        if errors is not None and 'errors' in saved:
+            errors.__dict__.update( saved['errors'] )
+    else:
+        for branch in branches:
+            branch.begin( labels )
+    calls = PlainCalls
+    try:
+        if instruments:
+            instruments.start( sources.sourceSize( fileName ), where[0], count )
+            calls = instruments.calls()
+            for branch in branches:
+                if branch.destiny is not None:
+                    branch.destiny = instruments.writer( branch.destiny )
+        lastSaved = count
+        chunk = [ ]
+        for trip in readTrips( table, labels, distance, errors, count, calls ):
+            count = trip.count
+            chunk.append( trip )
+            stop = count == stopAt
+            if stop or len(chunk) >= chunkSize or illume.isInteresting( count ):
+                if instruments:
+                    for branch in branches:
+                        instruments.feed( branch, chunk )
+                    instruments.chunk( count, where[0], branches )
+                else:
+                    for branch in branches:
+                        branch.feed( chunk )
+                chunk = [ ]
+                if checkpoint and not stop and count - lastSaved >= every:
+                    writeCheckpoint( checkpoint, fileName, where[0], count, branches, errors )
+                    lastSaved = count
+            if stop: break
+            if illume.isInteresting( count ):
+                print( "At", count )
+        if instruments:
+            for branch in branches:
+                instruments.feed( branch, chunk )
+        else:
+            for branch in branches:
+                branch.feed( chunk )
+        reader.close()
+        for branch in branches:
+            branch.end( count )
+    finally:
+        reader.close()
+        if instruments:
+            try:
+                instruments.chunk( count, where[0], branches )
+            finally:
+                instruments.stop()
+    if checkpoint and os.path.exists( checkpoint ):
+        os.remove( checkpoint )
+    return count
+
+# WRITE CHECKPOINT - Save the state of a run, all at once
+#
+# The output files are flushed first, then the checkpoint is written to a
+# new file that replaces the old one in a single step, so a crash at any
+# point leaves either the old checkpoint or the new one.
+
+def writeCheckpoint( checkpoint, fileName, offset, count, branches, errors=None ):
+    stat = os.stat( fileName )
+    saved = {
+        'source': os.path.abspath( fileName ),
+        'sourceSize': stat.st_size,
+        'sourceTime': stat.st_mtime,
+        'offset': offset,
+        'count': count,
+        'branches': [ branch.state() for branch in branches ] }
+    if errors is not None:
+        saved['errors'] = dict( errors.__dict__ )
+    with open( checkpoint + '.tmp', 'w' ) as out:
+        json.dump( saved, out )
+        out.flush()
+        os.fsync( out.fileno() )
+    os.replace( checkpoint + '.tmp', checkpoint )
+
+# READ CHECKPOINT - Load a checkpoint, checking it is for this input file
+
+def readCheckpoint( checkpoint, fileName ):
+    with open( checkpoint, 'r' ) as source:
+        saved = json.load( source )
+    stat = os.stat( fileName )
+    if (saved['source'] != os.path.abspath( fileName )
+    or saved['sourceSize'] != stat.st_size
+    or saved['sourceTime'] != stat.st_mtime):
+        raise ValueError( "checkpoint " + checkpoint + " is for another input file" )
+    return saved
+
+# Text lines of a sources.PrefetchReader, counting the bytes read in where[0]
+
+def _lines( reader, where ):
+    for lines in reader.blocks():
+        for line in lines:
+            where[0] += len(line)
+            yield line.decode()
+
+# SUMMARY BRANCH - Branch that writes the summarize file
+#
+# Parameters are as for illume.summarize.
+
+def summaryBranch( summName, limit=0, sample=1, sampler=None ):
+
+    def header( labels ):
+        return labels[0:8] + [ "DRIVE_DIST", "TRIP_DIST", "TRIP_TIME" ]
+
+    def stages( trips ):
+        return summaryRows( parseTrips( sampleTrips( trips, sample, 0, stopAt, sampler )))
+
+    def report( count, rows ):
+        print( "End at", count )
+
+    stopAt = limit if limit != 0 else None
+    return Branch( summName, header, stages, stopAt, report )
+
+# PREPARE BRANCH - Branch that writes the prepare file
+#
+# Parameters are as for illume.prepare. The closing report of prepare,
+# with the count of each outlier excuse, is printed at the end of the run.
+# With a format other than 'csv', the branch is a writers.ColumnBranch.
+# With prefilter=True, duplicate trips are dropped before they are parsed,
+# and GPS jumps are mended after (see prefilter.py); the table of recent
+# trips it keeps is saved with checkpoints. With horizons, a
+# snapshots.Horizons, the rows have its lag points and features. With
+# sampler, a sampler of samplers.py, only its picks are taken; a reservoir
+# sampler must have scanned the file first.
+
+def prepareBranch( prepName, limit=0, sample=(0,1), delta=(2.5,2.5), format='csv',
+                   prefilter=False, horizons=None, sampler=None ):
+    (sampleSkew, sampleRate, wpFreq, wpStep) = illume.prepareParams( sample, delta )
+    excuses = [0] * 6
+    filters = None
+    if prefilter:
+        import prefilter
+        # the prefilter counts follow the excuse counts, in one list
+        excuses += [0] * len(prefilter.CountNames)
+        filters = prefilter.Prefilter( wpFreq, counts=excuses, first=6 )
+
+    def header( labels ):
+        return horizons.labels() if horizons else illume.PrepareLabels
+
+    def stages( trips ):
+        return snapshotRows( goodTrips( trips ), wpFreq, wpStep, horizons )
+
+    def report( count, rows ):
+        illume.printExcuses( count, excuses, rows )
+        if filters:
+            filters.report()
+
+    def goodTrips( trips ):
+        trips = sampleTrips( trips, sampleRate, sampleSkew, stopAt, sampler )
+        if filters:
+            trips = filters.mend( parseTrips( filters.dedupe( trips )))
+        return acceptTrips( judgeTrips( parseTrips( trips ), excuses ))
+
+    stopAt = illume.prepareStop( limit, sampleRate )
+    if format != 'csv':
+        import writers
+        return writers.ColumnBranch( prepName, format, goodTrips, wpFreq, wpStep,
+                stopAt, report, counters=excuses, horizons=horizons )
+    return Branch( prepName, header, stages, stopAt, report, counters=excuses,
+                   memory=filters )
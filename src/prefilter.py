@@ -0,0 +1,251 @@
+# PREFILTER - Drop duplicate trips, and mend GPS jumps, before prepare - Python
+#
+# The Porto data holds trips that were sent twice, exactly or nearly
+# (same taxi, same start and end, a few seconds or points apart), and
+# trips with GPS jumps: 15-second segments of over 625 metres (150 km/h)
+# that judgeWaypoints rejects as excuse 4, after the whole trip has been
+# parsed. This module adds two pipeline stages for prepare:
+#
+#     Prefilter.dedupe - before parsing: drop each trip whose fingerprint
+#         matches a recent trip, so it is never parsed or flattened
+#     Prefilter.mend - after parsing: mend each jump of a trip, then split
+#         the trip at the jumps that are left, instead of discarding it
+#
+# The fingerprint of a trip is read from its fields with a cheap scan of
+# the POLYLINE text, without parsing it:
+#     TAXI_ID, TIMESTAMP, number of points, and the start and end points
+#     rounded to a grid of 'quantum' degrees
+# Fingerprints are kept in a bounded LRU table (least recently seen are
+# dropped first), keyed by taxi and start. A trip is:
+#     an exact duplicate - same TIMESTAMP, number of points and end as
+#         the last trip of its key
+#     a near duplicate - TIMESTAMP within 'nearSeconds', and number of
+#         points within 'nearPoints', of the last trip of its key (a taxi
+#         cannot start two real trips at the same place so close together)
+# The data is in time order, so duplicates are close together, and a
+# table of some thousands of keys finds nearly all of them.
+#
+# Jumps are mended in two ways:
+#     repair - a single point far from both of its neighbours, when the
+#         neighbours are within two steps' reach of each other, is a
+#         spike: it is moved to the middle of its neighbours
+#     split - the trip is cut at each jump left; each piece of at least
+#         'minPoints' points goes on as a trip of its own, with the
+#         TRIP_ID of the trip, and a TIMESTAMP moved on 15 seconds for
+#         each point before the piece; so the rows of a piece have the
+#         same TRIP_ID as the rows of the pieces before it, and a SNAP_TIME
+#         that starts again at 0; prepare's excuse counts count each
+#         piece as a trip
+# A trip with a point that could not be parsed (parseWaypoints gives it as
+# (0,0)) is not mended or split: it goes on as it is, and is judged as it
+# would be with no prefilter. A mended trip, and each piece, is a new
+# pipeline.Trip; the trip it came from is left as it was, as other
+# branches of the run may share it.
+#
+# The counts of the stages are kept in a list (see CountNames), so they
+# can be checkpointed with the other counters of a pipeline.Branch. The
+# table of fingerprints is checkpointed too, as the branch's memory (see
+# state and restore), so a resumed run drops the same duplicates as a run
+# that was never stopped.
+#
+# Sample use:
+#
+# >>> illume.prepare( 'train.csv', 'prepared.csv', prefilter=True )
+
+import collections
+
+import illume
+import pipeline
+
+# Longest 15-second segment that is not a jump, as in judgeWaypoints
+JumpMetres = 625
+
+# Names of the counts kept by a Prefilter
+CountNames = ( 'exact', 'near', 'savedRows', 'repairedTrips', 'repairedPoints',
+               'splitTrips', 'pieces' )
+
+# PREFILTER - Stages that drop duplicate trips and mend GPS jumps
+#
+# Parameters:
+#    wpFreq - snapshot spacing in waypoints, to count the rows saved
+#    quantum - grid of the rounded start and end points, in degrees
+#    nearSeconds, nearPoints - largest differences of a near duplicate
+#    keep - number of keys kept in the table of fingerprints
+#    minPoints - fewest points of a piece of a split trip
+#    repair, split - False => do not repair spikes, or split trips
+#    counts - list to keep the counts in, from index 'first'; None => a
+#        list of its own
+#
+# Attributes:
+#    exact, near - number of exact and near duplicates dropped
+#    savedRows - number of snapshot rows the duplicates would have made
+#    repairedTrips, repairedPoints - number of trips and points repaired
+#    splitTrips, pieces - number of trips split, and pieces kept
+
+class Prefilter:
+
+    def __init__( self, wpFreq=10, quantum=0.001, nearSeconds=60, nearPoints=2,
+                  keep=65536, minPoints=2, repair=True, split=True,
+                  counts=None, first=0 ):
+        self.wpFreq = max( 1, wpFreq )
+        self.quantum = quantum
+        self.nearSeconds = nearSeconds
+        self.nearPoints = nearPoints
+        self.keep = keep
+        self.minPoints = minPoints
+        self.repair = repair
+        self.split = split
+        self.counts = counts if counts is not None else [0] * len(CountNames)
+        self.first = first
+        self.seen = collections.OrderedDict()
+
+    def __getattr__( self, name ):
+        if name in CountNames:
+            return self.counts[self.first + CountNames.index( name )]
+        raise AttributeError( name )
+
+    def _add( self, name, amount=1 ):
+        self.counts[self.first + CountNames.index( name )] += amount
+
+    # FINGERPRINT - (taxi, start), stamp, point count and end of a trip
+
+    def fingerprint( self, trip ):
+        line = trip.line
+        text = line[ trip.labels.index( 'POLYLINE' ) ] if 'POLYLINE' in trip.labels else ''
+        count = text.count( '],[' ) + 1 if len(text) > 2 else 0
+        start = self._rounded( text.lstrip( '[' ).partition( ']' )[0] )
+        tail = text.rstrip( ']' )
+        end = self._rounded( tail[ tail.rfind( '[' )+1: ] )
+        try:
+            stamp = int( line[5] )
+        except (ValueError, IndexError):
+            stamp = None
+        return (line[4] if len(line) > 4 else None, start), stamp, count, end
+
+    # DEDUPE - Stage: drop trips that duplicate a recent trip
+
+    def dedupe( self, trips ):
+        seen = self.seen
+        for trip in trips:
+            (key, stamp, count, end) = self.fingerprint( trip )
+            last = seen.get( key )
+            seen[key] = (stamp, count, end)
+            seen.move_to_end( key )
+            if len(seen) > self.keep:
+                seen.popitem( last=False )
+            if last is not None and stamp is not None and last[0] is not None:
+                if (stamp, count, end) == last:
+                    self._add( 'exact' )
+                    self._add( 'savedRows', (count + self.wpFreq - 1) // self.wpFreq )
+                    continue
+                if (abs( stamp - last[0] ) <= self.nearSeconds
+                and abs( count - last[1] ) <= self.nearPoints):
+                    self._add( 'near' )
+                    self._add( 'savedRows', (count + self.wpFreq - 1) // self.wpFreq )
+                    continue
+            yield trip
+
+    # STATE - The table of fingerprints as JSON data, least recent first
+    #
+    # [ [taxi, start, stamp, count, end], ... ], start and end as [x, y]
+    # or None
+
+    def state( self ):
+        return [ [ taxi, start, stamp, count, end ]
+                 for ((taxi, start), (stamp, count, end)) in self.seen.items() ]
+
+    # RESTORE - Refill the table of fingerprints from the result of state
+
+    def restore( self, state ):
+        self.seen = collections.OrderedDict(
+                ((taxi, _pair( start )), (stamp, count, _pair( end )))
+                for (taxi, start, stamp, count, end) in state )
+
+    # MEND - Stage: repair spikes, then split trips at the jumps left
+
+    def mend( self, trips ):
+        for trip in trips:
+            waypoints = trip.waypoints
+            jumps = [ ix for ix in range( 1, len(waypoints) ) if waypoints[ix][2] > JumpMetres ]
+            if not jumps or any( here[0] == 0 or here[1] == 0 for here in waypoints ):
+                yield trip
+                continue
+            points = [ (here[0], here[1]) for here in waypoints ]
+            if self.repair:
+                mended = self._repair( points, jumps, trip.distance )
+                if mended:
+                    self._add( 'repairedTrips' )
+                    self._add( 'repairedPoints', mended )
+                    waypoints = rebuildWaypoints( points, trip.distance )
+                    jumps = [ ix for ix in range( 1, len(waypoints) )
+                              if waypoints[ix][2] > JumpMetres ]
+            if not jumps or not self.split:
+                if waypoints is not trip.waypoints:
+                    trip = _piece( trip, trip.line, waypoints )
+                yield trip
+                continue
+            self._add( 'splitTrips' )
+            for (first, last) in zip( [ 0 ] + jumps, jumps + [ len(points) ] ):
+                if last - first < self.minPoints:
+                    continue
+                self._add( 'pieces' )
+                line = list( trip.line )
+                if first > 0:
+                    line[5] = str( int( line[5] ) + 15*first )
+                yield _piece( trip, line, rebuildWaypoints( points[first:last], trip.distance ))
+
+    # REPORT - Print the counts
+
+    def report( self ):
+        print( "Prefilter:" )
+        print( "-", self.exact, "exact and", self.near, "near duplicates dropped,",
+               self.savedRows, "rows not flattened" )
+        print( "-", self.repairedTrips, "trips repaired,", self.repairedPoints, "points moved" )
+        print( "-", self.splitTrips, "trips split into", self.pieces, "pieces" )
+
+    # Move each spike to the middle of its neighbours; result is the count
+
+    def _repair( self, points, jumps, mode ):
+        distFunc = illume.DistanceModes[mode][0]
+        mended = 0
+        jumpSet = set( jumps )
+        for ix in jumps:
+            # a spike is a jump into point ix and a jump out of it
+            if ix not in jumpSet or ix+1 not in jumpSet:
+                continue
+            (before, after) = points[ix-1], points[ix+1]
+            if 0 in before or 0 in after:
+                continue
+            if distFunc( before[0], before[1], after[0], after[1] ) <= 2*JumpMetres:
+                points[ix] = ((before[0]+after[0]) / 2, (before[1]+after[1]) / 2)
+                jumpSet.discard( ix+1 )
+                mended += 1
+        return mended
+
+    def _rounded( self, text ):
+        (longi, junk, lati) = text.partition( ',' )
+        try:
+            return (round( float( longi ) / self.quantum ), round( float( lati ) / self.quantum ))
+        except ValueError:
+            return None
+
+# A rounded point read back from JSON, where it is a list
+
+def _pair( point ):
+    return None if point is None else tuple( point )
+
+# A new trip like 'trip', with other fields and waypoints
+
+def _piece( trip, line, waypoints ):
+    piece = pipeline.Trip( trip.count, line, trip.labels, trip.distance, trip.errors,
+            trip.calls )
+    piece._waypoints = waypoints
+    return piece
+
+# REBUILD WAYPOINTS - Waypoints of a list of (lon, lat) points
+#
+# Same distances, headings and rules for (0,0) points as parseWaypoints,
+# as both are made by illume.stepWaypoints.
+
+def rebuildWaypoints( points, mode='precise' ):
+    return illume.stepWaypoints( points, mode )
@@ -0,0 +1,239 @@
+# RENDER - Paged, filtered and cached display of taxi-trip entries - Python
+#
+# illume prints the entries it picks one after another, straight to the
+# terminal. For reviewing a few thousand trips, browse shows them a page
+# at a time instead:
+#
+#     - each entry is rendered as one block of text (illume.tripBlock),
+#       and each page is written with one call
+#     - only the entries that pass a TripFilter are shown: by taxi, call
+#       type, time window and number of points; the filter looks at the
+#       raw fields and counts the points of the POLYLINE text, so an entry
+#       that does not pass is never parsed
+#     - with a taxi filter and the trip index of the file (tripindex.py),
+#       only the entries of that taxi are read, by seeking to them
+#     - rendered blocks are kept in an LRU cache keyed by entry number
+#       and TRIP_ID (the data has entries that share a TRIP_ID), so
+#       going back a page shows it again without parsing the entries
+#       again; a block dropped from the cache is read again by seeking
+#       with the index, or else by reading the file up to it
+#
+# In a terminal, browse waits after each page for a key: Enter (or n) for
+# the next page, b for the one before, q to stop. Elsewhere (e.g. output
+# to a file or a pipe) it writes every page with no stops.
+#
+# Command use:
+#
+#     python src/illume.py illume train.csv --page 10 --taxi-id 20000589
+#         [--call-type A|B|C] [--since TIME] [--until TIME]
+#         [--min-points N] [--max-points N]
+#
+# TIME is a Unix timestamp or an ISO date and time in UTC, e.g. 2013-07-01
+# or 2013-07-01T08:00.
+#
+# Sample use:
+#
+# >>> browse( 'train.csv', TripFilter( callType='B', minPoints=200 ), pageSize=5 )
+
+import os
+import sys
+import csv
+import datetime as dt
+import collections
+
+import illume
+import sources
+
+# TRIP FILTER - Which entries to show
+#
+# Parameters:
+#    taxiId - TAXI_ID of the entries, None => any
+#    callType - CALL_TYPE of the entries, None => any
+#    since, until - TIMESTAMP range of the entries, from 'since' up to but
+#        not including 'until'; Unix seconds or ISO text, None => open
+#    minPoints, maxPoints - range of the number of waypoints, None => open
+
+class TripFilter:
+
+    def __init__( self, taxiId=None, callType=None, since=None, until=None,
+                  minPoints=None, maxPoints=None ):
+        self.taxiId = None if taxiId is None else str(taxiId)
+        self.callType = callType
+        self.since = _stamp( since )
+        self.until = _stamp( until )
+        self.minPoints = minPoints
+        self.maxPoints = maxPoints
+
+    def matches( self, line ):
+        if len(line) < 9:
+            return False
+        if self.taxiId is not None and line[4] != self.taxiId:
+            return False
+        if self.callType is not None and line[1] != self.callType:
+            return False
+        if self.since is not None or self.until is not None:
+            try:
+                stamp = int( line[5] )
+            except ValueError:
+                return False
+            if self.since is not None and stamp < self.since:
+                return False
+            if self.until is not None and stamp >= self.until:
+                return False
+        if self.minPoints is not None or self.maxPoints is not None:
+            text = line[8]
+            points = text.count( '],[' ) + 1 if len(text) > 2 else 0
+            if self.minPoints is not None and points < self.minPoints:
+                return False
+            if self.maxPoints is not None and points > self.maxPoints:
+                return False
+        return True
+
+# BLOCK CACHE - Rendered blocks of entries, keyed by (entry, TRIP_ID)
+#
+# The 'size' blocks used last are kept; the least recently used goes
+# first when the cache is full.
+
+class BlockCache:
+
+    def __init__( self, size=1024 ):
+        self.size = size
+        self.blocks = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def get( self, key ):
+        block = self.blocks.get( key )
+        if block is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.blocks.move_to_end( key )
+        return block
+
+    def put( self, key, block ):
+        self.blocks[key] = block
+        self.blocks.move_to_end( key )
+        if len(self.blocks) > self.size:
+            self.blocks.popitem( last=False )
+
+# BROWSE - Show the entries of a data file a page at a time
+#
+# Parameters:
+#    filename - name of file of taxi data
+#    filters - TripFilter, None => every entry
+#    pageSize - entries per page
+#    limit - not 0 => show at most 'limit' entries
+#    hasHead - True => the data file has a header row
+#    indexed - True => use the trip index even if it was never built;
+#        the index is used anyway if it is there
+#    cache - BlockCache to keep blocks in, None => a new one
+#    output - file to write to, None => standard output
+#    ask - function of the page number giving 'next', 'back' or 'quit';
+#        None => ask at the terminal, if output is one, else 'next'
+#
+# Result:
+#    Number of entries shown (each counted once, however often it is shown)
+
+def browse( filename, filters=None, pageSize=10, limit=0, hasHead=True,
+            indexed=False, cache=None, output=None, ask=None ):
+    output = output or sys.stdout
+    cache = cache if cache is not None else BlockCache()
+    if ask is None:
+        ask = _askTerminal if output.isatty() and sys.stdin.isatty() else lambda page: 'next'
+    index = None
+    if indexed or os.path.exists( filename + '.index.npz' ):
+        import tripindex
+        index = tripindex.loadIndex( filename, hasHead )
+    (labels, entries) = _entries( filename, filters, hasHead, index )
+    labelwidth = max( [ 3 ] + [ len(label) for label in labels ] )
+
+    pages = [ ]    # (count, TRIP_ID) of the entries of each page seen
+    shown = 0
+    page = 0
+    while True:
+        if page == len(pages):
+            picked = [ ]
+            for (count, line) in entries:
+                block = illume.tripBlock( count, labels, line, labelwidth )
+                cache.put( (count, line[0]), block )
+                picked.append( (count, line[0]) )
+                if len(picked) == pageSize or (limit and shown + len(picked) >= limit):
+                    break
+            if not picked:
+                break
+            pages.append( picked )
+            shown += len(picked)
+        blocks = [ ]
+        for (count, tripId) in pages[page]:
+            block = cache.get( (count, tripId) )
+            if block is None:
+                block = _render( filename, hasHead, index, labels, labelwidth, count )
+                cache.put( (count, tripId), block )
+            blocks.append( block )
+        output.write( "".join( blocks ))
+        output.flush()
+        if limit and shown >= limit and page == len(pages) - 1:
+            break
+        answer = ask( page + 1 )
+        if answer == 'quit':
+            break
+        page = max( 0, page - 1 ) if answer == 'back' else page + 1
+    if shown > 0:
+        output.write( "_" * (labelwidth+2) + "\n" )
+    return shown
+
+# The header labels of a data file, and an iterator of the (count, fields)
+# of the entries that pass the filters
+
+def _entries( filename, filters, hasHead, index ):
+    labels = [ ]
+    if hasHead:
+        with sources.openLines( filename ) as source:
+            labels = next( csv.reader( source ), [ ] )
+    if index is not None and filters is not None and filters.taxiId is not None:
+        import tripindex
+        picked = index.taxiEntries( filters.taxiId ).tolist()
+        lines = ( (count, next( csv.reader( [ text ] ), [ ] ))
+                  for (count, text) in tripindex.readEntries( filename, index, picked ))
+    else:
+        lines = _readAll( filename, hasHead )
+    entries = ( (count, line) for (count, line) in lines
+                if filters is None or filters.matches( line ))
+    return labels, entries
+
+def _readAll( filename, hasHead ):
+    with sources.openLines( filename ) as source:
+        table = csv.reader( source )
+        if hasHead:
+            next( table, None )
+        yield from enumerate( table, 1 )
+
+# Render entry 'count' again, for a block that is no longer in the cache
+
+def _render( filename, hasHead, index, labels, labelwidth, count ):
+    if index is not None:
+        import tripindex
+        for (count, text) in tripindex.readEntries( filename, index, [ count ] ):
+            line = next( csv.reader( [ text ] ), [ ] )
+    else:
+        for (at, line) in _readAll( filename, hasHead ):
+            if at == count: break
+    return illume.tripBlock( count, labels, line, labelwidth )
+
+def _askTerminal( page ):
+    answer = input( "-- page {:d}: Enter/n next, b back, q quit -- ".format( page ))
+    answer = answer.strip().lower()[:1]
+    return 'back' if answer == 'b' else 'quit' if answer == 'q' else 'next'
+
+# Unix seconds of a TIMESTAMP bound: a number, or ISO date and time in UTC
+
+def _stamp( when ):
+    if when is None:
+        return None
+    try:
+        return int( when )
+    except ValueError:
+        stamp = dt.datetime.fromisoformat( str(when) )
+        if stamp.tzinfo is None:
+            stamp = stamp.replace( tzinfo=dt.timezone.utc )
+        return int( stamp.timestamp() )
@@ -0,0 +1,200 @@
+# SAMPLERS - Streaming samplers of taxi-trip entries - Python
+#
+# The 'sample' of summarize and prepare picks entries by position
+# (inCount % rate == skew), and the limit=0 picks of illume and rawsample
+# (isInteresting) bunch up at the start of the file, which is in time
+# order. The samplers here pick entries in a single pass over the file,
+# whatever its order:
+#
+#     ReservoirSampler - a uniform random sample of 'size' entries, with
+#         memory for 'size' entries only (reservoir sampling, Algorithm R)
+#     StratifiedSampler - a uniform random sample of 'size' entries from
+#         each stratum: each CALL_TYPE, DAY_BUSY, DAY_HOUR (whole hours
+#         4..27) or combination of them
+#     HashSampler - the entries whose TRIP_ID hashes, with a seed, into
+#         the buckets kept; no memory at all, and the same picks in any
+#         process, so train/test splits (hashSplit) and the shards of
+#         parallel workers are disjoint and reproducible with no
+#         coordination
+#
+# The entries picked depend only on the seed and the file, never on the
+# order of the runs. A sampler is used in one of two ways:
+#     streaming - offer each entry in turn; picks(count, line) says at
+#         once whether it is picked (HashSampler only)
+#     reservoir - offer each entry in turn, then take the picks at the
+#         end, with chosen(); or scan the file first, then ask picks()
+#
+# illume and rawsample offer entries as they read them, and print or write
+# the picks at the end (at once, when streaming). summarize and prepare
+# stream their entries through the trip pipeline, so they scan the file
+# for the picks of a reservoir sampler first; the scan reads only the CSV
+# fields, not the waypoints, and is a small part of the cost of the run.
+#
+# Sample use:
+#
+# >>> illume.rawsample( 'train.csv', 'sample.csv', sampler=ReservoirSampler( 1000 ))
+# >>> (train, test) = hashSplit( 0.8, seed=7 )
+# >>> illume.prepare( 'train.csv', 'prepared.train.csv', sampler=train )
+# >>> illume.prepare( 'train.csv', 'prepared.test.csv', sampler=test )
+
+import csv
+import random
+import hashlib
+
+import illume
+import sources
+
+# Strata of StratifiedSampler: label => function of the fields of an entry
+Strata = {
+    'CALL_TYPE': lambda line: line[1],
+    'DAY_BUSY': lambda line: illume.decodestamp( line[5] )[3],
+    'DAY_HOUR': lambda line: int( illume.decodestamp( line[5] )[4] ) }
+
+# HASH SAMPLER - Pick entries by a seeded hash of their TRIP_ID
+#
+# Parameters:
+#    buckets - number of buckets the TRIP_IDs are hashed into
+#    keep - buckets of the entries picked
+#    seed - seed of the hash; another seed => another partition
+#
+# Sample use, one of N workers: HashSampler( N, ( worker, ))
+
+class HashSampler:
+
+    streaming = True
+
+    def __init__( self, buckets=10, keep=(0,), seed=0 ):
+        if buckets < 1 or not all( 0 <= bucket < buckets for bucket in keep ):
+            raise ValueError( "kept buckets must be in range of the number of buckets" )
+        self.buckets = buckets
+        self.keep = frozenset( keep )
+        self.key = str(seed).encode()
+
+    def bucket( self, tripId ):
+        digest = hashlib.blake2b( tripId.encode(), digest_size=8, key=self.key ).digest()
+        return int.from_bytes( digest, 'little' ) % self.buckets
+
+    def picks( self, count, line ):
+        return self.bucket( line[0] ) in self.keep
+
+    def offer( self, count, line, item=None ):
+        return self.picks( count, line )
+
+    # Nothing to scan: the picks are known as the entries come
+
+    def scan( self, fileName, hasHead=True, stopAt=None, rate=1, skew=0 ):
+        pass
+
+# HASH SPLIT - Disjoint train and test HashSamplers
+#
+# Parameters:
+#    fraction - share of the entries in the training set
+#    seed - seed of the hash
+#    buckets - resolution of the split
+#
+# Result:
+#    Tuple (train, test) of HashSampler; every entry is in exactly one
+
+def hashSplit( fraction, seed=0, buckets=1000 ):
+    if not 0 <= fraction <= 1:
+        raise ValueError( "training fraction must be in range 0..1" )
+    cut = round( fraction * buckets )
+    return (HashSampler( buckets, range( 0, cut ), seed ),
+            HashSampler( buckets, range( cut, buckets ), seed ))
+
+# RESERVOIR SAMPLER - Uniform random sample of a fixed number of entries
+#
+# Parameters:
+#    size - number of entries in the sample
+#    seed - seed of the random choices
+#
+# Each entry offered is kept with the payload given ('item', e.g. the raw
+# line), which is dropped again if a later entry takes its place.
+
+class ReservoirSampler:
+
+    streaming = False
+
+    def __init__( self, size, seed=0 ):
+        if size < 0:
+            raise ValueError( "sample size must not be negative" )
+        self.size = size
+        self.random = random.Random( seed )
+        self.seen = 0
+        self.kept = [ ]
+        self.counts = None
+
+    def offer( self, count, line, item=None ):
+        self.seen += 1
+        if len(self.kept) < self.size:
+            self.kept.append( (count, item) )
+        else:
+            ix = self.random.randrange( self.seen )
+            if ix < self.size:
+                self.kept[ix] = (count, item)
+        return False
+
+    # Picks, in file order, as list of (count, item)
+
+    def chosen( self ):
+        return sorted( self.kept, key=lambda kept: kept[0] )
+
+    def picks( self, count, line ):
+        return count in self.counts
+
+    # SCAN - Offer every entry of a data file, so 'picks' can be asked
+    #
+    # Only the entries up to 'stopAt' (None => all) with
+    # count % rate == skew are offered, as for pipeline.sampleTrips.
+
+    def scan( self, fileName, hasHead=True, stopAt=None, rate=1, skew=0 ):
+        with sources.openLines( fileName ) as source:
+            table = csv.reader( source )
+            if hasHead:
+                next( table, None )
+            for (count, line) in enumerate( table, 1 ):
+                if stopAt is not None and count > stopAt:
+                    break
+                if count % rate == skew:
+                    self.offer( count, line )
+        self.counts = set( count for (count, item) in self.chosen() )
+
+# STRATIFIED SAMPLER - Uniform random sample of each stratum
+#
+# Parameters:
+#    size - number of entries in the sample of each stratum
+#    by - label of Strata, or tuple of them
+#    seed - seed of the random choices
+#
+# Each stratum has a ReservoirSampler of its own, so memory is bounded by
+# size times the number of strata (at most 3 x 3 x 24 for all of them).
+
+class StratifiedSampler( ReservoirSampler ):
+
+    def __init__( self, size, by='CALL_TYPE', seed=0 ):
+        ReservoirSampler.__init__( self, size, seed )
+        self.by = (by,) if isinstance( by, str ) else tuple( by )
+        for label in self.by:
+            if label not in Strata:
+                raise ValueError( "unknown stratum: " + str(label) )
+        self.keys = [ Strata[label] for label in self.by ]
+        self.strata = { }
+
+    def offer( self, count, line, item=None ):
+        stratum = tuple( key( line ) for key in self.keys )
+        if stratum not in self.strata:
+            seed = self.random.random()
+            self.strata[stratum] = ReservoirSampler( self.size, seed )
+        return self.strata[stratum].offer( count, line, item )
+
+    def chosen( self ):
+        return sorted(( kept for sampler in self.strata.values() for kept in sampler.kept ),
+                      key=lambda kept: kept[0] )
+
+    # Number of entries seen and picked in each stratum
+
+    def report( self ):
+        print( "Strata by", ", ".join( self.by ) + ":" )
+        for (stratum, sampler) in sorted( self.strata.items() ):
+            print( "-", "/".join( str(key) for key in stratum ), ":",
+                   len(sampler.kept), "of", sampler.seen )
@@ -0,0 +1,254 @@
+# SERVE - Online destination prediction for trips in progress - Python
+#
+# A long-running local HTTP server that loads a built kNN model (see
+# knn.py) once, and answers requests of the form "this taxi started at
+# this time and has driven these waypoints so far; where is it going?".
+#
+# For each request the server computes the same snapshot features that
+# prepare writes for a snapshot at the last waypoint (start point, points
+# 3, 2 and 1 lag steps prior, current point, and the decodestamp time
+# features), and looks them up in the model. Requests that arrive close
+# together are answered by one batched query (micro-batching): a batch is
+# run as soon as it holds 'maxBatch' requests, or 'maxWait' seconds after
+# its first request came in.
+#
+# Requests:
+#     POST /predict - JSON body:
+#         { "timestamp": 1372636858,
+#           "polyline": "[[-8.618643,41.141412],[-8.618499,41.141376]]" }
+#         (polyline may also be a JSON list of [lon, lat] pairs)
+#       reply: { "lon": ..., "lat": ..., "lonError": ..., "latError": ...,
+#                "snapTime": minutes into the trip }
+#       or 400 with { "error": ... } for a bad request, 500 for a failed
+#       model query
+#     GET /stats - request count, batch count and p50/p99 latency (ms)
+#
+# Command use:
+#
+#     python src/serve.py model.pkl [--port 8136] [--k 30] [--delta 2.5]
+#
+# Sample use:
+#
+# >>> server = makeServer( knn.loadModel( 'model.pkl' ), port=8136 )
+# >>> server.serve_forever()
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import collections
+from math import floor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import illume
+import geoarray
+import knn
+
+# SNAPSHOT FEATURES - Features of a partial trip, as prepare computes them
+#
+# Parameters:
+#    stamp - TIMESTAMP of the start of the trip
+#    lon, lat - arrays of the waypoints driven so far
+#    wpStep - lag step in waypoints (prepare's 'delta' step times 4)
+#
+# Result:
+#    Dictionary of prepare column label => value, for the columns that are
+#    known before the trip is over. The snapshot is at the last waypoint.
+#    Values are rounded as prepare writes them, so a snapshot taken from a
+#    training trip gives exactly that trip's row.
+
+def snapshotFeatures( stamp, lon, lat, wpStep ):
+    ix = len(lon) - 1
+    timeinfo = illume.decodestamp( stamp )
+    features = {
+        'TIMESTAMP': float( timeinfo[0] ),
+        'WEEK_DAY': timeinfo[2],
+        'DAY_HOUR': round( timeinfo[4], 3 ),
+        'SNAP_TIME': ix/4 }
+    for (name, jx) in [ ('START', 0),
+                        ('3P', max( 0, ix-3*wpStep )),
+                        ('2P', max( 0, ix-2*wpStep )),
+                        ('1P', max( 0, ix-wpStep )),
+                        ('00', ix) ]:
+        features['LON_'+name] = round( float( lon[jx] ), 6 )
+        features['LAT_'+name] = round( float( lat[jx] ), 6 )
+    return features
+
+# LATENCY STATS - Bounded record of recent request latencies
+
+class LatencyStats:
+
+    def __init__( self, keep=100000 ):
+        self.lock = threading.Lock()
+        self.latencies = collections.deque( maxlen=keep )
+        self.requests = 0
+        self.batches = 0
+
+    def add( self, seconds ):
+        with self.lock:
+            self.latencies.append( seconds )
+            self.requests += 1
+
+    def report( self ):
+        with self.lock:
+            latencies = np.array( self.latencies )
+            report = { 'requests': self.requests, 'batches': self.batches }
+        if len(latencies) > 0:
+            report['p50'] = float( np.percentile( latencies, 50 )) * 1000
+            report['p99'] = float( np.percentile( latencies, 99 )) * 1000
+        return report
+
+# BATCHER - Collects requests and answers them in batched model queries
+#
+# 'predict' is called from each request thread; it queues the features
+# and waits for the batch thread to fill in the answer.
+
+class Batcher:
+
+    def __init__( self, model, k=30, maxBatch=64, maxWait=0.002, stats=None ):
+        self.model = model
+        self.k = k
+        self.maxBatch = maxBatch
+        self.maxWait = maxWait
+        self.stats = stats or LatencyStats()
+        self.waiting = queue.Queue()
+        self.thread = threading.Thread( target=self._loop, daemon=True )
+        self.thread.start()
+
+    def predict( self, features ):
+        done = threading.Event()
+        job = [ features, done, None ]
+        self.waiting.put( job )
+        done.wait()
+        if isinstance( job[2], Exception ):
+            raise job[2]
+        return job[2]
+
+    def _loop( self ):
+        while True:
+            batch = [ self.waiting.get() ]
+            deadline = time.perf_counter() + self.maxWait
+            while len(batch) < self.maxBatch:
+                left = deadline - time.perf_counter()
+                if left <= 0: break
+                try:
+                    batch.append( self.waiting.get( timeout=left ))
+                except queue.Empty:
+                    break
+            self._answer( batch )
+
+    def _answer( self, batch ):
+        try:
+            data = { label: np.array( [ job[0][label] for job in batch ])
+                    for label in self.model.columns }
+            result = self.model.trial( data, self.k )
+            for (job, row) in zip( batch, result.tolist() ):
+                job[2] = { 'lon': row[0], 'lat': row[1],
+                        'lonError': row[2], 'latError': row[3],
+                        'snapTime': job[0]['SNAP_TIME'] }
+        except Exception as error:
+            for job in batch:
+                job[2] = error
+        self.stats.batches += 1
+        for job in batch:
+            job[1].set()
+
+# MAKE SERVER - Build the HTTP server around a model
+#
+# Parameters:
+#    model - a knn.KnnModel built on prepare output
+#    host, port - where to listen
+#    k - number of neighbours
+#    delta - lag step in minutes, as the 'delta' step used in prepare
+#    maxBatch, maxWait - micro-batching limits
+
+def makeServer( model, host='127.0.0.1', port=8136, k=30, delta=2.5,
+                maxBatch=64, maxWait=0.002 ):
+    wpStep = floor( 4*delta )
+    batcher = Batcher( model, k, maxBatch, maxWait )
+
+    class Handler( BaseHTTPRequestHandler ):
+
+        def do_GET( self ):
+            if self.path == '/stats':
+                self._reply( 200, batcher.stats.report() )
+            else:
+                self._reply( 404, { 'error': 'not found' })
+
+        def do_POST( self ):
+            began = time.perf_counter()
+            if self.path != '/predict':
+                self._reply( 404, { 'error': 'not found' })
+                return
+            try:
+                body = json.loads( self.rfile.read(
+                        int( self.headers.get( 'Content-Length', 0 ))))
+                polyline = body['polyline']
+                if isinstance( polyline, str ):
+                    (lon, lat) = geoarray.polylineArrays( polyline, strict=True )
+                else:
+                    points = np.array( polyline, dtype=np.float64 )
+                    if len(points) == 0:
+                        points = points.reshape( 0, 2 )
+                    if points.ndim != 2 or points.shape[1] != 2:
+                        raise ValueError( "polyline must be a list of [lon, lat] pairs" )
+                    (lon, lat) = points[:,0], points[:,1]
+                if len(lon) == 0:
+                    raise ValueError( "polyline has no waypoints" )
+                if not (np.isfinite( lon ).all() and np.isfinite( lat ).all()):
+                    raise ValueError( "polyline has points that are not numbers" )
+                features = snapshotFeatures( body['timestamp'], lon, lat, wpStep )
+            except (ValueError, KeyError, TypeError) as error:
+                self._reply( 400, { 'error': str(error) })
+                return
+            # a batch that fails fails each of its requests, with its error
+            try:
+                answer = batcher.predict( features )
+            except Exception as error:
+                self._reply( 500, { 'error': str(error) })
+                return
+            self._reply( 200, answer )
+            batcher.stats.add( time.perf_counter() - began )
+
+        def _reply( self, status, answer ):
+            text = json.dumps( answer ).encode()
+            self.send_response( status )
+            self.send_header( 'Content-Type', 'application/json' )
+            self.send_header( 'Content-Length', str(len(text)) )
+            self.end_headers()
+            self.wfile.write( text )
+
+        def log_message( self, format, *args ):
+            pass
+
+    server = ThreadingHTTPServer( (host, port), Handler )
+    server.daemon_threads = True
+    server.batcher = batcher
+    return server
+
+# MAIN - Serve predictions from a saved model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Serve taxi destination predictions" )
+    parser.add_argument( 'model', help="model file written by knn.KnnModel.save" )
+    parser.add_argument( '--host', default='127.0.0.1' )
+    parser.add_argument( '--port', type=int, default=8136 )
+    parser.add_argument( '--k', type=int, default=30 )
+    parser.add_argument( '--delta', type=float, default=2.5,
+            help="lag step in minutes, as used in prepare" )
+    parser.add_argument( '--batch', type=int, default=64 )
+    parser.add_argument( '--wait', type=float, default=2.0,
+            help="longest wait to fill a batch, in milliseconds" )
+    args = parser.parse_args()
+    server = makeServer( knn.loadModel( args.model ), args.host, args.port,
+            args.k, args.delta, args.batch, args.wait/1000 )
+    print( "Serving on", "{:s}:{:d}".format( args.host, args.port ))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit( 0 )
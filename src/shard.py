@@ -0,0 +1,196 @@
+# SHARD - Run prepare over byte-range shards in a pool of processes - Python
+#
+# The taxi data file is split into byte ranges that start and end on
+# record boundaries, and each range (shard) is parsed, filtered and
+# flattened by illume.flattenTrip in its own process. The shard outputs
+# are then joined in file order, so the result is byte for byte the same
+# as a serial run of illume.prepare: same rows, same TRIP_ID numbering,
+# same 'excuses' counters and the same printed report.
+#
+# Main function:
+#     prepareSharded - parallel version of illume.prepare
+#
+# Notes:
+#     Records are taken to be single lines, as they are in the Porto data
+#     (the POLYLINE field is quoted but never holds a line break).
+#
+#     The job runs in two passes. The first pass counts the records in
+#     each shard, so that every shard knows the inCount of its first
+#     record; the second pass does the real work. Counting lines is cheap
+#     compared to parsing waypoints, so the first pass costs little.
+#
+# Sample use:
+#
+# >>> prepareSharded( 'train.csv', 'prepared.csv', workers=32 )
+
+import io
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import contextlib
+import multiprocessing
+
+import illume
+
+BLOCK = 1 << 24   # bytes read at a time when counting records
+
+# PREPARE SHARDED - Parallel version of illume.prepare
+#
+# Parameters:
+#    fileName, prepName, limit, sample, delta, hasHead, distance,
+#        parseErrors - as for illume.prepare
+#    sampler - streaming sampler of samplers.py (a HashSampler), or None;
+#        each process asks its own copy, as its picks need no coordination
+#    workers - number of processes, 0 or None => one per CPU core
+#    shardsPerWorker - number of shards per process; more shards keep the
+#        processes busy to the end of the run at little extra cost
+#
+# Result:
+#    Number of input entries processed, as for illume.prepare
+
+def prepareSharded( fileName, prepName,
+                    limit=0, sample=(0,1), delta=(2.5,2.5),
+                    hasHead=True, workers=0, shardsPerWorker=4,
+                    distance='precise', parseErrors=None, sampler=None ):
+    (sampleSkew, sampleRate, wpFreq, wpStep) = illume.prepareParams( sample, delta )
+    workers = workers or os.cpu_count() or 1
+
+    # Read the header, then cut the rest of the file into shards
+    labels = [ ]
+    with open( fileName, 'rb' ) as source:
+        if hasHead:
+            head = source.readline()
+            labels = next( csv.reader( [ head.decode() ] ), [ ] )
+        shards = shardBounds( source, source.tell(),
+                os.fstat( source.fileno() ).st_size, workers*shardsPerWorker )
+
+    stopAt = illume.prepareStop( limit, sampleRate )
+
+    partDir = tempfile.mkdtemp( prefix='prepare.',
+            dir=os.path.dirname( os.path.abspath( prepName )))
+    try:
+        with multiprocessing.Pool( workers ) as pool:
+
+            # First pass - number the records of each shard
+            counts = pool.starmap( countRecords,
+                    [ (fileName, start, end) for (start, end) in shards ])
+            firsts = [ 0 ]
+            for count in counts:
+                firsts.append( firsts[-1] + count )
+
+            # Second pass - flatten each shard into its own part file
+            jobs = [ ]
+            for (ix, (start, end)) in enumerate( shards ):
+                if stopAt is not None and firsts[ix] >= stopAt:
+                    break
+                jobs.append( (fileName, start, end, firsts[ix], labels,
+                        sampleSkew, sampleRate, wpFreq, wpStep, stopAt, distance,
+                        parseErrors is not None, sampler,
+                        os.path.join( partDir, '{:05d}.csv'.format( ix ))))
+
+            # Join the parts in file order as they come in
+            destiny = open( prepName, 'w' )
+            if hasHead and len(labels) > 0:
+                destiny.write( ",".join(illume.PrepareLabels)  )
+                destiny.write( "\n" )
+            destiny.flush()
+            excuses = [0] * 6
+            inCount = 0
+            outCount = 0
+            for (job, result) in zip( jobs, pool.imap( _flattenShard, jobs )):
+                (shardExcuses, shardOut, shardIn, shardPrint, shardErrors) = result
+                with open( job[-1], 'rb' ) as part:
+                    shutil.copyfileobj( part, destiny.buffer, BLOCK )
+                os.remove( job[-1] )
+                sys.stdout.write( shardPrint )
+                if parseErrors is not None:
+                    parseErrors.merge( shardErrors )
+                excuses = [ a+b for (a,b) in zip( excuses, shardExcuses ) ]
+                inCount += shardIn
+                outCount += shardOut
+            destiny.close()
+    finally:
+        shutil.rmtree( partDir, ignore_errors=True )
+
+    illume.printExcuses( inCount, excuses, outCount )
+    return inCount
+
+# SHARD BOUNDS - Cut a byte range of a file into shards on record boundaries
+#
+# Parameters:
+#    source - file opened in binary mode
+#    start, end - byte range to cut
+#    count - number of shards wanted
+#
+# Result:
+#    List of (start, end) byte ranges. There may be fewer than 'count'
+#    shards if the records are long compared to the shard size.
+
+def shardBounds( source, start, end, count ):
+    cuts = [ start ]
+    for ix in range( 1, count ):
+        cut = start + (end-start) * ix // count
+        if cut <= cuts[-1]:
+            continue
+        source.seek( cut-1 )
+        source.readline()   # move to the start of the next record
+        cut = min( source.tell(), end )
+        if cut > cuts[-1]:
+            cuts.append( cut )
+    if end > cuts[-1]:
+        cuts.append( end )
+    return list( zip( cuts[:-1], cuts[1:] ))
+
+# COUNT RECORDS - Count the records (lines) in a byte range of a file
+
+def countRecords( fileName, start, end ):
+    count = 0
+    last = b'\n'
+    with open( fileName, 'rb' ) as source:
+        source.seek( start )
+        while start < end:
+            block = source.read( min( BLOCK, end-start ))
+            if not block: break
+            count += block.count( b'\n' )
+            last = block[-1:]
+            start += len(block)
+    return count + (last != b'\n')
+
+# SHARD LINES - Generate the decoded lines of a byte range of a file
+
+def shardLines( fileName, start, end ):
+    with open( fileName, 'rb' ) as source:
+        source.seek( start )
+        while source.tell() < end:
+            line = source.readline()
+            if not line: break
+            yield line.decode()
+
+# Work done in each process of the pool: flatten the trips of one shard
+# into a part file, return (excuses, rows written, records read, printout,
+# parse errors or None).
+# The printout (progress and parse complaints) is held back so that the
+# parent can print it in file order.
+
+def _flattenShard( job ):
+    (fileName, start, end, inCount, labels,
+     sampleSkew, sampleRate, wpFreq, wpStep, stopAt, distance,
+     countErrors, sampler, partName) = job
+    excuses = [0] * 6
+    errors = illume.ParseErrors() if countErrors else None
+    outCount = 0
+    first = inCount
+    printout = io.StringIO()
+    with open( partName, 'w' ) as destiny, contextlib.redirect_stdout( printout ):
+        for line in csv.reader( shardLines( fileName, start, end )):
+            inCount += 1
+            if (inCount % sampleRate == sampleSkew
+            and (sampler is None or sampler.picks( inCount, line ))):
+                outCount += illume.flattenTrip( line, labels, inCount,
+                        wpFreq, wpStep, excuses, destiny, distance, errors )
+            if inCount == stopAt: break
+            if illume.isInteresting( inCount ):
+                print( "At", inCount )
+    return (excuses, outCount, inCount-first, printout.getvalue(), errors)
@@ -0,0 +1,139 @@
+# SNAPSHOTS - Multi-horizon snapshot engine for prepare - Python
+#
+# prepare takes a snapshot of a trip every wpFreq waypoints, with the
+# location at the snapshot and at exactly three lag steps before it
+# (LON_3P, LON_2P, LON_1P). Here the number of lags, the lag step, and a
+# few features derived from the segment distances and headings of the
+# waypoints are set by a Horizons object:
+#
+#     lags - number of lag points before each snapshot point
+#     step - lag step in waypoints; None => prepare's wpStep
+#     features - any of:
+#         CUM_DIST - metres driven up to the snapshot
+#         HEADING - heading of the last segment (as geodir) at the snapshot
+#         SPEED - km/h over the last 'window' waypoints before the snapshot
+#     window - waypoints over which SPEED is measured
+#
+# All the snapshots of a trip are taken at once: the array of waypoint
+# numbers is padded at the front with copies of 0 (so a lag back past the
+# start gives the first point, as in prepare), and a strided sliding
+# window view of it gives the waypoint number of every lag point of every
+# snapshot in one array, with no per-lag Python work. As in
+# illume.snapshotLines, each waypoint used is formatted only once, however
+# many rows and lags it appears in. Adding lags or features adds array
+# columns, not Python steps.
+#
+# Horizons() with no arguments gives prepare's own columns and rows, byte
+# for byte.
+#
+# Columns of a row, after the per-trip columns of illume.PrepareLabels:
+#     SNAP_TIME, LON_START, LAT_START, LON_<lags>P, LAT_<lags>P, ...,
+#     LON_1P, LAT_1P, LON_00, LAT_00, LON_FINISH, LAT_FINISH, features
+#
+# Sample use:
+#
+# >>> horizons = Horizons( lags=6, step=4, features=( 'CUM_DIST', 'SPEED' ))
+# >>> illume.prepare( 'train.csv', 'prepared.csv', horizons=horizons )
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import illume
+
+Features = ( 'CUM_DIST', 'HEADING', 'SPEED' )
+
+# Format of each feature in a CSV row
+FeatureFormats = { 'CUM_DIST': "{:.0f}", 'HEADING': "{:.1f}", 'SPEED': "{:.1f}" }
+
+# HORIZONS - Lags and features of the snapshots of prepare
+#
+# Methods:
+#    labels() - header labels of the rows
+#    tripSnapshots(waypoints, wpFreq, wpStep) - the snapshots of a trip
+#    snapshotLines(...) - the CSV rows of a trip, as illume.snapshotLines
+
+class Horizons:
+
+    def __init__( self, lags=3, step=None, features=(), window=4 ):
+        for feature in features:
+            if feature not in Features:
+                raise ValueError( "unknown snapshot feature: " + str(feature) )
+        if lags < 0 or (step is not None and step < 0) or window < 1:
+            raise ValueError( "lags and step must not be negative, window must be positive" )
+        self.lags = lags
+        self.step = step
+        self.features = tuple( features )
+        self.window = window
+
+    def labels( self ):
+        labels = illume.PrepareLabels[:12] + [ "LON_START", "LAT_START" ]
+        for lag in range( self.lags, 0, -1 ):
+            labels += [ "LON_{:d}P".format( lag ), "LAT_{:d}P".format( lag ) ]
+        return labels + [ "LON_00", "LAT_00", "LON_FINISH", "LAT_FINISH" ] + list( self.features )
+
+    # TRIP SNAPSHOTS - Every snapshot of one trip, as arrays
+    #
+    # Result:
+    #    Dictionary of:
+    #        snaps - int array of the waypoint number of each snapshot
+    #        index - m x (lags+1) int array of the waypoint numbers of the
+    #            lag points and the snapshot point of each snapshot, oldest
+    #            first
+    #        with points=True:
+    #        points - m x (lags+1) x 2 array of the (lon, lat) of those
+    #        start, finish - (lon, lat) of the first and last waypoints
+    #        each feature - array of the feature at each snapshot
+
+    def tripSnapshots( self, waypoints, wpFreq, wpStep, points=True ):
+        step = wpStep if self.step is None else self.step
+        snaps = np.arange( 0, len(waypoints), wpFreq )
+        reach = self.lags * step
+        if step > 0:
+            padded = np.concatenate(( np.zeros( reach, np.intp ), np.arange( len(waypoints) )))
+            # window ix holds waypoints ix-reach .. ix; take every step-th
+            index = sliding_window_view( padded, reach+1 )[snaps, ::step]
+        else:
+            index = np.repeat( snaps[:,None], self.lags+1, axis=1 )
+        result = { 'snaps': snaps, 'index': index }
+        if not points and not self.features:
+            return result
+        track = np.array( waypoints, dtype=np.float64 ).reshape( -1, 4 )
+        if points:
+            result.update( points=track[index,:2], start=track[0,:2], finish=track[-1,:2] )
+        if self.features:
+            driven = np.cumsum( track[:,2] )
+            if 'CUM_DIST' in self.features:
+                result['CUM_DIST'] = driven[snaps]
+            if 'HEADING' in self.features:
+                result['HEADING'] = track[snaps,3]
+            if 'SPEED' in self.features:
+                back = np.maximum( 0, snaps - self.window )
+                steps = snaps - back
+                metres = driven[snaps] - driven[back]
+                result['SPEED'] = np.divide( metres * 3.6, steps * 15.0,
+                        out=np.zeros( len(snaps) ), where=steps > 0 )
+        return result
+
+    # SNAPSHOT LINES - The CSV rows of one good trip
+    #
+    # Parameters and result as for illume.snapshotLines; each row has the
+    # columns of labels().
+
+    def snapshotLines( self, line, waypoints, tripId,
+                       drivedist, tripdist, triptime, wpFreq, wpStep, decode=None ):
+        prefix = illume.snapshotPrefix( line, tripId, drivedist, tripdist, triptime, decode )
+        if not waypoints:
+            return [ ]
+        snapshot = self.tripSnapshots( waypoints, wpFreq, wpStep, points=False )
+        index = snapshot['index'].tolist()
+        texts = { ix: "{:.6f},{:.6f}".format( waypoints[ix][0], waypoints[ix][1] )
+                  for ix in set( ix for row in index for ix in row ) }
+        start = "," + "{:.6f},{:.6f}".format( waypoints[0][0], waypoints[0][1] ) + ","
+        finish = "," + "{:.6f},{:.6f}".format( waypoints[-1][0], waypoints[-1][1] )
+        rows = [ prefix + str(ix/4) + start + ",".join( [ texts[jx] for jx in row ]) + finish
+                 for (ix, row) in zip( snapshot['snaps'].tolist(), index ) ]
+        if self.features:
+            form = "".join( "," + FeatureFormats[feature] for feature in self.features )
+            values = np.column_stack( [ snapshot[feature] for feature in self.features ]).tolist()
+            rows = [ row + form.format( *value ) for (row, value) in zip( rows, values ) ]
+        return [ row + "\n" for row in rows ]
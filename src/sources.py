@@ -0,0 +1,217 @@
+# SOURCES - Prefetching reader of plain and compressed data files - Python
+#
+# Kaggle ships train.csv zipped, and archives are kept as .gz, .bz2, .xz or
+# .zst files. Here a data file of any of these is read as its plain lines,
+# with no copy on disk: a background thread reads (and decompresses) the
+# file in large blocks, cuts each block at its last line break, splits it
+# into lines and puts the list of lines in a bounded queue. The main
+# thread takes whole lists of lines from the queue, so it waits on the
+# disk or the decompressor only when it is faster than both of them.
+# zlib, bz2, lzma and zstandard let other threads run while they
+# decompress, so on a machine with a spare core the decompression is
+# nearly free.
+#
+# The kind of file is told by its first bytes, not its name:
+#     gzip, bz2, xz - the stream of the file
+#     zip - the first file in the archive
+#     zstd - the stream of the file, if the zstandard package is installed
+#     anything else - the file as it is
+#
+# Byte offsets (pipeline checkpoints, progress) count bytes of the plain
+# lines, so a run over a compressed file resumes as one over its plain
+# copy would. A compressed file cannot be cut into byte ranges, so it
+# cannot be sharded or indexed (see shard.py, tripindex.py).
+#
+# Sample use:
+#
+# >>> for line in sources.openLines( 'train.csv.gz' ): ...
+# >>> illume.prepare( 'train.csv.zip', 'prepared.csv' )
+
+import io
+import os
+import bz2
+import gzip
+import lzma
+import queue
+import zipfile
+import threading
+
+BlockSize = 1 << 20   # bytes read at a time
+QueueDepth = 4        # blocks of lines read ahead
+
+# First bytes of each kind of compressed file
+Magics = [
+    ( b'\x1f\x8b', 'gzip' ),
+    ( b'BZh', 'bz2' ),
+    ( b'\xfd7zXZ\x00', 'xz' ),
+    ( b'PK\x03\x04', 'zip' ),
+    ( b'\x28\xb5\x2f\xfd', 'zstd' ) ]
+
+# COMPRESSION - Kind of compression of a file, None => a plain file
+
+def compression( fileName ):
+    with open( fileName, 'rb' ) as source:
+        head = source.read( 6 )
+    for (magic, kind) in Magics:
+        if head.startswith( magic ):
+            return kind
+    return None
+
+# OPEN BINARY - Open a data file as a binary stream of its plain bytes
+
+def openBinary( fileName ):
+    kind = compression( fileName )
+    if kind == 'gzip':
+        return gzip.open( fileName, 'rb' )
+    if kind == 'bz2':
+        return bz2.open( fileName, 'rb' )
+    if kind == 'xz':
+        return lzma.open( fileName, 'rb' )
+    if kind == 'zip':
+        archive = zipfile.ZipFile( fileName )
+        names = [ info.filename for info in archive.infolist() if not info.is_dir() ]
+        if not names:
+            raise ValueError( "zip archive holds no file: " + fileName )
+        return archive.open( names[0] )
+    if kind == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError( "reading zstd files needs the zstandard package" )
+        return zstandard.ZstdDecompressor().stream_reader( open( fileName, 'rb' ),
+                closefd=True )
+    return open( fileName, 'rb' )
+
+# SOURCE SIZE - Number of plain bytes of a data file, 0 => not known
+#
+# Known for plain files, zip archives and gzip files under 4 GB (gzip keeps
+# the size modulo 2**32 in its last four bytes).
+
+def sourceSize( fileName ):
+    kind = compression( fileName )
+    if kind is None:
+        return os.path.getsize( fileName )
+    if kind == 'zip':
+        with zipfile.ZipFile( fileName ) as archive:
+            sizes = [ info.file_size for info in archive.infolist() if not info.is_dir() ]
+        return sizes[0] if sizes else 0
+    if kind == 'gzip' and os.path.getsize( fileName ) < 1 << 32:
+        with open( fileName, 'rb' ) as source:
+            source.seek( -4, os.SEEK_END )
+            return int.from_bytes( source.read( 4 ), 'little' )
+    return 0
+
+# PREFETCH READER - Iterator of the lines of a data file, as bytes
+#
+# Parameters:
+#    fileName - name of plain or compressed data file
+#    offset - plain byte to start at; a compressed file is read up to it
+#    blockSize - bytes read at a time
+#    depth - number of blocks of lines the thread may read ahead
+#
+# Methods:
+#    blocks() - iterator of lists of lines, one per block
+#    iterating - the lines one at a time
+#    close() - stop the thread and close the file; also done at the end
+#        of the file, and by 'with'
+
+class PrefetchReader:
+
+    def __init__( self, fileName, offset=0, blockSize=BlockSize, depth=QueueDepth ):
+        self.source = openBinary( fileName )
+        if offset:
+            if compression( fileName ) is None:
+                self.source.seek( offset )
+            else:
+                while offset > 0:
+                    skipped = len(self.source.read( min( offset, blockSize )))
+                    if skipped == 0: break
+                    offset -= skipped
+        self.blockSize = blockSize
+        self.queue = queue.Queue( depth )
+        self.stopped = threading.Event()
+        self.thread = threading.Thread( target=self._read, daemon=True )
+        self.thread.start()
+
+    def blocks( self ):
+        while True:
+            lines = self.queue.get()
+            if lines is None:
+                self.close()
+                return
+            if isinstance( lines, BaseException ):
+                self.close()
+                raise lines
+            yield lines
+
+    def __iter__( self ):
+        for lines in self.blocks():
+            yield from lines
+
+    def close( self ):
+        self.stopped.set()
+        # make room, in case the thread waits to put a block
+        while self.thread.is_alive():
+            try:
+                self.queue.get( timeout=0.1 )
+            except queue.Empty:
+                pass
+        self.source.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exception ):
+        self.close()
+
+    # The work of the thread: read, cut and split blocks until the end
+
+    def _read( self ):
+        try:
+            rest = b''
+            while not self.stopped.is_set():
+                block = self.source.read( self.blockSize )
+                if not block:
+                    if rest:
+                        self.queue.put( [ rest ] )
+                    break
+                cut = block.rfind( b'\n' ) + 1
+                if cut == 0:
+                    rest += block
+                    continue
+                lines = io.BytesIO( rest + block[:cut] ).readlines()
+                rest = block[cut:]
+                self.queue.put( lines )
+            self.queue.put( None )
+        except BaseException as error:
+            self.queue.put( error )
+
+# OPEN LINES - Iterator of the lines of a data file, as text
+#
+# A plain file is opened as it always was, as a text file; a compressed one
+# is read by a PrefetchReader. Either can be closed with 'close', or by
+# 'with'.
+
+def openLines( fileName ):
+    if compression( fileName ) is None:
+        return open( fileName, 'r' )
+    return TextLines( PrefetchReader( fileName ))
+
+class TextLines:
+
+    def __init__( self, reader ):
+        self.reader = reader
+
+    def __iter__( self ):
+        for lines in self.reader.blocks():
+            for line in lines:
+                yield line.decode()
+
+    def close( self ):
+        self.reader.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exception ):
+        self.close()
@@ -0,0 +1,56 @@
+# TIMEARRAY - Batched timestamp decoding for Porto taxi-trip data - Python
+#
+# Array version of illume.decodestamp: a whole array of TIMESTAMPs is
+# decoded with NumPy integer arithmetic, with no datetime objects and no
+# per-trip Python calls. Same 4 AM day rollover, weekday numbering and
+# holiday list (illume.PortugalHolidays) as decodestamp.
+#
+# Main function:
+#     decodestampArray - decode an array of Unix timestamps
+#
+# Sample use:
+#
+# >>> numstamp, weekday, daytype, dayhour = decodestampArray( store.TIMESTAMP )
+
+import numpy as np
+
+import illume
+
+# DECODE STAMP ARRAY - Decode an array of Unix timestamps
+#
+# Parameter:
+#    stamps - array (or list) of Unix timestamps, as numbers or digit strings
+#
+# Result:
+#    Tuple of four arrays, one entry per stamp, matching elements 1..4
+#    of the result of illume.decodestamp:
+#        numeric stamp - int64, date as a number of form YYYYMMDD
+#        weekday - int64, as numbered by decodestamp
+#        day type - str, "WD", "WE" or "HOL"
+#        time of day - float64, in hours from 4.0 up to 28.0
+
+def decodestampArray( stamps ):
+    secs = np.asarray( stamps ).astype( np.int64 )
+    (day, daysecs) = np.divmod( secs, 86400 )
+    dayhour = daysecs//3600 + (daysecs//60 % 60)/60 + (daysecs % 60)/3600
+    early = dayhour < 4
+    dayhour[early] += 24
+    day[early] -= 1
+
+    # Same whole-number calendar arithmetic as illume.calendarDay
+    weekday = (day + 3) % 7
+    era = (day + 719468) // 146097
+    dayOfEra = day + 719468 - era*146097
+    yearOfEra = (dayOfEra - dayOfEra//1460 + dayOfEra//36524
+                 - dayOfEra//146096) // 365
+    dayOfYear = dayOfEra - (365*yearOfEra + yearOfEra//4 - yearOfEra//100)
+    monthIx = (5*dayOfYear + 2) // 153
+    mday = dayOfYear - (153*monthIx + 2)//5 + 1
+    month = np.where( monthIx < 10, monthIx + 3, monthIx - 9 )
+    year = yearOfEra + era*400 + (month <= 2)
+    numstamp = year*10000 + month*100 + mday
+
+    daytype = np.full( len(secs), 'WD', dtype='<U3' )
+    daytype[ np.isin( numstamp, illume.PortugalHolidays ) ] = 'HOL'
+    daytype[ (weekday == 0) | (weekday == 6) ] = 'WE'
+    return numstamp, weekday, daytype, dayhour
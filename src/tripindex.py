@@ -0,0 +1,236 @@
+# TRIPINDEX - Random-access index of a taxi-trip data file - Python
+#
+# illume and rawsample read the data file from the top to reach entry
+# 'start'. The trip index is a sidecar file that records where each entry
+# starts, so that they can seek straight to it. It also has sorted lookup
+# tables from TRIP_ID and TAXI_ID to entry numbers.
+#
+# Main functions:
+#     loadIndex - load the index of a data file, building it if needed
+#     buildIndex - read a data file and write its index
+#     TripIndex - an index loaded in memory
+#     illumeIndexed - indexed version of illume.illume
+#     rawsampleIndexed - indexed version of illume.rawsample
+#
+# The index of 'train.csv' is kept in 'train.csv.index.npz'. It holds the
+# size and modification time of the data file, and is rebuilt whenever
+# either of them changes.
+#
+# Entries are numbered as in illume: the first row after the header is
+# entry 1. Records are taken to be single lines, as in the Porto data.
+#
+# Sample use:
+#
+# >>> illume.illume( 'D:/CKME 136/Taxi/train.csv', tripId='1372636858620000589' )
+# >>> illume.illume( 'D:/CKME 136/Taxi/train.csv', 5, 1500000, indexed=True )
+
+import os
+import csv
+
+import numpy as np
+
+import illume
+import sources
+
+SUFFIX = '.index.npz'
+
+# LOAD INDEX - Load the index of a data file, building it if it is stale
+#
+# Parameters:
+#    fileName - name of the taxi data file
+#    hasHead - True => the data file has a header row
+#
+# Result:
+#    A TripIndex
+
+def loadIndex( fileName, hasHead=True ):
+    indexName = fileName + SUFFIX
+    stat = os.stat( fileName )
+    try:
+        with np.load( indexName ) as saved:
+            arrays = { name: saved[name] for name in saved.files }
+        if (arrays['sourceSize'] == stat.st_size
+        and arrays['sourceTime'] == stat.st_mtime
+        and arrays['hasHead'] == hasHead):
+            return TripIndex( arrays )
+    except (OSError, ValueError, KeyError):
+        pass
+    return TripIndex( buildIndex( fileName, hasHead ))
+
+# BUILD INDEX - Read a data file and write its index
+#
+# Result:
+#    Dictionary of the index arrays, as saved:
+#        offsets - int64, byte offset of each entry, plus the end of file;
+#            entry n (from 1) runs from offsets[n-1] to offsets[n]
+#        tripIds, tripEntries - TRIP_IDs in sorted order, and their entries
+#        taxiIds, taxiEntries - TAXI_IDs in sorted order, and their entries
+#            (all the entries of one taxi are together, in file order)
+#        sourceSize, sourceTime, hasHead - what the index was built from
+
+def buildIndex( fileName, hasHead=True ):
+    offsets = [ ]
+    tripIds = [ ]
+    taxiIds = [ ]
+    if sources.compression( fileName ):
+        raise ValueError( "cannot index a compressed file: " + fileName )
+    with open( fileName, 'rb' ) as source:
+        columns = (0, 4)
+        if hasHead:
+            labels = next( csv.reader( [ source.readline().decode() ] ), [ ] )
+            if 'TRIP_ID' in labels and 'TAXI_ID' in labels:
+                columns = (labels.index( 'TRIP_ID' ), labels.index( 'TAXI_ID' ))
+        reach = max( columns ) + 1
+        where = source.tell()
+        for line in source:
+            fields = line.split( b',', reach )
+            offsets.append( where )
+            tripIds.append( fields[columns[0]].strip( b'"' ) if len(fields) > columns[0] else b'' )
+            taxiIds.append( fields[columns[1]].strip( b'"' ) if len(fields) > columns[1] else b'' )
+            where += len(line)
+        offsets.append( where )
+    tripIds = np.array( tripIds, dtype=bytes )
+    taxiIds = np.array( taxiIds, dtype=bytes )
+    tripOrder = np.argsort( tripIds, kind='stable' )
+    taxiOrder = np.argsort( taxiIds, kind='stable' )
+    stat = os.stat( fileName )
+    arrays = {
+        'offsets': np.array( offsets, dtype=np.int64 ),
+        'tripIds': tripIds[tripOrder],
+        'tripEntries': (tripOrder + 1).astype( np.int64 ),
+        'taxiIds': taxiIds[taxiOrder],
+        'taxiEntries': (taxiOrder + 1).astype( np.int64 ),
+        'sourceSize': np.int64( stat.st_size ),
+        'sourceTime': np.float64( stat.st_mtime ),
+        'hasHead': np.bool_( hasHead ) }
+    with open( fileName + SUFFIX, 'wb' ) as out:
+        np.savez( out, **arrays )
+    return arrays
+
+# TRIP INDEX - An index loaded in memory
+#
+# Methods:
+#    len(index) - number of entries in the data file
+#    offset(entry) - byte offset of an entry (numbered from 1)
+#    tripEntry(tripId) - entry number of a TRIP_ID, or None
+#    taxiEntries(taxiId) - array of the entry numbers of a TAXI_ID
+#
+# Lookups by id are binary searches, O(log n).
+
+class TripIndex:
+
+    def __init__( self, arrays ):
+        self.offsets = arrays['offsets']
+        self.tripIds = arrays['tripIds']
+        self.tripEntries = arrays['tripEntries']
+        self.taxiIds = arrays['taxiIds']
+        self.taxiEntries_ = arrays['taxiEntries']
+
+    def __len__( self ):
+        return len(self.offsets) - 1
+
+    def offset( self, entry ):
+        return int( self.offsets[entry-1] )
+
+    def tripEntry( self, tripId ):
+        key = _key( tripId )
+        ix = np.searchsorted( self.tripIds, key )
+        if ix < len(self.tripIds) and self.tripIds[ix] == key:
+            return int( self.tripEntries[ix] )
+        return None
+
+    def taxiEntries( self, taxiId ):
+        key = _key( taxiId )
+        first = np.searchsorted( self.taxiIds, key, side='left' )
+        last = np.searchsorted( self.taxiIds, key, side='right' )
+        return self.taxiEntries_[first:last]
+
+# READ ENTRIES - Generate the text lines of the given entries of a data file
+
+def readEntries( fileName, index, entries ):
+    with open( fileName, 'rb' ) as source:
+        for entry in entries:
+            source.seek( index.offset( entry ))
+            yield entry, source.readline().decode()
+
+# ILLUME INDEXED - Indexed version of illume.illume
+#
+# Parameters are as for illume.illume. The entries are picked by number
+# from the index and read by seeking, so the entries before 'start' are
+# never read. The result is the number of the last entry printed.
+
+def illumeIndexed( filename, limit=10, start=0, sample=1, hasHead=True,
+                   tripId=None, taxiId=None ):
+    index = loadIndex( filename, hasHead )
+    sample = max( 1, sample )
+    if tripId is not None:
+        entry = index.tripEntry( tripId )
+        entries = [ entry ] if entry is not None else [ ]
+    elif taxiId is not None:
+        entries = index.taxiEntries( taxiId ).tolist()
+        if limit != 0:
+            entries = entries[:limit]
+    elif limit != 0:
+        finis = min( start + sample*limit, len(index)+1 )
+        entries = range( max( 1, start ), finis )
+        entries = [ entry for entry in entries if (entry-start)%sample == 0 ]
+    else:
+        entries = _interesting( len(index) )
+
+    labels = [ ]
+    labelwidth = 3
+    if hasHead:
+        with open( filename, 'r' ) as source:
+            labels = next( csv.reader( source ), [ ] )
+        labelwidth = max( [ 3 ] + [ len(label) for label in labels ] )
+    count = 0
+    for (count, text) in readEntries( filename, index, entries ):
+        line = next( csv.reader( [ text ] ), [ ] )
+        illume.printTrip( count, labels, line, labelwidth )
+    if count > 0:
+        print( "_" * (labelwidth+2) )
+    return count
+
+# RAW SAMPLE INDEXED - Indexed version of illume.rawsample
+#
+# Parameters are as for illume.rawsample. Records are counted from 0 here,
+# as in rawsample. The result is the count rawsample would return.
+
+def rawsampleIndexed( filename, samplename, limit=10, start=0, hasHead=True ):
+    index = loadIndex( filename, hasHead )
+    total = len(index)
+    if limit != 0:
+        entries = range( start+1, min( start+limit, total ) + 1 )
+        count = min( start+limit, total )
+    else:
+        entries = [ entry+1 for entry in [ 0 ] + _interesting( total-1 ) ]
+        entries = [ entry for entry in entries if entry <= total ]
+        count = total
+    with open( samplename, 'w' ) as sample:
+        if hasHead:
+            with open( filename, 'r' ) as source:
+                sample.write( source.readline() )
+        for (entry, text) in readEntries( filename, index, entries ):
+            sample.write( text.replace( '\r\n', '\n' ))
+    return count
+
+# Helpers.
+#
+# _key turns an id (number, str or bytes) into the bytes kept in the index.
+# _interesting lists the numbers from 1 to 'last' picked by isInteresting;
+# there are only two per power of two, so this is quick.
+
+def _key( value ):
+    if isinstance( value, bytes ):
+        return value
+    return str( value ).encode()
+
+def _interesting( last ):
+    nums = [ ]
+    power = 1
+    while power <= last:
+        for num in sorted( { power, power + (power >> 1) } ):
+            if num <= last and illume.isInteresting( num ):
+                nums.append( num )
+        power <<= 1
+    return nums
@@ -0,0 +1,206 @@
+# TRIPSTATE - Incremental trip state for a live feed of taxi pings - Python
+#
+# prepare and summarize see a trip only when it is over, as a POLYLINE,
+# and work out its distances and outlier checks from the whole list of
+# waypoints. Here a trip is built up one GPS ping (15 seconds) at a time:
+# each ping updates the running totals in O(1), and only the last few
+# points are kept, in a ring buffer just big enough for the snapshot lags
+# of prepare. So thousands of taxis can be followed at once without
+# keeping or rebuilding their waypoint lists.
+#
+# Main classes:
+#     TripState - one trip in progress
+#     TaxiTracker - the trips in progress of many taxis, by TAXI_ID
+#
+# The numbers match those of parseWaypoints and judgeWaypoints for the
+# same points exactly: pings are taken in the same order, with the same
+# distance and heading formulas and the same rules for (0,0) points.
+#
+# Sample use:
+#
+# >>> tracker = TaxiTracker( wpStep=10 )
+# >>> tracker.begin( 20000589, '1372636858620000589', 1372636858 )
+# >>> tracker.ping( 20000589, -8.618643, 41.141412 )
+# >>> tracker.ping( 20000589, -8.618499, 41.141376 )
+# >>> tracker[20000589].excuse()
+# >>> trip = tracker.end( 20000589 )
+
+import illume
+
+# TRIP STATE - One trip in progress
+#
+# Parameters:
+#    tripId, stamp - TRIP_ID and TIMESTAMP of the trip
+#    missing - True if the source flags the trip as having missing data
+#    keep - number of recent waypoints kept; 3*wpStep+1 covers every lag
+#        of a prepare snapshot
+#
+# Attributes:
+#    count - number of waypoints so far
+#    drivedist - distance driven so far, in metres
+#    maxdist - longest 15-second segment so far, in metres
+#    first, last - first and latest waypoints, as (lon, lat, dist, heading)
+
+class TripState:
+
+    __slots__ = ( 'tripId', 'stamp', 'missing', 'count', 'drivedist',
+                  'maxdist', 'first', 'last', '_recent' )
+
+    def __init__( self, tripId=None, stamp=None, missing=False, keep=31 ):
+        self.tripId = tripId
+        self.stamp = stamp
+        self.missing = missing
+        self.count = 0
+        self.drivedist = 0
+        self.maxdist = None
+        self.first = None
+        self.last = None
+        self._recent = [ None ] * max( 1, keep )
+
+    # PING - Add the next waypoint of the trip
+    #
+    # The distance and heading are from the last point, as in
+    # parseWaypoints, and are 0 if the last point was (0,0).
+    # Result: the waypoint added, as (lon, lat, dist, heading)
+
+    def ping( self, longi, lati ):
+        last = self.last
+        if last is not None and last[0] != 0 and last[1] != 0:
+            waypoint = (longi, lati,
+                    illume.geodist( longi, lati, last[0], last[1] ),
+                    illume.geodir( longi, lati, last[0], last[1] ))
+        else:
+            waypoint = (longi, lati, 0, 0)
+        if self.first is None:
+            self.first = waypoint
+        self._recent[ self.count % len(self._recent) ] = waypoint
+        self.count += 1
+        self.last = waypoint
+        self.drivedist += waypoint[2]
+        if self.maxdist is None or waypoint[2] > self.maxdist:
+            self.maxdist = waypoint[2]
+        return waypoint
+
+    # LAG - The waypoint 'steps' pings before the latest one
+    #
+    # As in prepare, a lag back past the start of the trip gives the
+    # first waypoint. Lags longer than the ring buffer raise IndexError.
+
+    def lag( self, steps ):
+        ix = self.count - 1 - steps
+        if ix <= 0:
+            return self.first
+        if steps >= len(self._recent):
+            raise IndexError( "lag longer than the points kept" )
+        return self._recent[ ix % len(self._recent) ]
+
+    # Totals of judgeWaypoints, for the trip so far
+
+    def triptime( self ):
+        return 0.25 * max( 0, self.count-1 )
+
+    def tripdist( self ):
+        if self.count == 0:
+            return 0
+        return illume.geodist( self.first[0], self.first[1],
+                self.last[0], self.last[1] )
+
+    def maxspeed( self ):
+        # km/h over the fastest 15-second segment
+        return 0 if self.maxdist is None else self.maxdist * 3.6/15
+
+    # EXCUSE - Outlier check of judgeWaypoints for the trip so far
+    #
+    # Result: 0 if the trip is good so far, else the excuse number of
+    # judgeWaypoints (1 to 5)
+
+    def excuse( self ):
+        triptime = self.triptime()
+        if triptime < 0.5:
+            return 1
+        elif self.tripdist() < 30:
+            return 2
+        elif self.drivedist / triptime < 5:
+            return 3
+        elif self.maxdist > 625:
+            return 4
+        elif self.missing:
+            return 5
+        return 0
+
+    # JUDGE - Same result as illume.judgeWaypoints for the trip so far
+
+    def judge( self ):
+        return (self.excuse(), self.drivedist, self.tripdist(), self.triptime())
+
+    # SNAPSHOT - Points of a prepare snapshot taken at the latest ping
+    #
+    # Result: list of the waypoints at the start, 3, 2 and 1 lag steps
+    # prior, and now (the LON/LAT _START, _3P, _2P, _1P and _00 columns)
+
+    def snapshot( self, wpStep ):
+        return [ self.first, self.lag( 3*wpStep ), self.lag( 2*wpStep ),
+                 self.lag( wpStep ), self.last ]
+
+# TAXI TRACKER - The trips in progress of many taxis
+#
+# Parameters:
+#    wpStep - lag step in waypoints, as in prepare; sets the ring size
+#
+# A taxi has at most one trip in progress. Pings for a taxi with no
+# trip in progress start one with no TRIP_ID.
+
+class TaxiTracker:
+
+    def __init__( self, wpStep=10 ):
+        self.keep = 3*wpStep + 1
+        self.trips = { }
+
+    def __len__( self ):
+        return len(self.trips)
+
+    def __contains__( self, taxiId ):
+        return taxiId in self.trips
+
+    def __getitem__( self, taxiId ):
+        return self.trips[taxiId]
+
+    # BEGIN - Start a new trip for a taxi
+    # Result: the trip the taxi had in progress, or None
+
+    def begin( self, taxiId, tripId=None, stamp=None, missing=False ):
+        ended = self.trips.get( taxiId )
+        self.trips[taxiId] = TripState( tripId, stamp, missing, self.keep )
+        return ended
+
+    # PING - Add a waypoint to a taxi's trip
+    # Result: the trip, as a TripState
+
+    def ping( self, taxiId, longi, lati ):
+        trip = self.trips.get( taxiId )
+        if trip is None:
+            trip = self.trips[taxiId] = TripState( keep=self.keep )
+        trip.ping( longi, lati )
+        return trip
+
+    # END - Finish a taxi's trip
+    # Result: the trip, or None if it had none in progress
+
+    def end( self, taxiId ):
+        return self.trips.pop( taxiId, None )
+
+# FEED TRIPS - Replay the trips of a taxi data file as a live feed
+#
+# Each trip is begun, pinged one waypoint at a time, and ended; the
+# tracker's trips are yielded as they end, with the line they came from.
+# Meant for checking and timing the tracker against prepare.
+
+def feedTrips( table, labels, tracker ):
+    for line in table:
+        fields = dict( zip( labels, line ))
+        taxiId = fields['TAXI_ID']
+        tracker.begin( taxiId, fields['TRIP_ID'], fields['TIMESTAMP'],
+                fields['MISSING_DATA'][0:1] == 'T' )
+        for (longi, lati, _, _) in illume.parseWaypoints( fields['POLYLINE'] ):
+            tracker.ping( taxiId, longi, lati )
+        yield line, tracker.end( taxiId )
@@ -0,0 +1,286 @@
+# TRIPSTORE - Compact binary columnar store of taxi trips - Python
+#
+# Parsing train.csv, and above all its POLYLINE text, is the slow part of
+# every run. The store holds the same data in binary form, so it is
+# parsed once by 'ingest' and then read back through numpy.memmap in
+# seconds by every later run.
+#
+# Main functions:
+#     ingest - read a taxi data file (CSV) and write a trip store
+#     ensureStore - ingest only if the store is missing or out of date
+#     TripStore - open a trip store for reading
+#     prepare - same as illume.prepare, reading a trip store
+#     summarize - same as illume.summarize, reading a trip store
+#
+# A store is a directory holding one raw binary file per column and a
+# 'store.json' file that describes them:
+#     TRIP_ID.bin - uint64, one per trip
+#     CALL_TYPE.bin - 1-byte text, A/B/C
+#     ORIGIN_CALL.bin - int32, -1 where the source field is empty
+#     ORIGIN_STAND.bin - int32, -1 where the source field is empty
+#     TAXI_ID.bin - int32
+#     TIMESTAMP.bin - int64, Unix time
+#     DAY_TYPE.bin - 1-byte text, A/B/C
+#     MISSING_DATA.bin - bool
+#     OFFSETS.bin - int64, one more than the trips; the waypoints of trip
+#         ix are entries OFFSETS[ix] up to OFFSETS[ix+1] of LON and LAT
+#     LON.bin, LAT.bin - float64 (or float32), the waypoints of all trips
+#
+# Sample use:
+#
+# >>> ingest( 'D:/CKME 136/Taxi/train.csv', 'D:/CKME 136/Taxi/train.store' )
+# >>> prepare( 'D:/CKME 136/Taxi/train.store', 'prepared.csv' )
+
+import os
+import csv
+import json
+
+import numpy as np
+
+import illume
+import sources
+import geoarray
+
+META = 'store.json'
+
+# Columns of per-trip metadata: name, data type, empty-field value
+TripColumns = [
+    ('TRIP_ID', 'u8', None),
+    ('CALL_TYPE', 'S1', b''),
+    ('ORIGIN_CALL', 'i4', -1),
+    ('ORIGIN_STAND', 'i4', -1),
+    ('TAXI_ID', 'i4', None),
+    ('TIMESTAMP', 'i8', None),
+    ('DAY_TYPE', 'S1', b''),
+    ('MISSING_DATA', '?', None) ]
+
+PortoLabels = [ name for (name, kind, empty) in TripColumns ] + [ 'POLYLINE' ]
+
+# INGEST - Read a taxi data file and write a trip store
+#
+# Parameters:
+#    fileName - name of input file of taxi data (CSV, Porto format)
+#    storeName - name of directory to receive the store
+#    hasHead - True => input file has a header row naming the columns;
+#        False => columns are in the standard Porto order
+#    coords - 'float64' keeps coordinates exactly as parsed;
+#        'float32' halves the waypoint size, with errors under 0.1 metre
+#    chunkSize - number of trips converted at a time
+#
+# Result:
+#    Number of trips written to the store
+#
+# The integer columns must hold plain whole numbers, so that writing them
+# back as text gives the source text again; otherwise ingest raises
+# ValueError rather than store a field it would later print differently.
+
+def ingest( fileName, storeName, hasHead=True, coords='float64', chunkSize=20000 ):
+    coordType = np.dtype( coords )
+    if coordType not in (np.float32, np.float64):
+        raise ValueError( "Coordinates must be float32 or float64" )
+    os.makedirs( storeName, exist_ok=True )
+    outs = { name: open( os.path.join( storeName, name+'.bin' ), 'wb' )
+            for name in PortoLabels[:-1] + [ 'OFFSETS', 'LON', 'LAT' ] }
+    outs['OFFSETS'].write( np.zeros( 1, dtype=np.int64 ).tobytes() )
+    trips = points = 0
+    with sources.openLines( fileName ) as source:
+        table = csv.reader( source )
+        labels = next( table, [ ] ) if hasHead else PortoLabels
+        columns = [ labels.index( name ) for name in PortoLabels ]
+        chunk = [ ]
+        for line in table:
+            chunk.append( line )
+            if len(chunk) >= chunkSize:
+                points = _writeChunk( chunk, columns, coordType, points, outs )
+                trips += len(chunk)
+                chunk = [ ]
+        if chunk:
+            points = _writeChunk( chunk, columns, coordType, points, outs )
+            trips += len(chunk)
+    for out in outs.values():
+        out.close()
+
+    # Describe the store last, so that a broken ingest leaves no valid store
+    stat = os.stat( fileName )
+    meta = {
+        'source': os.path.abspath( fileName ),
+        'sourceSize': stat.st_size,
+        'sourceTime': stat.st_mtime,
+        'trips': trips,
+        'points': points,
+        'coords': coordType.name,
+        'columns': { name: kind for (name, kind, empty) in TripColumns } }
+    with open( os.path.join( storeName, META ), 'w' ) as out:
+        json.dump( meta, out, indent=1 )
+    return trips
+
+# ENSURE STORE - Ingest a taxi data file unless its store is up to date
+#
+# The store is up to date if it was made from a file of the same size and
+# modification time as 'fileName'.
+#
+# Result:
+#    The opened TripStore
+
+def ensureStore( fileName, storeName, hasHead=True, coords='float64' ):
+    try:
+        with open( os.path.join( storeName, META ), 'r' ) as source:
+            meta = json.load( source )
+        stat = os.stat( fileName )
+        fresh = (meta['sourceSize'] == stat.st_size
+                and meta['sourceTime'] == stat.st_mtime
+                and meta['coords'] == coords)
+    except (OSError, ValueError, KeyError):
+        fresh = False
+    if not fresh:
+        ingest( fileName, storeName, hasHead=hasHead, coords=coords )
+    return TripStore( storeName )
+
+# TRIP STORE - An open trip store
+#
+# Each column is a read-only numpy.memmap, available as an attribute of
+# the same name: store.TAXI_ID, store.OFFSETS, store.LON, etc.
+#
+# Methods:
+#    len(store) - number of trips
+#    line(ix) - list of the text fields of trip ix, as read from the CSV
+#        (without POLYLINE)
+#    lines(start, stop) - same as 'line' for a range of trips, faster
+#    lonlat(ix) - longitude and latitude arrays of trip ix
+#    waypoints(ix) - list of waypoint tuples, as from illume.parseWaypoints
+
+class TripStore:
+
+    def __init__( self, storeName ):
+        with open( os.path.join( storeName, META ), 'r' ) as source:
+            self.meta = json.load( source )
+        self.name = storeName
+        self.trips = self.meta['trips']
+        for (name, kind) in self.meta['columns'].items():
+            setattr( self, name, self._column( name, kind, self.trips ))
+        self.OFFSETS = self._column( 'OFFSETS', 'i8', self.trips+1 )
+        self.LON = self._column( 'LON', self.meta['coords'], self.meta['points'] )
+        self.LAT = self._column( 'LAT', self.meta['coords'], self.meta['points'] )
+
+    def __len__( self ):
+        return self.trips
+
+    def line( self, ix ):
+        return self.lines( ix, ix+1 )[0]
+
+    def lines( self, start, stop ):
+        columns = [ ]
+        for (name, kind, empty) in TripColumns:
+            values = getattr( self, name )[start:stop].tolist()
+            if kind == 'S1':
+                values = [ value.decode() for value in values ]
+            elif empty is not None:
+                values = [ '' if value == empty else str(value) for value in values ]
+            else:
+                values = [ str(value) for value in values ]
+            columns.append( values )
+        return [ list(fields) for fields in zip( *columns ) ]
+
+    def lonlat( self, ix ):
+        (first, last) = self.OFFSETS[ix:ix+2]
+        return (np.asarray( self.LON[first:last], dtype=np.float64 ),
+                np.asarray( self.LAT[first:last], dtype=np.float64 ))
+
+    def waypoints( self, ix ):
+        (lon, lat) = self.lonlat( ix )
+        (distance, heading) = geoarray.segmentArrays( lon, lat )
+        return list( zip( lon.tolist(), lat.tolist(),
+                distance.tolist(), heading.tolist() ))
+
+    def _column( self, name, kind, count ):
+        fileName = os.path.join( self.name, name+'.bin' )
+        if count == 0:
+            return np.zeros( 0, dtype=kind )
+        return np.memmap( fileName, dtype=kind, mode='r', shape=(count,) )
+
+# PREPARE - Same as illume.prepare, reading a trip store instead of a CSV file
+#
+# Parameters:
+#    storeName - name of a trip store made by 'ingest'
+#    others - as for illume.prepare (the store always has a header)
+#
+# The output matches illume.prepare on the source file, except that a
+# distance can differ in the last bit where NumPy rounds a cosine
+# differently (see geoarray.py), and float32 stores round coordinates.
+
+def prepare( storeName, prepName, limit=0, sample=(0,1), delta=(2.5,2.5),
+             chunkSize=10000 ):
+    (sampleSkew, sampleRate, wpFreq, wpStep) = illume.prepareParams( sample, delta )
+    store = TripStore( storeName )
+    destiny = open( prepName, 'w' )
+    destiny.write( ",".join(illume.PrepareLabels)  )
+    destiny.write( "\n" )
+    excuses = [0] * 6
+    inCount = 0
+    outCount = 0
+    for (ix, line) in _storeLines( store, chunkSize ):
+        inCount += 1
+        if inCount % sampleRate == sampleSkew:
+            outCount += illume.flattenWaypoints( line, store.waypoints( ix ),
+                    inCount, wpFreq, wpStep, excuses, destiny )
+        if inCount/sampleRate == limit: break
+        if illume.isInteresting( inCount ):
+            print( "At", inCount )
+    destiny.close()
+    illume.printExcuses( inCount, excuses, outCount )
+    return inCount
+
+# SUMMARIZE - Same as illume.summarize, reading a trip store instead of a CSV file
+
+def summarize( storeName, summName, limit=0, sample=1, chunkSize=10000 ):
+    store = TripStore( storeName )
+    summary = open( summName, 'w' )
+    summary.write( ",".join( PortoLabels[:-1] + [ "DRIVE_DIST", "TRIP_DIST", "TRIP_TIME" ]))
+    summary.write( "\n" )
+    count = 0
+    for (ix, line) in _storeLines( store, chunkSize ):
+        count += 1
+        if count % sample == 0:
+            illume.summarizeWaypoints( line, store.waypoints( ix ), summary )
+        if count == limit: break
+        if illume.isInteresting( count ):
+            print( "At", count )
+    summary.close()
+    print( "End at", count )
+    return count
+
+# Helpers for ingest and the readers.
+#
+# _writeChunk appends one chunk of CSV rows to the column files and
+# returns the new total of waypoints. _storeLines generates (index, text
+# fields) for every trip of a store, converting a chunk at a time.
+
+def _writeChunk( chunk, columns, coordType, points, outs ):
+    for (jx, (name, kind, empty)) in enumerate( TripColumns ):
+        texts = [ line[columns[jx]] for line in chunk ]
+        if kind == 'S1':
+            values = np.array( [ text.encode() for text in texts ], dtype='S1' )
+            if any( len(text) > 1 for text in texts ):
+                raise ValueError( "Cannot store {:s} longer than 1 character".format( name ))
+        elif kind == '?':
+            values = np.array( [ text == 'True' for text in texts ], dtype=bool )
+            if any( text not in ('True', 'False') for text in texts ):
+                raise ValueError( "Cannot store {:s} other than True/False".format( name ))
+        else:
+            values = np.array( [ empty if text == '' and empty is not None
+                    else int(text) for text in texts ], dtype=kind )
+            if any( str(value) != text for (value, text) in zip( values.tolist(), texts )
+                    if text != '' or empty is None ):
+                raise ValueError( "Cannot store {:s} that is not a plain number".format( name ))
+        outs[name].write( values.tobytes() )
+    (lon, lat, offsets) = geoarray.polylineChunk( [ line[columns[-1]] for line in chunk ])
+    outs['OFFSETS'].write( (offsets[1:] + points).tobytes() )
+    outs['LON'].write( lon.astype( coordType ).tobytes() )
+    outs['LAT'].write( lat.astype( coordType ).tobytes() )
+    return points + int(offsets[-1])
+
+def _storeLines( store, chunkSize ):
+    for start in range( 0, len(store), chunkSize ):
+        stop = min( start+chunkSize, len(store) )
+        for (ix, line) in enumerate( store.lines( start, stop ), start ):
+            yield ix, line
@@ -0,0 +1,366 @@
+# WRITERS - Columnar output formats for prepare - Python
+#
+# prepare writes its snapshot rows as CSV text, with six lon/lat pairs at
+# six decimals in each row. This module adds columnar formats for the
+# same rows, which a reader can load (or memory-map) without parsing:
+#
+#     csv - the CSV text file of illume.prepare (written by pipeline.Branch)
+#     npy - a directory holding one .npy file per column, plus
+#         'columns.json' with the labels and category names; each column
+#         can be memory-mapped with numpy.load( ..., mmap_mode='r' )
+#     npz - the same .npy files in one uncompressed .npz archive
+#     parquet - an Apache Parquet file, one row group per chunk of trips;
+#         needs pyarrow, which is not required by the rest of illume
+#
+# The columns have the labels of illume.PrepareLabels and these types:
+#     TRIP_ID, TIMESTAMP - int64
+#     ORIGIN_CALL, TAXI_ID - int64, -1 when blank or not a number
+#     CALL_TYPE, DAY_BUSY - int8 codes of Categories, -1 when unknown
+#     WEEK_DAY - int8
+#     DAY_HOUR, DRIVE_DIST, TRIP_DIST, TRIP_TIME, SNAP_TIME - float32,
+#         not rounded as they are in the CSV
+#     LON_*, LAT_* - float32, within 2e-6 degrees (about 0.2 m) of the
+#         parsed waypoint
+#
+# In the Parquet file, CALL_TYPE and DAY_BUSY are dictionary-encoded text
+# columns, so other tools see the category names.
+#
+# From R (as in example.knn.run.R), the parquet file can be read with
+# arrow::read_parquet, and each .npy column with RcppCNPy::npyLoad.
+#
+# Size and load time, for prepare of a 20,000-trip synthetic data file at
+# the default delta (98,493 rows; see bench/bench_formats.py):
+#
+#     format      size     load all columns
+#     csv       17.9 MB    1.29 s  (csv module, converted to numbers)
+#     npy       10.1 MB    0.004 s (memory-mapped, every column read once)
+#     npz       10.2 MB    0.010 s
+#
+# A row takes 103 bytes in the columnar formats, against about 181 in the
+# CSV, and loading the columns does no text parsing at all.
+#
+# Main functions:
+#     ColumnBranch - pipeline branch that writes prepare rows as columns
+#     loadColumns - load the columns of a file in any columnar format
+#
+# Sample use:
+#
+# >>> illume.prepare( 'train.csv', 'prepared', format='npy' )
+# >>> columns = loadColumns( 'prepared' )
+# >>> columns['LON_00'][:5]
+
+import os
+import json
+import shutil
+import zipfile
+
+import numpy as np
+
+import illume
+import pipeline
+
+Formats = ( 'csv', 'npy', 'npz', 'parquet' )
+
+# Names of the codes of the categorical columns
+Categories = {
+    'CALL_TYPE': ( 'A', 'B', 'C' ),
+    'DAY_BUSY': ( 'WD', 'WE', 'HOL' ) }
+
+# Type of each column, in the order of illume.PrepareLabels
+ColumnTypes = dict( [
+    ( 'TRIP_ID', np.int64 ), ( 'CALL_TYPE', np.int8 ),
+    ( 'ORIGIN_CALL', np.int64 ), ( 'TAXI_ID', np.int64 ),
+    ( 'TIMESTAMP', np.int64 ), ( 'WEEK_DAY', np.int8 ),
+    ( 'DAY_BUSY', np.int8 ), ( 'DAY_HOUR', np.float32 ),
+    ( 'DRIVE_DIST', np.float32 ), ( 'TRIP_DIST', np.float32 ),
+    ( 'TRIP_TIME', np.float32 ), ( 'SNAP_TIME', np.float32 ) ] +
+    [ ( label, np.float32 ) for label in illume.PrepareLabels[12:] ] )
+
+# Columns that hold the same value in every row of a trip
+TripLabels = list( ColumnTypes )[:11]
+
+# Types of the columns of a list of labels; the columns of the features of
+# snapshots.Horizons (and any other column not in ColumnTypes) are float32
+
+def columnTypes( labels ):
+    return { label: ColumnTypes.get( label, np.float32 ) for label in labels }
+
+# COLUMN BRANCH - Pipeline branch that writes prepare rows as columns
+#
+# Parameters:
+#    fileName - name of the output file (a directory for 'npy')
+#    format - one of Formats other than 'csv'
+#    stages - function of an iterable of trips giving the good trips to
+#        write, judged by pipeline.judgeTrips
+#    wpFreq, wpStep - snapshot spacing, as from illume.prepareParams
+#    stopAt, report, counters - as for pipeline.Branch
+#    horizons - snapshots.Horizons of the lags and features of the rows;
+#        None => those of prepare
+#
+# The columns are streamed to the writer a chunk of trips at a time, so
+# memory use does not grow with the file. A columnar run cannot be
+# checkpointed.
+
+class ColumnBranch( pipeline.Branch ):
+
+    resumable = False
+
+    def __init__( self, fileName, format, stages, wpFreq, wpStep,
+                  stopAt=None, report=None, counters=None, horizons=None ):
+        pipeline.Branch.__init__( self, fileName, None, stages, stopAt, report, counters )
+        if format not in Writers:
+            raise ValueError( "unknown output format: " + str(format) )
+        self.format = format
+        self.wpFreq = wpFreq
+        self.wpStep = wpStep
+        self.horizons = horizons
+        self.writer = None
+
+    def begin( self, labels ):
+        labels = self.horizons.labels() if self.horizons else list( ColumnTypes )
+        self.writer = Writers[self.format]( self.fileName, labels )
+
+    def feed( self, trips ):
+        columns = snapshotColumns( list( self.stages( trips )), self.wpFreq, self.wpStep,
+                self.horizons )
+        if len(columns['TRIP_ID']) > 0:
+            self.writer.write( columns )
+            self.rows += len(columns['TRIP_ID'])
+
+    def end( self, count ):
+        self.writer.close()
+        self.writer = None
+        if self.stopAt is not None:
+            count = min( count, self.stopAt )
+        if self.report:
+            self.report( count, self.rows )
+
+# SNAPSHOT COLUMNS - The snapshot rows of good trips, as column arrays
+#
+# Parameters:
+#    trips - list of good pipeline.Trip, judged by pipeline.judgeTrips
+#    wpFreq, wpStep - snapshot spacing, as from illume.prepareParams
+#    horizons - snapshots.Horizons, None => the columns of prepare
+#
+# Result:
+#    Dictionary of label => array, with the rows of illume.snapshotLines
+#    (or of horizons.snapshotLines)
+
+def snapshotColumns( trips, wpFreq, wpStep, horizons=None ):
+    types = columnTypes( horizons.labels() if horizons else ColumnTypes )
+    if not trips:
+        return { label: np.zeros( 0, types[label] ) for label in types }
+    fields = { label: [ ] for label in TripLabels }
+    snaps = [ ]
+    sizes = [ ]
+    points = [ ]
+    for trip in trips:
+        waypoints = trip.waypoints
+        line = trip.line
+        timeinfo = trip.calls.decodestamp( line[5] )
+        fields['TRIP_ID'].append( trip.count )
+        fields['CALL_TYPE'].append( _code( 'CALL_TYPE', line[1] ))
+        fields['ORIGIN_CALL'].append( _number( line[2] ))
+        fields['TAXI_ID'].append( _number( line[4] ))
+        fields['TIMESTAMP'].append( int( line[5] ))
+        fields['WEEK_DAY'].append( timeinfo[2] )
+        fields['DAY_BUSY'].append( _code( 'DAY_BUSY', timeinfo[3] ))
+        fields['DAY_HOUR'].append( timeinfo[4] )
+        fields['DRIVE_DIST'].append( trip.drivedist )
+        fields['TRIP_DIST'].append( trip.tripdist )
+        fields['TRIP_TIME'].append( trip.triptime )
+        snaps.append( np.arange( 0, len(waypoints), wpFreq ))
+        sizes.append( len(waypoints) )
+        points.extend( (here[0], here[1]) for here in waypoints )
+
+    # Per-trip fields, repeated for each snapshot row of the trip
+    counts = np.array( [ len(snap) for snap in snaps ], dtype=np.int64 )
+    columns = { label: np.repeat( np.array( fields[label], dtype=ColumnTypes[label] ), counts )
+                for label in TripLabels }
+
+    if horizons:
+        return _horizonColumns( trips, wpFreq, wpStep, horizons, columns, snaps )
+
+    # Waypoint columns, taken from one array of all the trips' points
+    points = np.array( points, dtype=np.float64 ).reshape( -1, 2 )
+    snap = np.concatenate( snaps )
+    sizes = np.array( sizes, dtype=np.int64 )
+    first = np.repeat( np.cumsum( sizes ) - sizes, counts )
+    last = first + np.repeat( sizes, counts ) - 1
+    columns['SNAP_TIME'] = (snap / 4).astype( np.float32 )
+    for (name, index) in (
+            ( 'START', first ),
+            ( '3P', first + np.maximum( 0, snap-3*wpStep )),
+            ( '2P', first + np.maximum( 0, snap-2*wpStep )),
+            ( '1P', first + np.maximum( 0, snap-wpStep )),
+            ( '00', first + snap ),
+            ( 'FINISH', last )):
+        columns['LON_'+name] = points[index,0].astype( np.float32 )
+        columns['LAT_'+name] = points[index,1].astype( np.float32 )
+    return columns
+
+# Waypoint and feature columns of snapshots.Horizons, one trip at a time
+
+def _horizonColumns( trips, wpFreq, wpStep, horizons, columns, snaps ):
+    taken = [ horizons.tripSnapshots( trip.waypoints, wpFreq, wpStep ) for trip in trips ]
+    counts = [ len(snap) for snap in snaps ]
+    columns['SNAP_TIME'] = (np.concatenate( snaps ) / 4).astype( np.float32 )
+    points = np.concatenate( [ snapshot['points'] for snapshot in taken ])
+    ends = [ ( 'START', 'start' ), ( 'FINISH', 'finish' ) ]
+    for (name, key) in ends:
+        both = np.repeat( np.array( [ snapshot[key] for snapshot in taken ]), counts, axis=0 )
+        columns['LON_'+name] = both[:,0].astype( np.float32 )
+        columns['LAT_'+name] = both[:,1].astype( np.float32 )
+    names = [ "{:d}P".format( lag ) for lag in range( horizons.lags, 0, -1 )] + [ '00' ]
+    for (ix, name) in enumerate( names ):
+        columns['LON_'+name] = points[:,ix,0].astype( np.float32 )
+        columns['LAT_'+name] = points[:,ix,1].astype( np.float32 )
+    for feature in horizons.features:
+        columns[feature] = np.concatenate(
+                [ snapshot[feature] for snapshot in taken ]).astype( np.float32 )
+    return columns
+
+# NPY WRITER - Write columns as a directory of .npy files
+#
+# Parameters:
+#    fileName - name of the directory
+#    labels - labels of the columns, typed by columnTypes
+#
+# Each column is streamed to a raw file while the run goes on; 'close'
+# puts a .npy header on each one, once the number of rows is known.
+
+class NpyWriter:
+
+    def __init__( self, fileName, labels=ColumnTypes ):
+        self.fileName = fileName
+        self.types = columnTypes( labels )
+        os.makedirs( fileName, exist_ok=True )
+        self.rows = 0
+        self.parts = { label: open( self._path( label ) + '.part', 'wb' )
+                       for label in self.types }
+
+    def write( self, columns ):
+        for (label, part) in self.parts.items():
+            part.write( columns[label].astype( self.types[label], copy=False ).tobytes() )
+        self.rows += len(columns['TRIP_ID'])
+
+    def close( self ):
+        for (label, part) in self.parts.items():
+            part.close()
+            with open( self._path( label ), 'wb' ) as out:
+                np.lib.format.write_array_header_1_0( out, {
+                        'descr': np.lib.format.dtype_to_descr( np.dtype( self.types[label] )),
+                        'fortran_order': False, 'shape': (self.rows,) })
+                with open( part.name, 'rb' ) as source:
+                    shutil.copyfileobj( source, out, pipeline.WriteBuffer )
+            os.remove( part.name )
+        with open( os.path.join( self.fileName, 'columns.json' ), 'w' ) as out:
+            json.dump( { 'labels': list( self.types ), 'rows': self.rows,
+                         'categories': Categories }, out, indent=1 )
+
+    def _path( self, label ):
+        return os.path.join( self.fileName, label + '.npy' )
+
+# NPZ WRITER - Write columns as one uncompressed .npz archive
+#
+# The columns are written as for NpyWriter, to a work directory beside
+# the archive, then stored in the archive.
+
+class NpzWriter( NpyWriter ):
+
+    def __init__( self, fileName, labels=ColumnTypes ):
+        self.archive = fileName
+        NpyWriter.__init__( self, fileName + '.parts', labels )
+
+    def close( self ):
+        NpyWriter.close( self )
+        with zipfile.ZipFile( self.archive, 'w', zipfile.ZIP_STORED, allowZip64=True ) as out:
+            for label in self.types:
+                out.write( self._path( label ), label + '.npy' )
+            out.write( os.path.join( self.fileName, 'columns.json' ), 'columns.json' )
+        shutil.rmtree( self.fileName )
+
+# PARQUET WRITER - Write columns as a Parquet file, if pyarrow is installed
+
+class ParquetWriter:
+
+    def __init__( self, fileName, labels=ColumnTypes ):
+        self.types = columnTypes( labels )
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError( "the parquet format needs pyarrow, which is not installed" )
+        self.pyarrow = pyarrow
+        fields = [ ]
+        for (label, kind) in self.types.items():
+            if label in Categories:
+                fields.append( pyarrow.field( label,
+                        pyarrow.dictionary( pyarrow.int8(), pyarrow.string() )))
+            else:
+                fields.append( pyarrow.field( label, pyarrow.from_numpy_dtype( kind )))
+        self.schema = pyarrow.schema( fields )
+        self.destiny = pyarrow.parquet.ParquetWriter( fileName, self.schema )
+
+    def write( self, columns ):
+        pyarrow = self.pyarrow
+        arrays = [ ]
+        for label in self.types:
+            if label in Categories:
+                arrays.append( pyarrow.DictionaryArray.from_arrays(
+                        pyarrow.array( columns[label], mask=columns[label] < 0 ),
+                        pyarrow.array( Categories[label] )))
+            else:
+                arrays.append( pyarrow.array( columns[label] ))
+        self.destiny.write_table( pyarrow.Table.from_arrays( arrays, schema=self.schema ))
+
+    def close( self ):
+        self.destiny.close()
+
+Writers = { 'npy': NpyWriter, 'npz': NpzWriter, 'parquet': ParquetWriter }
+
+# LOAD COLUMNS - Load the columns of a prepare file in a columnar format
+#
+# Parameters:
+#    fileName - name of the file (or directory, for 'npy')
+#    mmap - True => memory-map the columns of an 'npy' directory
+#
+# Result:
+#    Dictionary of label => array; the categorical columns are codes, with
+#    names as in Categories
+
+def loadColumns( fileName, mmap=True ):
+    if os.path.isdir( fileName ):
+        mode = 'r' if mmap else None
+        with open( os.path.join( fileName, 'columns.json' ), 'r' ) as source:
+            labels = json.load( source )['labels']
+        return { label: np.load( os.path.join( fileName, label + '.npy' ), mmap_mode=mode )
+                 for label in labels }
+    if zipfile.is_zipfile( fileName ):
+        with np.load( fileName ) as saved:
+            labels = json.loads( saved.zip.read( 'columns.json' ))['labels']
+            return { label: saved[label] for label in labels }
+    import pyarrow.parquet
+    table = pyarrow.parquet.read_table( fileName )
+    columns = { }
+    types = columnTypes( table.column_names )
+    for label in types:
+        column = table.column( label ).combine_chunks()
+        if label in Categories:
+            column = column.indices.fill_null( -1 )
+        columns[label] = column.to_numpy( zero_copy_only=False ).astype( types[label] )
+    return columns
+
+# Code of a category name, -1 if unknown
+
+def _code( label, name ):
+    names = Categories[label]
+    return names.index( name ) if name in names else -1
+
+# Number in a text field, -1 if blank or not a number
+
+def _number( text ):
+    try:
+        return int( text )
+    except ValueError:
+        return -1